@@ -0,0 +1,102 @@
+"""baseline schema
+
+Revision ID: 0001
+Revises: None
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('email', sa.String(length=256), nullable=False),
+        sa.Column('hashed_password', sa.String(length=256), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=True),
+        sa.Column('is_verified', sa.Boolean(), nullable=True),
+        sa.Column('encrypted_dek', sa.String(length=512), nullable=False),
+        sa.Column('password_reset_token_id', sa.String(length=512), nullable=True),
+        sa.Column('password_reset_requested_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_table(
+        'totp_items',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('issuer', sa.String(length=128), nullable=False),
+        sa.Column('account', sa.String(length=128), nullable=False),
+        sa.Column('encrypted_secret', sa.Text(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_totp_items_id'), 'totp_items', ['id'], unique=False)
+    op.create_table(
+        'shared_totp',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('totp_item_id', sa.Integer(), nullable=False),
+        sa.Column('shared_with_user_id', sa.Integer(), nullable=False),
+        sa.Column('encrypted_secret', sa.Text(), nullable=False),
+        sa.ForeignKeyConstraint(['shared_with_user_id'], ['users.id']),
+        sa.ForeignKeyConstraint(['totp_item_id'], ['totp_items.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_shared_totp_id'), 'shared_totp', ['id'], unique=False)
+    op.create_table(
+        'sessions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.String(length=36), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('refresh_token_hash', sa.String(length=128), nullable=False),
+        sa.Column('refresh_token_expires_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('last_used_at', sa.DateTime(), nullable=False),
+        sa.Column('ip', sa.String(length=45), nullable=True),
+        sa.Column('user_agent', sa.String(length=256), nullable=True),
+        sa.Column('revoked_at', sa.DateTime(), nullable=True),
+        sa.Column('replaced_by_session_id', sa.String(length=36), nullable=True),
+        sa.Column('parent_session_id', sa.String(length=36), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sessions_id'), 'sessions', ['id'], unique=False)
+    op.create_index(op.f('ix_sessions_session_id'), 'sessions', ['session_id'], unique=True)
+    op.create_index('ix_sessions_user_active', 'sessions', ['user_id', 'revoked_at'], unique=False)
+    op.create_table(
+        'api_keys',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('key_hash', sa.String(length=128), nullable=False),
+        sa.Column('name', sa.String(length=128), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('last_used_at', sa.DateTime(), nullable=True),
+        sa.Column('revoked_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_api_keys_id'), 'api_keys', ['id'], unique=False)
+    op.create_index(op.f('ix_api_keys_key_hash'), 'api_keys', ['key_hash'], unique=True)
+    op.create_index('ix_api_keys_user_active', 'api_keys', ['user_id', 'revoked_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('api_keys')
+    op.drop_table('sessions')
+    op.drop_table('shared_totp')
+    op.drop_table('totp_items')
+    op.drop_table('users')
@@ -0,0 +1,33 @@
+"""per-item algorithm, digits and period
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('totp_items', sa.Column('algorithm', sa.String(length=16), nullable=False, server_default='SHA1'))
+    op.add_column('totp_items', sa.Column('digits', sa.Integer(), nullable=False, server_default='6'))
+    op.add_column('totp_items', sa.Column('period', sa.Integer(), nullable=False, server_default='30'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('totp_items') as batch_op:
+        batch_op.drop_column('period')
+        batch_op.drop_column('digits')
+        batch_op.drop_column('algorithm')
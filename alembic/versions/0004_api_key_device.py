@@ -0,0 +1,31 @@
+"""device public keys on api keys
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('api_keys', sa.Column('device_public_key', sa.String(length=64), nullable=True))
+    op.add_column('api_keys', sa.Column('device_registered_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('api_keys') as batch_op:
+        batch_op.drop_column('device_registered_at')
+        batch_op.drop_column('device_public_key')
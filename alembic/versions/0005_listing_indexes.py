@@ -0,0 +1,35 @@
+"""listing indexes
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_totp_items_user_issuer_account', 'totp_items',
+                    ['user_id', 'issuer', 'account', 'id'], unique=False)
+    op.create_index('ix_totp_items_user_account_issuer', 'totp_items',
+                    ['user_id', 'account', 'issuer', 'id'], unique=False)
+    op.create_index('ix_shared_totp_recipient_item', 'shared_totp',
+                    ['shared_with_user_id', 'totp_item_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_shared_totp_recipient_item', table_name='shared_totp')
+    op.drop_index('ix_totp_items_user_account_issuer', table_name='totp_items')
+    op.drop_index('ix_totp_items_user_issuer_account', table_name='totp_items')
@@ -0,0 +1,35 @@
+"""unique share per item and recipient
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, Sequence[str], None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keep the oldest of any duplicate shares the old check-then-insert path let through
+    op.execute(
+        "DELETE FROM shared_totp WHERE id NOT IN ("
+        "SELECT id FROM (SELECT MIN(id) AS id FROM shared_totp GROUP BY totp_item_id, shared_with_user_id) AS keep)"
+    )
+    with op.batch_alter_table('shared_totp') as batch_op:
+        batch_op.create_unique_constraint('uq_shared_totp_item_recipient', ['totp_item_id', 'shared_with_user_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('shared_totp') as batch_op:
+        batch_op.drop_constraint('uq_shared_totp_item_recipient', type_='unique')
@@ -0,0 +1,67 @@
+"""groups
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, Sequence[str], None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'groups',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=128), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_groups_id'), 'groups', ['id'], unique=False)
+    op.create_table(
+        'group_members',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('encrypted_group_key', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('group_id', 'user_id', name='uq_group_members_group_user')
+    )
+    op.create_index(op.f('ix_group_members_id'), 'group_members', ['id'], unique=False)
+    op.create_index('ix_group_members_user_group', 'group_members', ['user_id', 'group_id'], unique=False)
+    op.create_table(
+        'group_totp',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('totp_item_id', sa.Integer(), nullable=False),
+        sa.Column('encrypted_secret', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id']),
+        sa.ForeignKeyConstraint(['totp_item_id'], ['totp_items.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('group_id', 'totp_item_id', name='uq_group_totp_group_item')
+    )
+    op.create_index(op.f('ix_group_totp_id'), 'group_totp', ['id'], unique=False)
+    op.create_index('ix_group_totp_item', 'group_totp', ['totp_item_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('group_totp')
+    op.drop_table('group_members')
+    op.drop_table('groups')
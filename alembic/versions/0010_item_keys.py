@@ -0,0 +1,45 @@
+"""per-item keys
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, Sequence[str], None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('totp_items', sa.Column('encrypted_item_key', sa.Text(), nullable=True))
+    for table in ('shared_totp', 'group_totp'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('encrypted_item_key', sa.Text(), nullable=True))
+            batch_op.alter_column('encrypted_secret', existing_type=sa.Text(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Secrets under an item key and shares holding only a wrapped item key cannot be read by the old code
+    keyed = op.get_bind().execute(sa.text(
+        "SELECT (SELECT COUNT(*) FROM totp_items WHERE encrypted_item_key IS NOT NULL)"
+        " + (SELECT COUNT(*) FROM shared_totp WHERE encrypted_secret IS NULL)"
+        " + (SELECT COUNT(*) FROM group_totp WHERE encrypted_secret IS NULL)"
+    ))
+    if keyed.scalar():
+        raise RuntimeError("Items or shares already use per-item keys; they cannot be downgraded")
+    for table in ('group_totp', 'shared_totp'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('encrypted_secret', existing_type=sa.Text(), nullable=False)
+            batch_op.drop_column('encrypted_item_key')
+    with op.batch_alter_table('totp_items') as batch_op:
+        batch_op.drop_column('encrypted_item_key')
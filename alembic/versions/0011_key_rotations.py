@@ -0,0 +1,48 @@
+"""key rotation checkpoints
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011'
+down_revision: Union[str, Sequence[str], None] = '0010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('previous_encrypted_dek', sa.String(length=512), nullable=True))
+    op.create_table(
+        'key_rotations',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('target', sa.String(length=64), nullable=True),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.Column('rows_scanned', sa.Integer(), nullable=False),
+        sa.Column('rows_rotated', sa.Integer(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_key_rotations_id'), 'key_rotations', ['id'], unique=False)
+    op.create_index('ix_key_rotations_kind_status', 'key_rotations', ['kind', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('key_rotations')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('previous_encrypted_dek')
@@ -0,0 +1,36 @@
+"""binary secret envelope
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012'
+down_revision: Union[str, Sequence[str], None] = '0011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('totp_items') as batch_op:
+        batch_op.add_column(sa.Column('secret_blob', sa.VARBINARY(length=512), nullable=True))
+        batch_op.alter_column('encrypted_secret', existing_type=sa.Text(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Rows stored only as a binary envelope cannot be represented in the old schema
+    blob_only = op.get_bind().execute(sa.text("SELECT COUNT(*) FROM totp_items WHERE encrypted_secret IS NULL"))
+    if blob_only.scalar():
+        raise RuntimeError("totp_items holds secrets stored only in secret_blob; they cannot be downgraded")
+    with op.batch_alter_table('totp_items') as batch_op:
+        batch_op.alter_column('encrypted_secret', existing_type=sa.Text(), nullable=False)
+        batch_op.drop_column('secret_blob')
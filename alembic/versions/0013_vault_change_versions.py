@@ -0,0 +1,36 @@
+"""per-user vault change versions
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0013'
+down_revision: Union[str, Sequence[str], None] = '0012'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing entries have no version; cursors issued on them get a full resync
+    op.execute(sa.text("DELETE FROM vault_changes"))
+    with op.batch_alter_table('vault_changes') as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False))
+        batch_op.create_index('ix_vault_changes_user_version', ['user_id', 'version'], unique=False)
+        batch_op.drop_index('ix_vault_changes_user_cursor')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('vault_changes') as batch_op:
+        batch_op.create_index('ix_vault_changes_user_cursor', ['user_id', 'id'], unique=False)
+        batch_op.drop_index('ix_vault_changes_user_version')
+        batch_op.drop_column('version')
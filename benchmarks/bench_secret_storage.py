@@ -0,0 +1,61 @@
+"""
+Compare the Fernet text token against the binary AES-GCM envelope for item secrets:
+decrypt throughput with cipher objects reused per item key, and stored row size.
+
+Run from the repository root:
+    python -m benchmarks.bench_secret_storage
+"""
+import base64
+import os
+import time
+
+from services.item_keys import ItemKey, new_item_key
+
+SIZES = (1_000, 100_000)
+# Distinct item keys per run; cipher objects are built once per key, as ItemKeyCache does
+KEYS = 1_000
+
+
+def make_secrets(count: int) -> list[bytes]:
+    return [base64.b32encode(os.urandom(20)).rstrip(b"=") for _ in range(count)]
+
+
+def bench_fernet(keys: list[ItemKey], tokens: list[str]) -> float:
+    started = time.perf_counter()
+    for i, token in enumerate(tokens):
+        keys[i % len(keys)].decrypt(token.encode())
+    return time.perf_counter() - started
+
+
+def bench_envelope(keys: list[ItemKey], blobs: list[bytes]) -> float:
+    started = time.perf_counter()
+    for i, blob in enumerate(blobs):
+        keys[i % len(keys)].open(blob)
+    return time.perf_counter() - started
+
+
+def main():
+    keys = [ItemKey(new_item_key()) for _ in range(KEYS)]
+    secrets = make_secrets(max(SIZES))
+    tokens = [keys[i % KEYS].fernet.encrypt(secret).decode() for i, secret in enumerate(secrets)]
+    blobs = [keys[i % KEYS].seal(secret) for i, secret in enumerate(secrets)]
+    assert all(keys[i % KEYS].open(blob) == secret for i, (blob, secret) in enumerate(zip(blobs, secrets)))
+
+    raw = sum(map(len, secrets)) / len(secrets)
+    token_size = sum(len(token.encode()) for token in tokens) / len(tokens)
+    blob_size = sum(map(len, blobs)) / len(blobs)
+    print(f"stored size per {raw:.0f}-byte secret: fernet text {token_size:.0f} B ({token_size / raw:.1f}x), "
+          f"aes-gcm binary {blob_size:.0f} B ({blob_size / raw:.1f}x)")
+
+    print(f"{'items':>8} {'fernet':>12} {'aes-gcm':>12} {'fernet/s':>12} {'aes-gcm/s':>12} {'speedup':>8}")
+    for size in SIZES:
+        fernet_time = bench_fernet(keys, tokens[:size])
+        envelope_time = bench_envelope(keys, blobs[:size])
+        print(
+            f"{size:>8} {fernet_time * 1000:>10.2f}ms {envelope_time * 1000:>10.2f}ms "
+            f"{size / fernet_time:>12.0f} {size / envelope_time:>12.0f} {fernet_time / envelope_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
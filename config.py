@@ -1,7 +1,7 @@
 import os
 import base64
 from dotenv import load_dotenv
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from fastapi.templating import Jinja2Templates
@@ -14,6 +14,8 @@ load_dotenv()
 class Settings:
     DATABASE_URL: str = os.getenv("DATABASE_URL")
     ENCRYPTION_KEY: str = os.getenv("ENCRYPTION_KEY")
+    # Comma separated master keys that are still accepted for decryption during a rotation
+    ENCRYPTION_KEY_PREVIOUS: str = os.getenv("ENCRYPTION_KEY_PREVIOUS", "")
     SECRET_KEY: str = os.getenv("SECRET_KEY")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
@@ -23,6 +25,8 @@ class Settings:
     FRONTEND_URL: str = os.getenv("FRONTEND_URL", "http://localhost:8000")
     PORT: str = os.getenv("PORT", "8000")
     COOKIE_SECURE: bool = os.getenv("COOKIE_SECURE", "false").lower() in ("1", "true", "yes")
+    # Bearer token for /health/metrics; the endpoint is disabled while it is empty
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
 
     _ALLOWED_EMAIL_DOMAINS_RAW: str = os.getenv("ALLOWED_EMAIL_DOMAINS", "")
     ALLOWED_EMAIL_DOMAINS = [
@@ -33,11 +37,18 @@ class Settings:
 
 settings = Settings()
 
-try:
-    master_fernet = Fernet(settings.ENCRYPTION_KEY)
-except ValueError:
-    raw = base64.b64decode(settings.ENCRYPTION_KEY)
-    master_fernet = Fernet(base64.urlsafe_b64encode(raw))
+def _load_fernet(key: str) -> Fernet:
+    try:
+        return Fernet(key)
+    except ValueError:
+        raw = base64.b64decode(key)
+        return Fernet(base64.urlsafe_b64encode(raw))
+
+# The first key encrypts, every key decrypts; see services/key_rotation.py
+master_fernets = [_load_fernet(settings.ENCRYPTION_KEY)] + [
+    _load_fernet(key.strip()) for key in settings.ENCRYPTION_KEY_PREVIOUS.split(",") if key.strip()
+]
+master_fernet = MultiFernet(master_fernets)
 
 engine = create_async_engine(settings.DATABASE_URL, future=True, echo=False, pool_pre_ping=True, pool_recycle=3600)
 async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
@@ -11,7 +11,70 @@ class AppConstants:
     # TOTP validation
     MAX_ACCOUNT_LENGTH = 32
     MAX_ISSUER_LENGTH = 32
-    
+    TOTP_PERIOD = 30
+    TOTP_ALGORITHMS = ("SHA1", "SHA256", "SHA512")
+    TOTP_DIGITS = (6, 8)
+    TOTP_PERIODS = (15, 30, 60)
+
+    # Caching
+    CODE_CACHE_MAX_ENTRIES = int(os.getenv("CODE_CACHE_MAX_ENTRIES", "100000"))
+    DEK_CACHE_MAX_ENTRIES = int(os.getenv("DEK_CACHE_MAX_ENTRIES", "10000"))
+    DEK_CACHE_TTL_SECONDS = int(os.getenv("DEK_CACHE_TTL_SECONDS", "900"))
+    ITEM_KEY_CACHE_MAX_ENTRIES = int(os.getenv("ITEM_KEY_CACHE_MAX_ENTRIES", "100000"))
+    ITEM_KEY_CACHE_TTL_SECONDS = int(os.getenv("ITEM_KEY_CACHE_TTL_SECONDS", "900"))
+    TOTP_ENGINE_MAX_KEYS = int(os.getenv("TOTP_ENGINE_MAX_KEYS", "100000"))
+    BUNDLE_MAX_STEPS = int(os.getenv("BUNDLE_MAX_STEPS", "10"))
+
+    # Boundary pre-computation
+    PRECOMPUTE_HOT_SET_SIZE = int(os.getenv("PRECOMPUTE_HOT_SET_SIZE", "1000"))
+    PRECOMPUTE_LEAD_SECONDS = float(os.getenv("PRECOMPUTE_LEAD_SECONDS", "1.5"))
+    PRECOMPUTE_ACTIVE_WINDOW_SECONDS = int(os.getenv("PRECOMPUTE_ACTIVE_WINDOW_SECONDS", "120"))
+    PRECOMPUTE_CHUNK_SIZE = int(os.getenv("PRECOMPUTE_CHUNK_SIZE", "200"))
+    BOUNDARY_WINDOW_SECONDS = 2
+
+    # Server-Sent Events code streams
+    STREAM_MAX_PER_USER = int(os.getenv("STREAM_MAX_PER_USER", "10"))
+    STREAM_MAX_PER_WORKER = int(os.getenv("STREAM_MAX_PER_WORKER", "1000"))
+    STREAM_HEARTBEAT_SECONDS = int(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+    # Open streams re-check their API key or session this often
+    STREAM_REVALIDATE_SECONDS = int(os.getenv("STREAM_REVALIDATE_SECONDS", "60"))
+
+    # Listing pagination
+    LIST_PAGE_SIZE = int(os.getenv("LIST_PAGE_SIZE", "100"))
+    LIST_MAX_PAGE_SIZE = 500
+    MAX_SEARCH_LENGTH = 64
+    CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", "500"))
+    # Change log entries are kept this long; older sync cursors get a full resync
+    VAULT_CHANGES_RETENTION_DAYS = int(os.getenv("VAULT_CHANGES_RETENTION_DAYS", "30"))
+
+    # Batch API
+    BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "500"))
+
+    # Key rotation (services/key_rotation.py)
+    KEY_ROTATION_BATCH_SIZE = int(os.getenv("KEY_ROTATION_BATCH_SIZE", "500"))
+    KEY_ROTATION_CONCURRENCY = int(os.getenv("KEY_ROTATION_CONCURRENCY", "4"))
+    # Requests that loaded a user before a DEK rotation started finish within this window
+    KEY_ROTATION_SETTLE_SECONDS = int(os.getenv("KEY_ROTATION_SETTLE_SECONDS", "30"))
+
+    # Binary secret format migration (services/secret_migration.py)
+    SECRET_MIGRATION_BATCH_SIZE = int(os.getenv("SECRET_MIGRATION_BATCH_SIZE", "500"))
+    SECRET_MIGRATION_MAX_PENDING = int(os.getenv("SECRET_MIGRATION_MAX_PENDING", "10000"))
+    SECRET_MIGRATION_FLUSH_SECONDS = float(os.getenv("SECRET_MIGRATION_FLUSH_SECONDS", "5"))
+
+    # Share dialog recipient autocomplete
+    RECIPIENT_SUGGEST_LIMIT = 10
+    RECIPIENT_SUGGEST_MIN_PREFIX = 2
+    RECENT_RECIPIENTS_PER_USER = int(os.getenv("RECENT_RECIPIENTS_PER_USER", "20"))
+    RECENT_RECIPIENTS_MAX_USERS = int(os.getenv("RECENT_RECIPIENTS_MAX_USERS", "10000"))
+
+    # Idempotency-Key replay window
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    # A running request refreshes its claim this often; a claim silent for the
+    # abandoned window belongs to a request that died and may be taken over
+    IDEMPOTENCY_HEARTBEAT_SECONDS = int(os.getenv("IDEMPOTENCY_HEARTBEAT_SECONDS", "15"))
+    IDEMPOTENCY_ABANDONED_SECONDS = int(os.getenv("IDEMPOTENCY_ABANDONED_SECONDS", "120"))
+    MAX_IDEMPOTENCY_KEY_LENGTH = 128
+
     # Session management
     ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
     REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
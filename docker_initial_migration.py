@@ -3,23 +3,33 @@ import time
 import asyncio
 import subprocess
 from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy import inspect
+from sqlalchemy import inspect, text
+from alembic.config import Config
+from alembic.script import ScriptDirectory
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Schema of databases created before revisions were shipped with the app
+BASELINE_REVISION = "0001"
 
 async def main():
     engine = create_async_engine(DATABASE_URL)
 
     async with engine.connect() as conn:
         tables = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+        version = None
+        if 'alembic_version' in tables:
+            version = (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar()
 
     await engine.dispose()
 
-    if 'alembic_version' not in tables:
-        print("First run: creating initial migration...")
-        subprocess.run(["alembic", "revision", "--autogenerate", "-m", "initial migration"], check=True)
-        subprocess.run(["alembic", "upgrade", "head"], check=True)
-    else:
-        print("Migrations already applied, skipping...")
+    known = {script.revision for script in ScriptDirectory.from_config(Config("alembic.ini")).walk_revisions()}
+    if 'users' in tables and version not in known:
+        # Earlier images autogenerated a local "initial migration" on first run,
+        # which left the baseline schema under a revision id that is not shipped
+        print(f"Unknown schema revision {version}, stamping the baseline schema...")
+        subprocess.run(["alembic", "stamp", "--purge", BASELINE_REVISION], check=True)
+
+    print("Applying migrations...")
+    subprocess.run(["alembic", "upgrade", "head"], check=True)
 
 asyncio.run(main())
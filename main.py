@@ -1,9 +1,11 @@
 import uvicorn
+import hmac
 import logging
 import uuid
 import os
+from contextlib import asynccontextmanager
 from typing import Optional
-from fastapi import FastAPI, Request, Depends, status
+from fastapi import FastAPI, Request, Depends, Header, status
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.exceptions import RequestValidationError
@@ -21,6 +23,14 @@ from routes.totp import router as totp_router
 from routes.api import router as api_router
 from routes.sessions import router as sessions_router
 from models import User
+from services.code_cache import code_cache
+from services.dek_cache import dek_cache
+from services.item_keys import item_key_cache
+from services.recipient_service import recent_recipients
+from services.secret_migration import secret_migrator
+from services.code_scheduler import boundary_precomputer
+from services.single_flight import list_flights
+from services.code_stream import code_stream_hub
 
 logging.basicConfig(
     filename="logs/error.log",
@@ -29,10 +39,20 @@ logging.basicConfig(
     datefmt="%Y/%m/%d %H:%M:%S"
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    boundary_precomputer.start()
+    secret_migrator.start()
+    yield
+    await code_stream_hub.stop()
+    await boundary_precomputer.stop()
+    await secret_migrator.stop()
+
 app = (FastAPI(
     docs_url=None,
     redoc_url=None,
-    openapi_url=None
+    openapi_url=None,
+    lifespan=lifespan
     )
 )
 
@@ -106,7 +126,7 @@ async def auth_middleware(request: Request, call_next):
         request.url.path.startswith("/auth")
         or request.url.path.startswith("/static")
         or request.url.path.startswith("/api")  # API endpoints use API key auth
-        or request.url.path in ["/favicon.ico", "/health"]
+        or request.url.path in ["/favicon.ico", "/health", "/health/metrics"]
     )
     if allowlisted:
         response = await call_next(request)
@@ -201,6 +221,25 @@ async def favicon():
 async def health_check():
     return JSONResponse(content={"status": "ok"})
 
+@app.get("/health/metrics", status_code=status.HTTP_200_OK)
+async def health_metrics(authorization: Optional[str] = Header(None)):
+    """In-process cache counters of this worker, only for the METRICS_TOKEN bearer"""
+    if not settings.METRICS_TOKEN:
+        return JSONResponse(content={"detail": "Not Found"}, status_code=status.HTTP_404_NOT_FOUND)
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        return JSONResponse(content={"detail": "Invalid metrics token"}, status_code=status.HTTP_401_UNAUTHORIZED)
+    return JSONResponse(content={
+        "code_cache": code_cache.stats(),
+        "dek_cache": dek_cache.stats(),
+        "item_key_cache": item_key_cache.stats(),
+        "recent_recipients": recent_recipients.stats(),
+        "secret_migration": secret_migrator.stats(),
+        "precompute": boundary_precomputer.stats(),
+        "single_flight": list_flights.stats(),
+        "streams": code_stream_hub.stats(),
+    })
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request, user: Optional[User] = Depends(get_current_user_if_exists)):
     # return templates.TemplateResponse("index.html", {"request": request, "user": user})
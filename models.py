@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index, Text
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index, Text, UniqueConstraint, VARBINARY
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from config import Base
@@ -12,8 +12,12 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     is_verified = Column(Boolean, default=False)
     encrypted_dek = Column(String(512), nullable=False)
+    # Old DEK while a DEK rotation re-encrypts the user's rows; both are accepted meanwhile
+    previous_encrypted_dek = Column(String(512), nullable=True)
     password_reset_token_id = Column(String(512), nullable=True)
     password_reset_requested_at = Column(DateTime, nullable=True, default=None)
+    # Bumped on every change to the user's own or shared-with-me listings
+    vault_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     totp_items = relationship("TOTPItem", back_populates="user")
     shared_totp_items = relationship("SharedTOTP", back_populates="shared_with_user")
@@ -26,7 +30,16 @@ class TOTPItem(Base):
     id = Column(Integer, primary_key=True, index=True)
     issuer = Column(String(128), nullable=False)
     account = Column(String(128), nullable=False)
-    encrypted_secret = Column(Text, nullable=False)
+    # Fernet text token: under the owner's DEK for items without an item key, or
+    # (not yet migrated) under the item key. None once secret_blob holds the secret
+    encrypted_secret = Column(Text, nullable=True)
+    # Binary envelope under the item key, see services/item_keys.py
+    secret_blob = Column(VARBINARY(512), nullable=True)
+    # Per-item Fernet key wrapped with the owner's DEK
+    encrypted_item_key = Column(Text, nullable=True)
+    algorithm = Column(String(16), nullable=False, default="SHA1", server_default="SHA1")
+    digits = Column(Integer, nullable=False, default=6, server_default="6")
+    period = Column(Integer, nullable=False, default=30, server_default="30")
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
 
     user = relationship("User", back_populates="totp_items")
@@ -38,11 +51,76 @@ class SharedTOTP(Base):
     id = Column(Integer, primary_key=True, index=True)
     totp_item_id = Column(Integer, ForeignKey("totp_items.id"), nullable=False)
     shared_with_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    encrypted_secret = Column(Text, nullable=False)
+    # Either the item key wrapped with the recipient's DEK, or (older shares) a full
+    # copy of the secret encrypted with it
+    encrypted_item_key = Column(Text, nullable=True)
+    encrypted_secret = Column(Text, nullable=True)
 
     totp_item = relationship("TOTPItem", back_populates="shared_with")
     shared_with_user = relationship("User", back_populates="shared_totp_items")
 
+    __table_args__ = (UniqueConstraint("totp_item_id", "shared_with_user_id", name="uq_shared_totp_item_recipient"),)
+
+# Ordered listings and prefix search on issuer / account within one user's vault
+Index("ix_totp_items_user_issuer_account", TOTPItem.user_id, TOTPItem.issuer, TOTPItem.account, TOTPItem.id)
+Index("ix_totp_items_user_account_issuer", TOTPItem.user_id, TOTPItem.account, TOTPItem.issuer, TOTPItem.id)
+Index("ix_shared_totp_recipient_item", SharedTOTP.shared_with_user_id, SharedTOTP.totp_item_id)
+
+class Group(Base):
+    """Team that items are shared with once, under a group key wrapped per member"""
+    __tablename__ = "groups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(128), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+class GroupMember(Base):
+    __tablename__ = "group_members"
+
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Group key encrypted with the member's DEK
+    encrypted_group_key = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (UniqueConstraint("group_id", "user_id", name="uq_group_members_group_user"),)
+
+class GroupTOTP(Base):
+    __tablename__ = "group_totp"
+
+    id = Column(Integer, primary_key=True, index=True)
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=False)
+    totp_item_id = Column(Integer, ForeignKey("totp_items.id"), nullable=False)
+    # Item key wrapped with the group key, or (older shares) the secret encrypted with it
+    encrypted_item_key = Column(Text, nullable=True)
+    encrypted_secret = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (UniqueConstraint("group_id", "totp_item_id", name="uq_group_totp_group_item"),)
+
+Index("ix_group_members_user_group", GroupMember.user_id, GroupMember.group_id)
+Index("ix_group_totp_item", GroupTOTP.totp_item_id)
+
+class KeyRotation(Base):
+    """Checkpoint of a master key or user DEK rotation, so an interrupted run resumes"""
+    __tablename__ = "key_rotations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(16), nullable=False)  # master | dek
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    status = Column(String(16), nullable=False, default="running")  # running | verifying | done
+    target = Column(String(64), nullable=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    rows_scanned = Column(Integer, nullable=False, default=0)
+    rows_rotated = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = Column(DateTime, nullable=True)
+
+Index("ix_key_rotations_kind_status", KeyRotation.kind, KeyRotation.status)
+
 class Session(Base):
     __tablename__ = "sessions"
 
@@ -73,7 +151,46 @@ class ApiKey(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     last_used_at = Column(DateTime, nullable=True)
     revoked_at = Column(DateTime, nullable=True)
+    # X25519 public key of a trusted device that syncs the encrypted vault through this key
+    device_public_key = Column(String(64), nullable=True)
+    device_registered_at = Column(DateTime, nullable=True)
 
     user = relationship("User", back_populates="api_keys")
 
 Index("ix_api_keys_user_active", ApiKey.user_id, ApiKey.revoked_at)
+
+class VaultChange(Base):
+    """Append-only log of item changes per affected user, read by delta sync"""
+    __tablename__ = "vault_changes"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # No foreign key: entries of deleted items must outlive the item
+    totp_item_id = Column(Integer, nullable=False)
+    action = Column(String(16), nullable=False)  # created, updated, deleted, shared, unshared
+    # The user's vault_version after the change; the delta sync cursor
+    version = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+Index("ix_vault_changes_user_version", VaultChange.user_id, VaultChange.version)
+
+class IdempotencyKey(Base):
+    """Stored response of a mutating API call, replayed when a client retries with the same key"""
+    __tablename__ = "idempotency_keys"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    key = Column(String(128), nullable=False)
+    fingerprint = Column(String(64), nullable=False)
+    # Both stay empty while the first request is still running
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    # The request holding the claim, and its last sign of life while it runs
+    claim_id = Column(String(32), nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),)
+
+Index("ix_idempotency_keys_user_expires", IdempotencyKey.user_id, IdempotencyKey.expires_at)
@@ -1,15 +1,28 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from services.totp_service import TotpService
 from services.auth import get_authenticated_user
-from services.api_auth import get_user_from_api_key
+from services.api_auth import get_user_from_api_key, get_api_key_and_user
 from services.api_key_service import ApiKeyService
+from services.vault_sync_service import VaultSyncService
+from services.batch_service import BatchService
+from services.group_service import GroupService
+from services.recipient_service import RecipientService
+from services.idempotency_service import IdempotencyService
 from services.import_export import build_qr_png
+from services.validator import validate_totp
+from services.single_flight import coalesce_for_user
+from services.etag import list_etag, etag_matches, etag_headers, not_modified
+from services.code_stream import code_stream_hub
+from services.list_options import (
+    parse_list_options, parse_page_options, parse_ids, next_page_headers, OWNED_FIELDS, SHARED_FIELDS
+)
 from models import User
+from constants import AppConstants
 import io
 
 router = APIRouter(prefix="/api", tags=["api"])
@@ -22,17 +35,29 @@ class TOTPCreateRequest(BaseModel):
     account: str
     issuer: str
     secret: str
+    algorithm: str = "SHA1"
+    digits: int = 6
+    period: int = 30
 
 class TOTPUpdateRequest(BaseModel):
     account: str
 
 class TOTPShareRequest(BaseModel):
     totp_ids: List[int]
-    email: str
+    email: Optional[str] = None
+    emails: Optional[List[str]] = None
 
 class TOTPDeleteRequest(BaseModel):
     ids: List[int]
 
+class SharePair(BaseModel):
+    totp_id: int
+    email: str
+
+class ShareRevokeRequest(BaseModel):
+    emails: List[str] = []  # lose access to every item
+    pairs: List[SharePair] = []
+
 class TOTPExportRequest(BaseModel):
     ids: List[int]
 
@@ -42,28 +67,138 @@ class TOTPImportRequest(BaseModel):
 class ApiKeyCreateRequest(BaseModel):
     name: Optional[str] = None
 
+class SyncDeviceRequest(BaseModel):
+    public_key: str
+
+class GroupCreateRequest(BaseModel):
+    name: str
+
+class GroupMembersRequest(BaseModel):
+    emails: List[str]
+
+class GroupItemsRequest(BaseModel):
+    totp_ids: List[int]
+
+class BatchOperation(BaseModel):
+    op: Literal["create", "update", "delete", "share", "unshare"]
+    id: Optional[int] = None  # update, delete, unshare
+    ids: Optional[List[int]] = None  # share
+    email: Optional[str] = None  # share, unshare
+    emails: Optional[List[str]] = None  # share
+    account: Optional[str] = None  # create, update
+    issuer: Optional[str] = None
+    secret: Optional[str] = None
+    algorithm: str = "SHA1"
+    digits: int = 6
+    period: int = 30
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation]
+    atomic: bool = True
+
 # API endpoints for TOTP operations using API key
 @router.get("/v1/totp/list")
 @limiter.limit("30/minute")
-async def api_list_totp(request: Request, user: User = Depends(get_user_from_api_key)):
-    """Get list of all user's TOTP items"""
-    totps = await TotpService.list_all(user)
-    return JSONResponse(content=totps)
+async def api_list_totp(request: Request, fields: Optional[str] = None, include_codes: bool = True,
+                        ids: Optional[str] = None, sort: Optional[str] = None, q: Optional[str] = None,
+                        limit: Optional[int] = None, cursor: Optional[str] = None,
+                        user: User = Depends(get_user_from_api_key)):
+    """
+    Get list of all user's TOTP items, optionally projected with `fields` and filtered by `ids`.
+    `q` is a prefix search on issuer and account; with `limit` the list is paginated and the
+    next page is announced in the Link / X-Next-Cursor headers.
+    """
+    options = parse_list_options(OWNED_FIELDS, fields, include_codes, ids)
+    page = parse_page_options(sort, q, limit, cursor)
+    etag = list_etag(request, user, "list_all", options.include_codes)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    result = await coalesce_for_user(user, f"list_all:{options.key}:{page.key}",
+                                     lambda: TotpService.list_page(user, options.include_codes, options.ids, page))
+    return JSONResponse(content=options.project(result["items"]),
+                        headers={**etag_headers(etag), **next_page_headers(request, result["next_cursor"])})
 
 @router.get("/v1/totp/shared")
 @limiter.limit("30/minute")
-async def api_list_shared_totp(request: Request, user: User = Depends(get_user_from_api_key)):
-    """Get list of TOTP items shared with user"""
-    totps = await TotpService.list_shared_with_me(user)
-    return JSONResponse(content=totps)
+async def api_list_shared_totp(request: Request, fields: Optional[str] = None, include_codes: bool = True,
+                               ids: Optional[str] = None, sort: Optional[str] = None, q: Optional[str] = None,
+                               limit: Optional[int] = None, cursor: Optional[str] = None,
+                               user: User = Depends(get_user_from_api_key)):
+    """Get list of TOTP items shared with user; takes the same query parameters as /v1/totp/list"""
+    options = parse_list_options(SHARED_FIELDS, fields, include_codes, ids)
+    page = parse_page_options(sort, q, limit, cursor)
+    etag = list_etag(request, user, "list_shared_with_me", options.include_codes)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    result = await coalesce_for_user(user, f"list_shared_with_me:{options.key}:{page.key}",
+                                     lambda: TotpService.list_shared_page(user, options.include_codes, options.ids, page))
+    return JSONResponse(content=options.project(result["items"]),
+                        headers={**etag_headers(etag), **next_page_headers(request, result["next_cursor"])})
+
+@router.get("/v1/totp/codes")
+@limiter.limit("30/minute")
+async def api_list_codes(request: Request, ids: Optional[str] = None, user: User = Depends(get_user_from_api_key)):
+    """Get own and shared TOTP codes in one call, with server time and seconds left in the step"""
+    id_filter = parse_ids(ids)
+    etag = list_etag(request, user, "list_codes")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    codes = await coalesce_for_user(user, f"list_codes:{id_filter}", lambda: TotpService.list_codes(user, id_filter))
+    return JSONResponse(content=codes, headers=etag_headers(etag))
+
+@router.get("/v1/totp/changes")
+@limiter.limit("60/minute")
+async def api_list_changes(request: Request, since: Optional[int] = None, user: User = Depends(get_user_from_api_key)):
+    """
+    Items created, updated, shared or removed since the `since` cursor, with the next cursor.
+    Call again with the returned cursor while has_more is true; omit `since` for a full snapshot.
+    """
+    if since is not None and since < 0:
+        raise HTTPException(status_code=400, detail="since must be a cursor returned by this endpoint")
+    etag = list_etag(request, user, "list_changes", with_codes=False)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    changes = await TotpService.list_changes(user, since)
+    if changes is None:
+        raise HTTPException(status_code=410, detail="Cursor expired; full resync required (omit since)")
+    return JSONResponse(content=changes, headers=etag_headers(etag))
+
+@router.get("/v1/totp/bundle")
+@limiter.limit("30/minute")
+async def api_list_code_bundles(request: Request, steps: int = 1, user: User = Depends(get_user_from_api_key)):
+    """Get codes for the current step and the next `steps` steps, each with valid_from / valid_until"""
+    if steps < 0 or steps > AppConstants.BUNDLE_MAX_STEPS:
+        raise HTTPException(status_code=400, detail=f"steps must be between 0 and {AppConstants.BUNDLE_MAX_STEPS}")
+    etag = list_etag(request, user, "list_code_bundles")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    bundles = await coalesce_for_user(user, f"list_code_bundles:{steps}",
+                                      lambda: TotpService.list_code_bundles(user, steps))
+    return JSONResponse(content=bundles, headers=etag_headers(etag))
+
+@router.get("/v1/totp/stream")
+@limiter.limit("10/minute")
+async def api_stream_codes(request: Request, ids: Optional[str] = None, auth=Depends(get_api_key_and_user)):
+    """
+    Server-Sent Events stream pushing own and shared codes after each step boundary.
+    The stream is closed once the API key is revoked.
+    """
+    api_key, user = auth
+    return code_stream_hub.open_stream(request, user, parse_ids(ids),
+                                       lambda: ApiKeyService.get_active_key_user(api_key.id))
 
 @router.post("/v1/totp/create")
 @limiter.limit("10/minute")
 async def api_create_totp(request: Request, body: TOTPCreateRequest, user: User = Depends(get_user_from_api_key)):
     """Create new TOTP item"""
-    # Validation will be done in TotpService
-    await TotpService.create(body.account, body.issuer, body.secret, user)
-    return JSONResponse(content={"message": "TOTP created successfully"})
+    error_msg = validate_totp(body.account, body.issuer, body.secret, body.algorithm, body.digits, body.period)
+    if error_msg:
+        raise HTTPException(status_code=400, detail=error_msg)
+
+    async def handle():
+        await TotpService.create(body.account, body.issuer, body.secret, user, body.algorithm, body.digits, body.period)
+        return JSONResponse(content={"message": "TOTP created successfully"})
+    return await IdempotencyService.run(request, user, handle)
 
 @router.post("/v1/totp/delete")
 @limiter.limit("10/minute")
@@ -72,45 +207,57 @@ async def api_delete_totp(request: Request, body: TOTPDeleteRequest, user: User
     if not body.ids:
         raise HTTPException(status_code=400, detail="No IDs provided")
 
-    deleted_count = 0
-    for item_id in body.ids:
-        if await TotpService.delete(item_id, user):
-            deleted_count += 1
+    async def handle():
+        outcomes = await TotpService.delete_many(body.ids, user)
+        deleted_count = sum(outcomes.values())
+        not_found = [item_id for item_id, deleted in outcomes.items() if not deleted]
 
-    if deleted_count == 0:
-        raise HTTPException(status_code=404, detail="No TOTP items found or deleted")
+        if deleted_count == 0:
+            raise HTTPException(status_code=404, detail="No TOTP items found or deleted")
 
-    if len(body.ids) == 1:
-        return JSONResponse(content={"message": "TOTP deleted successfully", "deleted_count": deleted_count})
-    else:
-        return JSONResponse(content={"message": f"Deleted {deleted_count} item(s).", "deleted_count": deleted_count})
+        if len(outcomes) == 1:
+            return JSONResponse(content={"message": "TOTP deleted successfully", "deleted_count": deleted_count})
+        else:
+            return JSONResponse(content={"message": f"Deleted {deleted_count} item(s).", "deleted_count": deleted_count,
+                                         "not_found": not_found})
+    return await IdempotencyService.run(request, user, handle)
 
 @router.put("/v1/totp/{totp_id}")
 @limiter.limit("10/minute")
 async def api_update_totp(request: Request, totp_id: int, body: TOTPUpdateRequest, user: User = Depends(get_user_from_api_key)):
     """Update TOTP item (account field only)"""
-    success, message = await TotpService.update(totp_id, body.account, user)
-    if not success:
-        raise HTTPException(status_code=404, detail=message)
-    return JSONResponse(content={"message": message})
+    async def handle():
+        success, message = await TotpService.update(totp_id, body.account, user)
+        if not success:
+            raise HTTPException(status_code=404, detail=message)
+        return JSONResponse(content={"message": message})
+    return await IdempotencyService.run(request, user, handle)
 
 @router.post("/v1/totp/share")
 @limiter.limit("10/minute")
 async def api_share_totp(request: Request, body: TOTPShareRequest, user: User = Depends(get_user_from_api_key)):
-    """Share TOTP items with another user"""
-    shared_count, message = await TotpService.share_totp(body.totp_ids, body.email, user)
-    if shared_count == 0:
-        raise HTTPException(status_code=400, detail=message)
-    return JSONResponse(content={"message": message, "shared_count": shared_count})
+    """Share TOTP items with one (`email`) or several (`emails`) users"""
+    emails = (body.emails or []) + ([body.email] if body.email else [])
+    if not emails:
+        raise HTTPException(status_code=400, detail="No recipients provided")
+
+    async def handle():
+        shared_count, message = await TotpService.share_totp(body.totp_ids, emails, user)
+        if shared_count == 0:
+            raise HTTPException(status_code=400, detail=message)
+        return JSONResponse(content={"message": message, "shared_count": shared_count})
+    return await IdempotencyService.run(request, user, handle)
 
 @router.delete("/v1/totp/{totp_id}/share/{email}")
 @limiter.limit("10/minute")
 async def api_unshare_totp(request: Request, totp_id: int, email: str, user: User = Depends(get_user_from_api_key)):
     """Revoke TOTP item sharing"""
-    success, message = await TotpService.unshare_totp(totp_id, email, user)
-    if not success:
-        raise HTTPException(status_code=400, detail=message)
-    return JSONResponse(content={"message": message})
+    async def handle():
+        success, message = await TotpService.unshare_totp(totp_id, email, user)
+        if not success:
+            raise HTTPException(status_code=400, detail=message)
+        return JSONResponse(content={"message": message})
+    return await IdempotencyService.run(request, user, handle)
 
 @router.get("/v1/totp/{totp_id}/shared-users")
 @limiter.limit("30/minute")
@@ -121,6 +268,36 @@ async def api_get_shared_users(request: Request, totp_id: int, user: User = Depe
         raise HTTPException(status_code=400, detail=error)
     return JSONResponse(content={"emails": emails})
 
+@router.get("/v1/recipients")
+@limiter.limit("120/minute")
+async def api_suggest_recipients(request: Request, q: str = "", user: User = Depends(get_user_from_api_key)):
+    """Recipient emails starting with q, previous recipients first"""
+    if len(q) > AppConstants.MAX_SEARCH_LENGTH:
+        raise HTTPException(status_code=400, detail="Search query is too long")
+    return JSONResponse(content={"emails": await RecipientService.suggest(user, q)})
+
+@router.get("/v1/sharing")
+@limiter.limit("30/minute")
+async def api_sharing_overview(request: Request, user: User = Depends(get_user_from_api_key)):
+    """All shared items of the user with the emails each one is shared with"""
+    return JSONResponse(content={"items": await TotpService.sharing_overview(user)})
+
+@router.post("/v1/sharing/revoke")
+@limiter.limit("10/minute")
+async def api_revoke_shares(request: Request, body: ShareRevokeRequest, user: User = Depends(get_user_from_api_key)):
+    """Revoke recipients from all items (`emails`) and/or single (item, email) shares (`pairs`) at once"""
+    if not body.emails and not body.pairs:
+        raise HTTPException(status_code=400, detail="No emails or pairs provided")
+    if len(body.emails) + len(body.pairs) > AppConstants.BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {AppConstants.BATCH_MAX_OPERATIONS} emails and pairs per request")
+
+    async def handle():
+        revoked_count, unknown = await TotpService.revoke_shares(
+            user, body.emails, [(pair.totp_id, pair.email) for pair in body.pairs]
+        )
+        return JSONResponse(content={"revoked_count": revoked_count, "unknown_emails": unknown})
+    return await IdempotencyService.run(request, user, handle)
+
 @router.post("/v1/totp/export")
 @limiter.limit("10/minute")
 async def api_export_totp_qr(request: Request, body: TOTPExportRequest, user: User = Depends(get_user_from_api_key)):
@@ -132,7 +309,10 @@ async def api_export_totp_qr(request: Request, body: TOTPExportRequest, user: Us
     if not raw_items:
         raise HTTPException(status_code=404, detail="No TOTP items found")
 
-    png_bytes = build_qr_png(raw_items)
+    try:
+        png_bytes = build_qr_png(raw_items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return StreamingResponse(
         io.BytesIO(png_bytes),
         media_type="image/png",
@@ -151,7 +331,10 @@ async def api_export_totp_uri(request: Request, body: TOTPExportRequest, user: U
         raise HTTPException(status_code=404, detail="No TOTP items found")
 
     from services.import_export import build_migration_uri
-    uri = build_migration_uri(raw_items)
+    try:
+        uri = build_migration_uri(raw_items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return JSONResponse(content={"uri": uri})
 
 @router.post("/v1/totp/import")
@@ -159,10 +342,164 @@ async def api_export_totp_uri(request: Request, body: TOTPExportRequest, user: U
 async def api_import_totp(request: Request, body: TOTPImportRequest, user: User = Depends(get_user_from_api_key)):
     """Import TOTP items from Google Authenticator migration URI"""
     from services.import_export_service import ImportExportService
-    count, error = await ImportExportService.import_totp_uris(body.uri, user)
-    if error:
-        raise HTTPException(status_code=400, detail=error)
-    return JSONResponse(content={"message": f"Imported {count} item(s).", "count": count})
+
+    async def handle():
+        count, error = await ImportExportService.import_totp_uris(body.uri, user)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        return JSONResponse(content={"message": f"Imported {count} item(s).", "count": count})
+    return await IdempotencyService.run(request, user, handle)
+
+@router.post("/v1/batch")
+@limiter.limit("10/minute")
+async def api_batch(request: Request, body: BatchRequest, user: User = Depends(get_user_from_api_key)):
+    """
+    Run create / update / delete / share / unshare operations in one transaction.
+    Returns one result per operation; with atomic=true (default) a failure rolls back all of them.
+    """
+    if not body.operations:
+        raise HTTPException(status_code=400, detail="No operations provided")
+    if len(body.operations) > AppConstants.BATCH_MAX_OPERATIONS:
+        raise HTTPException(status_code=400, detail=f"At most {AppConstants.BATCH_MAX_OPERATIONS} operations per batch")
+
+    async def handle():
+        committed, results = await BatchService.run(user, [op.model_dump() for op in body.operations], body.atomic)
+        return JSONResponse(
+            status_code=status.HTTP_200_OK if committed else status.HTTP_400_BAD_REQUEST,
+            content={"committed": committed, "results": results}
+        )
+    return await IdempotencyService.run(request, user, handle)
+
+# Groups: items are encrypted once under a group key that is wrapped for each member
+@router.get("/v1/groups")
+@limiter.limit("30/minute")
+async def api_list_groups(request: Request, user: User = Depends(get_user_from_api_key)):
+    """List the groups the user belongs to"""
+    return JSONResponse(content=await GroupService.list_groups(user))
+
+@router.post("/v1/groups")
+@limiter.limit("10/minute")
+async def api_create_group(request: Request, body: GroupCreateRequest, user: User = Depends(get_user_from_api_key)):
+    """Create a group owned by the user"""
+    name = body.name.strip()
+    if not name or len(name) > 128:
+        raise HTTPException(status_code=400, detail="Group name must be 1 to 128 characters")
+
+    async def handle():
+        group = await GroupService.create_group(name, user)
+        return JSONResponse(content={"id": group.id, "name": group.name, "message": "Group created"})
+    return await IdempotencyService.run(request, user, handle)
+
+@router.delete("/v1/groups/{group_id}")
+@limiter.limit("10/minute")
+async def api_delete_group(request: Request, group_id: int, user: User = Depends(get_user_from_api_key)):
+    """Delete an owned group and its item shares"""
+    async def handle():
+        success, message = await GroupService.delete_group(group_id, user)
+        if not success:
+            raise HTTPException(status_code=404, detail=message)
+        return JSONResponse(content={"message": message})
+    return await IdempotencyService.run(request, user, handle)
+
+@router.get("/v1/groups/{group_id}/members")
+@limiter.limit("30/minute")
+async def api_get_group_members(request: Request, group_id: int, user: User = Depends(get_user_from_api_key)):
+    """Get the member emails of a group"""
+    emails = await GroupService.get_members(group_id, user)
+    if emails is None:
+        raise HTTPException(status_code=404, detail="Group not found.")
+    return JSONResponse(content={"emails": emails})
+
+@router.post("/v1/groups/{group_id}/members")
+@limiter.limit("10/minute")
+async def api_add_group_members(request: Request, group_id: int, body: GroupMembersRequest,
+                                user: User = Depends(get_user_from_api_key)):
+    """Add members to an owned group"""
+    async def handle():
+        added_count, message = await GroupService.add_members(group_id, body.emails, user)
+        if added_count == 0:
+            raise HTTPException(status_code=400, detail=message)
+        return JSONResponse(content={"message": message, "added_count": added_count})
+    return await IdempotencyService.run(request, user, handle)
+
+@router.delete("/v1/groups/{group_id}/members/{email}")
+@limiter.limit("10/minute")
+async def api_remove_group_member(request: Request, group_id: int, email: str,
+                                  user: User = Depends(get_user_from_api_key)):
+    """Remove a member from a group, or leave it"""
+    async def handle():
+        success, message = await GroupService.remove_member(group_id, email, user)
+        if not success:
+            raise HTTPException(status_code=400, detail=message)
+        return JSONResponse(content={"message": message})
+    return await IdempotencyService.run(request, user, handle)
+
+@router.post("/v1/groups/{group_id}/items")
+@limiter.limit("10/minute")
+async def api_share_group_items(request: Request, group_id: int, body: GroupItemsRequest,
+                                user: User = Depends(get_user_from_api_key)):
+    """Share owned TOTP items with a group"""
+    async def handle():
+        shared_count, message = await GroupService.share_items(group_id, body.totp_ids, user)
+        if shared_count == 0:
+            raise HTTPException(status_code=400, detail=message)
+        return JSONResponse(content={"message": message, "shared_count": shared_count})
+    return await IdempotencyService.run(request, user, handle)
+
+@router.post("/v1/groups/{group_id}/items/remove")
+@limiter.limit("10/minute")
+async def api_unshare_group_items(request: Request, group_id: int, body: GroupItemsRequest,
+                                  user: User = Depends(get_user_from_api_key)):
+    """Stop sharing TOTP items with a group"""
+    async def handle():
+        removed_count, message = await GroupService.unshare_items(group_id, body.totp_ids, user)
+        if removed_count == 0:
+            raise HTTPException(status_code=400, detail=message)
+        return JSONResponse(content={"message": message, "removed_count": removed_count})
+    return await IdempotencyService.run(request, user, handle)
+
+# Encrypted vault sync for trusted devices (one device per API key)
+@router.put("/v1/sync/device")
+@limiter.limit("10/minute")
+async def api_register_sync_device(request: Request, body: SyncDeviceRequest, auth=Depends(get_api_key_and_user)):
+    """Register the device public key used to encrypt vault sync payloads"""
+    api_key, user = auth
+
+    async def handle():
+        success, error = await VaultSyncService.register_device(api_key, body.public_key)
+        if not success:
+            raise HTTPException(status_code=400, detail=error)
+        return JSONResponse(content={"message": "Device registered for sync"})
+    return await IdempotencyService.run(request, user, handle)
+
+@router.delete("/v1/sync/device")
+@limiter.limit("10/minute")
+async def api_unregister_sync_device(request: Request, auth=Depends(get_api_key_and_user)):
+    """Stop syncing to the device behind this API key"""
+    api_key, user = auth
+
+    async def handle():
+        if not await VaultSyncService.unregister_device(api_key):
+            raise HTTPException(status_code=404, detail="No device registered for this API key")
+        return JSONResponse(content={"message": "Device unregistered"})
+    return await IdempotencyService.run(request, user, handle)
+
+@router.get("/v1/sync")
+@limiter.limit("10/minute")
+async def api_sync_vault(request: Request, since: Optional[int] = None, auth=Depends(get_api_key_and_user)):
+    """
+    Owned and shared secrets changed since the `since` cursor, encrypted to the registered device key.
+    Call again with the returned cursor while has_more is true; omit `since` for the whole vault.
+    """
+    if since is not None and since < 0:
+        raise HTTPException(status_code=400, detail="since must be a cursor returned by this endpoint")
+    api_key, user = auth
+    if not api_key.device_public_key:
+        raise HTTPException(status_code=409, detail="Register a device public key first")
+    payload = await VaultSyncService.sync(api_key, user, since)
+    if payload is None:
+        raise HTTPException(status_code=410, detail="Cursor expired; full resync required (omit since)")
+    return JSONResponse(content=payload)
 
 # API endpoints for API key management (require web authentication)
 @router.post("/v1/api-keys", dependencies=[Depends(get_authenticated_user)])
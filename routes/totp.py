@@ -1,14 +1,24 @@
 from fastapi import APIRouter, Request, Form, Depends, HTTPException, status
 from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 import io
+from typing import Optional
 from starlette.responses import StreamingResponse
 from config import templates
 from services.flash import flash, get_flashed_message
 from services.totp_service import TotpService
+from services.recipient_service import RecipientService
 from services.auth import get_authenticated_user
+from services.session_service import SessionService
 from services.validator import validate_totp
 from services.import_export import build_qr_png
 from services.import_export_service import ImportExportService
+from services.single_flight import coalesce_for_user
+from services.etag import list_etag, etag_matches, etag_headers, not_modified
+from services.list_options import (
+    parse_list_options, parse_page_options, parse_ids, next_page_headers, OWNED_FIELDS, SHARED_FIELDS
+)
+from constants import AppConstants
+from services.code_stream import code_stream_hub
 
 router = APIRouter(prefix="/totp", tags=["totp"])
 
@@ -24,8 +34,9 @@ async def get_create(request: Request, user=Depends(get_authenticated_user)):
 
 @router.post("/create", response_class=HTMLResponse)
 async def post_create(request: Request, account: str = Form(...), issuer: str = Form(...), secret: str = Form(...),
+                      algorithm: str = Form("SHA1"), digits: int = Form(6), period: int = Form(30),
                       user=Depends(get_authenticated_user)):
-    error_msg = validate_totp(account, issuer, secret)
+    error_msg = validate_totp(account, issuer, secret, algorithm, digits, period)
     if error_msg:
         flash(request, error_msg, "error")
         flash_data = get_flashed_message(request)
@@ -35,19 +46,37 @@ async def post_create(request: Request, account: str = Form(...), issuer: str =
             status_code=status.HTTP_303_SEE_OTHER
         )
 
-    await TotpService.create(account, issuer, secret, user)
+    await TotpService.create(account, issuer, secret, user, algorithm, digits, period)
     flash(request, "TOTP successfully created!", "success")
     return RedirectResponse(router.url_path_for("get_list"), status_code=status.HTTP_303_SEE_OTHER)
 
 
 @router.get("/list", response_class=HTMLResponse)
-async def get_list(request: Request, user=Depends(get_authenticated_user)):
-    totps = await TotpService.list_all(user)
-    shared_totps = await TotpService.list_shared_with_me(user)
+async def get_list(request: Request, q: Optional[str] = None, cursor: Optional[str] = None,
+                   shared_q: Optional[str] = None, shared_cursor: Optional[str] = None, tab: Optional[str] = None,
+                   user=Depends(get_authenticated_user)):
+    page = parse_page_options(q=q, cursor=cursor, default_limit=AppConstants.LIST_PAGE_SIZE)
+    shared_page = parse_page_options(q=shared_q, cursor=shared_cursor, default_limit=AppConstants.LIST_PAGE_SIZE)
+    owned = await coalesce_for_user(user, f"list_all:{page.key}", lambda: TotpService.list_page(user, page=page))
+    shared = await coalesce_for_user(user, f"list_shared_with_me:{shared_page.key}",
+                                     lambda: TotpService.list_shared_page(user, page=shared_page))
+
+    def page_url(param: str, value: Optional[str], active_tab: str) -> str:
+        url = request.url.remove_query_params(param).include_query_params(tab=active_tab)
+        if value:
+            url = url.include_query_params(**{param: value})
+        return f"{url.path}?{url.query}"
+
     flash_data = get_flashed_message(request)
     return templates.TemplateResponse(
         "totp/list.html",
-        {"request": request, "totps": totps, "shared_totps": shared_totps, "user": user, "flash": flash_data}
+        {"request": request, "totps": owned["items"], "shared_totps": shared["items"], "user": user,
+         "flash": flash_data, "q": page.q or "", "shared_q": shared_page.q or "",
+         "active_tab": "shared" if tab == "shared" else "my",
+         "next_url": page_url("cursor", owned["next_cursor"], "my") if owned["next_cursor"] else None,
+         "first_url": page_url("cursor", None, "my") if cursor else None,
+         "shared_next_url": page_url("shared_cursor", shared["next_cursor"], "shared") if shared["next_cursor"] else None,
+         "shared_first_url": page_url("shared_cursor", None, "shared") if shared_cursor else None}
     )
 
 
@@ -58,10 +87,7 @@ async def delete_items(request: Request, ids: str = Form(...), user=Depends(get_
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid item ids")
 
-    deleted_count = 0
-    for item_id in id_list:
-        if await TotpService.delete(item_id, user):
-            deleted_count += 1
+    deleted_count = sum((await TotpService.delete_many(id_list, user)).values())
 
     if len(id_list) == 1 and deleted_count == 0:
         raise HTTPException(status_code=404, detail="Item not found")
@@ -75,21 +101,75 @@ async def delete_items(request: Request, ids: str = Form(...), user=Depends(get_
 
 
 @router.get("/list-all")
-async def totp_list(user=Depends(get_authenticated_user)):
-    totps = await TotpService.list_all(user)
-    return JSONResponse(content=[
-        {"id": t["id"], "account": t["account"], "issuer": t["issuer"], "code": t["code"]}
-        for t in totps
-    ])
+async def totp_list(request: Request, fields: Optional[str] = None, include_codes: bool = True,
+                    ids: Optional[str] = None, sort: Optional[str] = None, q: Optional[str] = None,
+                    limit: Optional[int] = None, cursor: Optional[str] = None, user=Depends(get_authenticated_user)):
+    options = parse_list_options(OWNED_FIELDS, fields or "account,issuer,code,period", include_codes, ids)
+    page = parse_page_options(sort, q, limit, cursor)
+    etag = list_etag(request, user, "list_all", options.include_codes)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    result = await coalesce_for_user(user, f"list_all:{options.key}:{page.key}",
+                                     lambda: TotpService.list_page(user, options.include_codes, options.ids, page))
+    return JSONResponse(content=options.project(result["items"]),
+                        headers={**etag_headers(etag), **next_page_headers(request, result["next_cursor"])})
 
 
 @router.get("/list-shared-with-me")
-async def shared_totp_list(user=Depends(get_authenticated_user)):
-    totps = await TotpService.list_shared_with_me(user)
-    return JSONResponse(content=[
-        {"id": t["id"], "account": t["account"], "owner_email": t["owner_email"], "issuer": t["issuer"], "code": t["code"]}
-        for t in totps
-    ])
+async def shared_totp_list(request: Request, fields: Optional[str] = None, include_codes: bool = True,
+                           ids: Optional[str] = None, sort: Optional[str] = None, q: Optional[str] = None,
+                           limit: Optional[int] = None, cursor: Optional[str] = None,
+                           user=Depends(get_authenticated_user)):
+    options = parse_list_options(SHARED_FIELDS, fields or "account,owner_email,issuer,code,period", include_codes, ids)
+    page = parse_page_options(sort, q, limit, cursor)
+    etag = list_etag(request, user, "list_shared_with_me", options.include_codes)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    result = await coalesce_for_user(user, f"list_shared_with_me:{options.key}:{page.key}",
+                                     lambda: TotpService.list_shared_page(user, options.include_codes, options.ids, page))
+    return JSONResponse(content=options.project(result["items"]),
+                        headers={**etag_headers(etag), **next_page_headers(request, result["next_cursor"])})
+
+
+@router.get("/codes")
+async def totp_codes(request: Request, ids: Optional[str] = None, user=Depends(get_authenticated_user)):
+    id_filter = parse_ids(ids)
+    etag = list_etag(request, user, "list_codes")
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    codes = await coalesce_for_user(user, f"list_codes:{id_filter}", lambda: TotpService.list_codes(user, id_filter))
+    return JSONResponse(content={
+        "items": [
+            {"id": t["id"], "account": t["account"], "issuer": t["issuer"], "code": t["code"], "period": t["period"],
+             "seconds_left": t["seconds_left"]}
+            for t in codes["items"]
+        ],
+        "shared": [
+            {"id": t["id"], "account": t["account"], "owner_email": t["owner_email"], "issuer": t["issuer"],
+             "code": t["code"], "period": t["period"], "seconds_left": t["seconds_left"]}
+            for t in codes["shared"]
+        ],
+        "server_time": codes["server_time"],
+        "seconds_left": codes["seconds_left"],
+    }, headers=etag_headers(etag))
+
+
+@router.get("/stream")
+async def totp_stream(request: Request, ids: Optional[str] = None, user=Depends(get_authenticated_user)):
+    # The stream lives until the access token expires or the session is logged out;
+    # EventSource then reconnects through the normal token refresh
+    session_id = getattr(request.state, "current_sid", None)
+
+    async def revalidate():
+        nonlocal session_id
+        live = await SessionService.get_live_session(session_id) if session_id else None
+        if live is None:
+            return None
+        session_id, current = live
+        return current
+
+    return code_stream_hub.open_stream(request, user, parse_ids(ids), revalidate,
+                                       getattr(request.state, "access_expires_at", None))
 
 
 @router.post("/export")
@@ -100,7 +180,11 @@ async def export_qr(request: Request, ids: str = Form(...), user=Depends(get_aut
         flash(request, "No items selected to export.", "error")
         return RedirectResponse(router.url_path_for("get_list"), status_code=status.HTTP_303_SEE_OTHER)
 
-    png_bytes = build_qr_png(raw_items)
+    try:
+        png_bytes = build_qr_png(raw_items)
+    except ValueError as e:
+        flash(request, str(e), "error")
+        return RedirectResponse(router.url_path_for("get_list"), status_code=status.HTTP_303_SEE_OTHER)
     return StreamingResponse(io.BytesIO(png_bytes), media_type="image/png",
                              headers={"Content-Disposition": 'inline; filename="totp_export.png"'})
 
@@ -126,11 +210,19 @@ async def share_totp(request: Request, totp_ids: str = Form(...), email: str = F
         flash(request, "Invalid TOTP IDs.", "error")
         return RedirectResponse(router.url_path_for("get_list"), status_code=status.HTTP_303_SEE_OTHER)
 
-    shared_count, message = await TotpService.share_totp(id_list, email.strip(), user)
+    # The form field accepts several comma separated recipients
+    shared_count, message = await TotpService.share_totp(id_list, email.split(","), user)
     flash(request, message, "success" if shared_count > 0 else "error")
     return RedirectResponse(router.url_path_for("get_list"), status_code=status.HTTP_303_SEE_OTHER)
 
 
+@router.get("/recipients", response_class=JSONResponse)
+async def suggest_recipients(q: str = "", user=Depends(get_authenticated_user)):
+    if len(q) > AppConstants.MAX_SEARCH_LENGTH:
+        return JSONResponse({"message": "Search query is too long", "category": "error"}, status_code=400)
+    return JSONResponse({"emails": await RecipientService.suggest(user, q)})
+
+
 @router.get("/shared-users/{totp_id}", response_class=JSONResponse)
 async def get_shared_users(totp_id: int, user=Depends(get_authenticated_user)):
     emails, error = await TotpService.get_shared_users(totp_id, user)
@@ -1,14 +1,10 @@
 from fastapi import HTTPException, status, Header
-from typing import Optional
-from models import User
+from typing import Optional, Tuple
+from models import ApiKey, User
 from services.api_key_service import ApiKeyService
 
 
-async def get_user_from_api_key(authorization: Optional[str] = Header(None)) -> User:
-    """
-    Dependency for API key authentication (Bearer token)
-    Usage: user: User = Depends(get_user_from_api_key)
-    """
+async def _validate_authorization(authorization: Optional[str]) -> Tuple[ApiKey, User]:
     if not authorization:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -24,13 +20,29 @@ async def get_user_from_api_key(authorization: Optional[str] = Header(None)) ->
         )
     
     api_key = parts[1]
-    user = await ApiKeyService.validate_api_key(api_key)
+    row = await ApiKeyService.validate_api_key_record(api_key)
     
-    if not user:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key"
         )
     
+    return row
+
+
+async def get_user_from_api_key(authorization: Optional[str] = Header(None)) -> User:
+    """
+    Dependency for API key authentication (Bearer token)
+    Usage: user: User = Depends(get_user_from_api_key)
+    """
+    _, user = await _validate_authorization(authorization)
     return user
 
+
+async def get_api_key_and_user(authorization: Optional[str] = Header(None)) -> Tuple[ApiKey, User]:
+    """
+    Dependency for API key authentication that also returns the key itself
+    Usage: api_key, user = Depends(get_api_key_and_user)
+    """
+    return await _validate_authorization(authorization)
@@ -50,6 +50,15 @@ class ApiKeyService:
         Validate API key and return user
         Returns: User if key is valid, None otherwise
         """
+        row = await ApiKeyService.validate_api_key_record(api_key)
+        return row[1] if row else None
+
+    @staticmethod
+    async def validate_api_key_record(api_key: str) -> Optional[Tuple[ApiKey, User]]:
+        """
+        Validate API key and return it together with its user
+        Returns: (api_key_object, user) if key is valid, None otherwise
+        """
         key_hash = hash_api_key(api_key)
         
         async with async_session() as session:
@@ -80,7 +89,24 @@ class ApiKeyService:
             )
             await session.commit()
             
-            return user
+            return api_key_obj, user
+
+    @staticmethod
+    async def get_active_key_user(key_id: int) -> Optional[User]:
+        """
+        User of an API key that is still valid, used to re-check long-lived connections
+        Returns: User if the key is not revoked and its user is active, None otherwise
+        """
+        async with async_session() as session:
+            result = await session.execute(
+                select(User)
+                .join(ApiKey, ApiKey.user_id == User.id)
+                .where(ApiKey.id == key_id, ApiKey.revoked_at.is_(None))
+            )
+            user = result.scalars().first()
+        if not user or not user.is_active or not user.is_verified:
+            return None
+        return user
 
     @staticmethod
     async def revoke_api_key(key_id: int, user: User) -> bool:
@@ -167,7 +193,8 @@ class ApiKeyService:
                     "created_at": key.created_at,
                     "last_used_at": key.last_used_at,
                     "is_revoked": key.revoked_at is not None,
-                    "revoked_at": key.revoked_at
+                    "revoked_at": key.revoked_at,
+                    "sync_enabled": key.device_public_key is not None
                 }
                 for key in api_keys
             ]
@@ -9,6 +9,7 @@ from passlib.context import CryptContext
 from config import settings, async_session
 from models import User, Session as SessionDB
 import hashlib
+import time
 import uuid
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -144,6 +145,7 @@ async def try_refresh_from_cookies(request: Request) -> Optional[User]:
             )
     request.state.new_tokens = (access, new_refresh)
     request.state.current_sid = new_sid
+    request.state.access_expires_at = time.time() + settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
     return user
 
 async def get_authenticated_user(request: Request) -> User:
@@ -160,6 +162,7 @@ async def get_authenticated_user(request: Request) -> User:
             sid = payload.get("sid")
             if sid:
                 request.state.current_sid = sid
+            request.state.access_expires_at = payload.get("exp")
     except ExpiredSignatureError:
         user = await try_refresh_from_cookies(request)
         if user:
@@ -0,0 +1,102 @@
+from typing import Tuple
+import logging
+from config import async_session
+from models import User
+from services.dek_cache import get_user_fernet
+from services.recipient_service import recent_recipients
+from services.totp_service import TotpService
+from services.validator import validate_totp
+
+BATCH_OPERATIONS = ("create", "update", "delete", "share", "unshare")
+_REQUIRED_FIELDS = {
+    "create": ("account", "issuer", "secret"),
+    "update": ("id", "account"),
+    "delete": ("id",),
+    "share": ("ids",),
+    "unshare": ("id", "email"),
+}
+
+
+class BatchService:
+    @staticmethod
+    async def run(user: User, operations: list[dict], atomic: bool = True) -> Tuple[bool, list[dict]]:
+        """
+        Run create / update / delete / share / unshare operations in one transaction
+        with the owner's DEK unwrapped once. Each operation runs in a savepoint, so a
+        failed or raising operation leaves no partial writes. With atomic=True any
+        failure rolls the whole batch back and the other results are marked rolled
+        back; otherwise failed operations are skipped.
+        Returns: (committed, one result per operation)
+        """
+        user_fernet = get_user_fernet(user)
+        results = []
+        touched = set()
+        async with async_session() as session:
+            for index, operation in enumerate(operations):
+                savepoint = await session.begin_nested()
+                try:
+                    result = await BatchService._apply(session, user, user_fernet, operation)
+                except Exception as e:
+                    logging.error(f"Batch operation {index} ({operation['op']}) failed: {e}")
+                    result = {"success": False, "message": "Operation failed."}
+                if result["success"]:
+                    await savepoint.commit()
+                    if operation["op"] != "create":
+                        touched.update(operation.get("ids") or [operation["id"]])
+                else:
+                    await savepoint.rollback()
+                results.append({"index": index, "op": operation["op"], **result})
+
+            committed = not atomic or all(result["success"] for result in results)
+            if committed:
+                await session.commit()
+            else:
+                await session.rollback()
+                results = [
+                    {"index": result["index"], "op": result["op"], "success": False, "rolled_back": True,
+                     "message": "Rolled back: another operation in the batch failed."}
+                    if result["success"] else result
+                    for result in results
+                ]
+
+        if committed:
+            TotpService.invalidate_items(touched)
+            if any(result["success"] and result["op"] in ("share", "unshare", "delete") for result in results):
+                recent_recipients.discard(user.id)
+        return committed, results
+
+    @staticmethod
+    async def _apply(session, user: User, user_fernet, operation: dict) -> dict:
+        op = operation["op"]
+        missing = [name for name in _REQUIRED_FIELDS[op] if operation.get(name) in (None, "", [])]
+        if missing:
+            return {"success": False, "message": f"Missing field(s): {', '.join(missing)}."}
+
+        if op == "create":
+            error = validate_totp(operation["account"], operation["issuer"], operation["secret"],
+                                  operation["algorithm"], operation["digits"], operation["period"])
+            if error:
+                return {"success": False, "message": error}
+            totp_item = await TotpService._create_tx(
+                session, user, user_fernet, operation["account"], operation["issuer"], operation["secret"],
+                operation["algorithm"], operation["digits"], operation["period"]
+            )
+            return {"success": True, "id": totp_item.id, "message": "TOTP created successfully"}
+
+        if op == "update":
+            success, message = await TotpService._update_tx(session, operation["id"], operation["account"], user)
+            return {"success": success, "message": message}
+
+        if op == "delete":
+            success = await TotpService._delete_tx(session, operation["id"], user)
+            return {"success": success, "message": "TOTP deleted successfully" if success else "TOTP item not found."}
+
+        if op == "share":
+            emails = (operation.get("emails") or []) + ([operation["email"]] if operation.get("email") else [])
+            if not emails:
+                return {"success": False, "message": "Missing field(s): email or emails."}
+            shared_count, message, _ = await TotpService._share_tx(session, operation["ids"], emails, user, user_fernet)
+            return {"success": shared_count > 0, "shared_count": shared_count, "message": message}
+
+        success, message = await TotpService._unshare_tx(session, operation["id"], operation["email"], user)
+        return {"success": success, "message": message}
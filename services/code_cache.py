@@ -0,0 +1,103 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+from constants import AppConstants
+
+
+def current_step(period: int = AppConstants.TOTP_PERIOD, now: Optional[float] = None) -> int:
+    """Return the TOTP time step for the given (or current) unix time"""
+    if now is None:
+        now = time.time()
+    return int(now // period)
+
+
+class CodeCache:
+    """
+    Bounded in-process cache of computed TOTP codes keyed by (item_id, step).
+    A code only depends on the item's secret and parameters, so owned and shared
+    rows of the same item reuse one entry. The step is counted in the item's own
+    period and entries expire at the end of it.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[int, int], Tuple[str, float, bool]]" = OrderedDict()
+        self._steps_by_item: Dict[int, Set[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Lookups made within BOUNDARY_WINDOW_SECONDS after their step started
+        self.boundary_hits = 0
+        self.boundary_misses = 0
+        self.precomputed_hits = 0
+
+    def get(self, item_id: int, step: int, now: Optional[float] = None,
+            period: int = AppConstants.TOTP_PERIOD, record: bool = True) -> Optional[str]:
+        """Return the cached code; record=False skips the counters (used by warmers)"""
+        if now is None:
+            now = time.time()
+        key = (item_id, step)
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] <= now:
+            self._remove(key)
+            entry = None
+        if record:
+            at_boundary = now - step * period < AppConstants.BOUNDARY_WINDOW_SECONDS
+            if entry is None:
+                self.misses += 1
+                self.boundary_misses += at_boundary
+            else:
+                self.hits += 1
+                self.boundary_hits += at_boundary
+                self.precomputed_hits += entry[2]
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, item_id: int, step: int, code: str, period: int = AppConstants.TOTP_PERIOD,
+            precomputed: bool = False):
+        key = (item_id, step)
+        self._entries[key] = (code, float((step + 1) * period), precomputed)
+        self._entries.move_to_end(key)
+        self._steps_by_item.setdefault(item_id, set()).add(step)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, item_ids: Iterable[int]):
+        """Drop every cached step of the given items"""
+        for item_id in item_ids:
+            for step in self._steps_by_item.pop(item_id, ()):
+                self._entries.pop((item_id, step), None)
+
+    def clear(self):
+        self._entries.clear()
+        self._steps_by_item.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "boundary_hits": self.boundary_hits,
+            "boundary_misses": self.boundary_misses,
+            "precomputed_hits": self.precomputed_hits,
+        }
+
+    def _remove(self, key: Tuple[int, int]):
+        self._entries.pop(key, None)
+        item_id, step = key
+        steps = self._steps_by_item.get(item_id)
+        if steps is not None:
+            steps.discard(step)
+            if not steps:
+                del self._steps_by_item[item_id]
+
+
+code_cache = CodeCache(AppConstants.CODE_CACHE_MAX_ENTRIES)
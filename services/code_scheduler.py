@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from constants import AppConstants
+from models import User
+
+# Every supported period has its step boundaries on multiples of this tick
+BOUNDARY_TICK = math.gcd(*AppConstants.TOTP_PERIODS)
+
+
+class BoundaryPrecomputer:
+    """
+    Background task that computes the next-step codes of recently active users
+    shortly before each step boundary, so the refresh spike at the boundary is
+    served from the code cache.
+    """
+
+    def __init__(self, hot_set_size: int, lead_seconds: float, active_window_seconds: int):
+        self.hot_set_size = hot_set_size
+        self.lead_seconds = lead_seconds
+        self.active_window_seconds = active_window_seconds
+        self._active: "OrderedDict[int, Tuple[User, float]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.failures = 0
+        self.users_warmed = 0
+        self.items_warmed = 0
+        self.last_duration_ms = 0.0
+
+    def touch(self, user: User):
+        """Record that the user just requested their codes"""
+        if self.hot_set_size <= 0:
+            return
+        self._active[user.id] = (user, time.monotonic())
+        self._active.move_to_end(user.id)
+        while len(self._active) > self.hot_set_size:
+            self._active.popitem(last=False)
+
+    def hot_users(self) -> list[User]:
+        cutoff = time.monotonic() - self.active_window_seconds
+        while self._active:
+            user_id, (_, last_seen) = next(iter(self._active.items()))
+            if last_seen >= cutoff:
+                break
+            del self._active[user_id]
+        return [user for user, _ in self._active.values()]
+
+    async def precompute(self, boundary: float):
+        from services.totp_service import TotpService
+
+        users = self.hot_users()
+        started = time.perf_counter()
+        items = await TotpService.precompute_codes(users, boundary)
+        self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.runs += 1
+        self.users_warmed += len(users)
+        self.items_warmed += items
+
+    def start(self):
+        if self.hot_set_size > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        from services.code_cache import code_cache
+
+        boundary_lookups = code_cache.boundary_hits + code_cache.boundary_misses
+        return {
+            "hot_users": len(self._active),
+            "hot_set_size": self.hot_set_size,
+            "lead_seconds": self.lead_seconds,
+            "runs": self.runs,
+            "failures": self.failures,
+            "users_warmed": self.users_warmed,
+            "items_warmed": self.items_warmed,
+            "last_duration_ms": self.last_duration_ms,
+            "boundary_coverage": round(code_cache.boundary_hits / boundary_lookups, 4) if boundary_lookups else 0.0,
+        }
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            boundary = (math.floor(now / BOUNDARY_TICK) + 1) * BOUNDARY_TICK
+            await asyncio.sleep(max(0.0, boundary - self.lead_seconds - now))
+            try:
+                await self.precompute(boundary)
+            except Exception:
+                self.failures += 1
+                logging.exception("Boundary precompute failed")
+            # Never run twice for the same boundary
+            await asyncio.sleep(max(0.0, boundary - time.time()))
+
+
+boundary_precomputer = BoundaryPrecomputer(
+    AppConstants.PRECOMPUTE_HOT_SET_SIZE,
+    AppConstants.PRECOMPUTE_LEAD_SECONDS,
+    AppConstants.PRECOMPUTE_ACTIVE_WINDOW_SECONDS,
+)
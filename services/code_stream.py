@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, FrozenSet, Optional
+from fastapi import HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from constants import AppConstants
+from models import User
+from services.code_scheduler import BOUNDARY_TICK
+
+# Give the step a moment to roll over before computing its codes
+BOUNDARY_DELAY_SECONDS = 0.05
+
+# Checks the credential a connection was opened with again: the current user, or None once it is revoked
+Revalidate = Callable[[], Awaitable[Optional[User]]]
+
+
+class _UserChannel:
+    def __init__(self, user: User):
+        self.user = user
+        # Queue -> item ids the connection displays, None for the whole vault
+        self.subscribers: Dict[asyncio.Queue, Optional[FrozenSet[int]]] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.last_payload: Optional[dict] = None
+
+    def wanted_ids(self) -> Optional[tuple[int, ...]]:
+        """Ids to compute for all connections, None when one of them shows the whole vault"""
+        wanted = set()
+        for ids in self.subscribers.values():
+            if ids is None:
+                return None
+            wanted |= ids
+        return tuple(sorted(wanted))
+
+
+class CodeStreamHub:
+    """
+    Fan-out of code updates to Server-Sent Events connections.
+    One producer task per user computes the codes right after each step
+    boundary and pushes them to every open connection of that user.
+    Every connection re-checks its credential each revalidate_seconds and is
+    closed once it is revoked, logged out or expired; the fresh user it returns
+    replaces the one the producer computes with.
+    """
+
+    def __init__(self, max_per_user: int, max_per_worker: int, heartbeat_seconds: int, revalidate_seconds: int):
+        self.max_per_user = max_per_user
+        self.max_per_worker = max_per_worker
+        self.heartbeat_seconds = heartbeat_seconds
+        self.revalidate_seconds = revalidate_seconds
+        self._channels: Dict[int, _UserChannel] = {}
+        self.connections = 0
+        self.rejected = 0
+        self.pushes = 0
+        self.expired = 0
+
+    def subscribe(self, user: User, ids: Optional[tuple[int, ...]] = None) -> asyncio.Queue:
+        channel = self._channels.get(user.id)
+        if self.connections >= self.max_per_worker or (channel and len(channel.subscribers) >= self.max_per_user):
+            self.rejected += 1
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too many open code streams")
+
+        if channel is None:
+            channel = self._channels[user.id] = _UserChannel(user)
+            channel.task = asyncio.create_task(self._produce(channel))
+        # Only the latest payload matters, a slow client skips intermediate ones
+        queue = asyncio.Queue(maxsize=1)
+        ids = frozenset(ids) if ids is not None else None
+        if channel.last_payload is not None:
+            queue.put_nowait(self._filter(channel.last_payload, ids))
+        channel.subscribers[queue] = ids
+        self.connections += 1
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        channel = self._channels.get(user_id)
+        if channel is None or queue not in channel.subscribers:
+            return
+        del channel.subscribers[queue]
+        self.connections -= 1
+        if not channel.subscribers:
+            channel.task.cancel()
+            del self._channels[user_id]
+
+    def open_stream(self, request: Request, user: User, ids: Optional[tuple[int, ...]], revalidate: Revalidate,
+                    expires_at: Optional[float] = None) -> StreamingResponse:
+        """
+        SSE response of one connection; the caps are checked before the response starts.
+        The stream ends when `revalidate` no longer returns a user or at the expires_at
+        unix time of the credential, whichever comes first.
+        """
+        queue = self.subscribe(user, ids)
+        return StreamingResponse(
+            self._events(request, user.id, queue, revalidate, expires_at),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def stop(self):
+        """Close every stream, used on application shutdown"""
+        for channel in list(self._channels.values()):
+            channel.task.cancel()
+            for queue in channel.subscribers:
+                self._offer(queue, None)
+        self._channels.clear()
+        self.connections = 0
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections,
+            "users": len(self._channels),
+            "max_per_user": self.max_per_user,
+            "max_per_worker": self.max_per_worker,
+            "rejected": self.rejected,
+            "pushes": self.pushes,
+            "expired": self.expired,
+        }
+
+    async def _events(self, request: Request, user_id: int, queue: asyncio.Queue, revalidate: Revalidate,
+                      expires_at: Optional[float]) -> AsyncIterator[str]:
+        next_check = time.monotonic() + self.revalidate_seconds
+        try:
+            yield f"retry: {self.heartbeat_seconds * 1000}\n\n"
+            while True:
+                heartbeat = False
+                try:
+                    payload = await asyncio.wait_for(queue.get(), timeout=self.heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    heartbeat = True
+                if expires_at is not None and time.time() >= expires_at:
+                    self.expired += 1
+                    break
+                if time.monotonic() >= next_check:
+                    if not await self._revalidate(revalidate):
+                        break
+                    next_check = time.monotonic() + self.revalidate_seconds
+                if heartbeat:
+                    yield ": heartbeat\n\n"
+                    continue
+                if payload is None:
+                    break
+                yield f"event: codes\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            self.unsubscribe(user_id, queue)
+
+    async def _revalidate(self, revalidate: Revalidate) -> bool:
+        try:
+            user = await revalidate()
+        except Exception:
+            logging.exception("Code stream credential check failed")
+            user = None
+        if user is None:
+            self.expired += 1
+            return False
+        channel = self._channels.get(user.id)
+        if channel is not None:
+            channel.user = user
+        return True
+
+    async def _produce(self, channel: _UserChannel):
+        from services.totp_service import TotpService
+
+        while True:
+            try:
+                # Only the items some connection displays are computed
+                codes = await TotpService.list_codes(channel.user, channel.wanted_ids())
+                previous = channel.last_payload
+                if previous is None or self._codes_key(codes) != self._codes_key(previous):
+                    for queue, ids in channel.subscribers.items():
+                        self._offer(queue, self._filter(codes, ids))
+                    self.pushes += 1
+                # Kept current so a new subscriber's first frame has a fresh countdown
+                channel.last_payload = codes
+            except Exception:
+                logging.exception(f"Code stream producer failed for user {channel.user.id}")
+            now = time.time()
+            boundary = (math.floor(now / BOUNDARY_TICK) + 1) * BOUNDARY_TICK
+            await asyncio.sleep(boundary - now + BOUNDARY_DELAY_SECONDS)
+
+    @staticmethod
+    def _codes_key(payload: dict) -> tuple:
+        # seconds_left and server_time change on every call; only the codes decide a push
+        return tuple(
+            tuple((item["id"], item["code"]) for item in payload[kind])
+            for kind in ("items", "shared")
+        )
+
+    @staticmethod
+    def _filter(payload: dict, ids: Optional[FrozenSet[int]]) -> dict:
+        if ids is None:
+            return payload
+        return {
+            **payload,
+            "items": [item for item in payload["items"] if item["id"] in ids],
+            "shared": [item for item in payload["shared"] if item["id"] in ids],
+        }
+
+    @staticmethod
+    def _offer(queue: asyncio.Queue, payload: Optional[dict]):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(payload)
+
+
+code_stream_hub = CodeStreamHub(
+    AppConstants.STREAM_MAX_PER_USER,
+    AppConstants.STREAM_MAX_PER_WORKER,
+    AppConstants.STREAM_HEARTBEAT_SECONDS,
+    AppConstants.STREAM_REVALIDATE_SECONDS,
+)
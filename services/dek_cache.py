@@ -0,0 +1,89 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+from cryptography.fernet import Fernet, MultiFernet
+from config import master_fernet
+from constants import AppConstants
+from models import User
+
+
+def dek_fingerprint(encrypted_dek: str, previous_encrypted_dek: Optional[str] = None) -> str:
+    """Short fingerprint of a wrapped DEK, changes whenever the DEK is re-wrapped or rotated"""
+    raw = f"{encrypted_dek}:{previous_encrypted_dek or ''}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class DekCache:
+    """
+    Process-wide LRU cache of unwrapped user DEKs as ready Fernet instances.
+    Keyed by (user_id, encrypted_dek fingerprint) so a re-wrapped DEK never
+    hits a stale entry; entries also expire after ttl_seconds. While a DEK
+    rotation runs the entry is a MultiFernet that encrypts with the new DEK
+    and decrypts with both.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[Union[Fernet, MultiFernet], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_fernet(self, user: User) -> Union[Fernet, MultiFernet]:
+        key = (user.id, dek_fingerprint(user.encrypted_dek, user.previous_encrypted_dek))
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+            self.evictions += 1
+
+        self.misses += 1
+        fernet = Fernet(master_fernet.decrypt(user.encrypted_dek.encode()))
+        if user.previous_encrypted_dek:
+            fernet = MultiFernet([fernet, Fernet(master_fernet.decrypt(user.previous_encrypted_dek.encode()))])
+        self._entries[key] = (fernet, now + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        self._evict(now)
+        return fernet
+
+    def invalidate_user(self, user_id: int):
+        """Drop cached DEKs of a user, call after the user's DEK changes"""
+        for key in [k for k in self._entries if k[0] == user_id]:
+            del self._entries[key]
+
+    def clear(self):
+        """Drop everything, call after the master key changes"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _evict(self, now: float):
+        while self._entries:
+            key, (_, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+
+dek_cache = DekCache(AppConstants.DEK_CACHE_MAX_ENTRIES, AppConstants.DEK_CACHE_TTL_SECONDS)
+
+
+def get_user_fernet(user: User) -> Union[Fernet, MultiFernet]:
+    return dek_cache.get_fernet(user)
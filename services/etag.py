@@ -0,0 +1,35 @@
+import hashlib
+from fastapi import Request
+from fastapi.responses import Response
+from models import User
+from services.code_cache import current_step
+from services.code_scheduler import BOUNDARY_TICK
+
+
+def list_etag(request: Request, user: User, listing: str, with_codes: bool = True) -> str:
+    """
+    Strong ETag of a code listing: it only changes when the user's vault
+    version moves, the time step rolls over or the query string differs.
+    Listings without codes do not depend on the time step.
+    """
+    step = current_step(BOUNDARY_TICK) if with_codes else "-"
+    raw = f"{user.id}:{user.vault_version}:{step}:{listing}:{request.url.query}"
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def etag_headers(etag: str) -> dict:
+    # no-cache makes browsers revalidate every time instead of reusing stale codes
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=etag_headers(etag))
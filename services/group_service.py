@@ -0,0 +1,280 @@
+from typing import Optional, Union
+from cryptography.fernet import Fernet
+from sqlalchemy import select, delete, func, insert
+from sqlalchemy.exc import IntegrityError
+from config import async_session
+from models import Group, GroupMember, GroupTOTP, TOTPItem, User
+from services.dek_cache import get_user_fernet
+from services.totp_service import TotpService
+from utils import unique_emails
+
+
+class GroupService:
+    """
+    Team sharing: a group has its own Fernet key, wrapped once with each member's
+    DEK. Items shared with the group have their item key wrapped once with the
+    group key, so adding a member or sharing an item is one key wrap, whatever
+    the size of the team.
+    """
+
+    @staticmethod
+    async def _membership(session, group_id: int, user: User) -> tuple[Optional[Group], Optional[GroupMember]]:
+        result = await session.execute(
+            select(Group, GroupMember)
+            .outerjoin(GroupMember, (GroupMember.group_id == Group.id) & (GroupMember.user_id == user.id))
+            .where(Group.id == group_id)
+        )
+        row = result.first()
+        return (row[0], row[1]) if row else (None, None)
+
+    @staticmethod
+    async def _item_ids(session, group_id: int) -> list[int]:
+        result = await session.execute(select(GroupTOTP.totp_item_id).where(GroupTOTP.group_id == group_id))
+        return result.scalars().all()
+
+    @staticmethod
+    async def _member_ids(session, group_id: int) -> list[int]:
+        result = await session.execute(select(GroupMember.user_id).where(GroupMember.group_id == group_id))
+        return result.scalars().all()
+
+    @staticmethod
+    async def create_group(name: str, user: User) -> Group:
+        """Create a group with a fresh key; the creator is its owner and first member"""
+        group_key = Fernet.generate_key()
+        async with async_session() as session:
+            group = Group(name=name, owner_id=user.id)
+            session.add(group)
+            await session.flush()
+            session.add(GroupMember(
+                group_id=group.id, user_id=user.id,
+                encrypted_group_key=get_user_fernet(user).encrypt(group_key).decode()
+            ))
+            await session.commit()
+            return group
+
+    @staticmethod
+    async def list_groups(user: User) -> list[dict]:
+        """Groups the user belongs to, with member and item counts"""
+        async with async_session() as session:
+            member_count = (
+                select(func.count(GroupMember.id)).where(GroupMember.group_id == Group.id)
+                .correlate(Group).scalar_subquery()
+            )
+            item_count = (
+                select(func.count(GroupTOTP.id)).where(GroupTOTP.group_id == Group.id)
+                .correlate(Group).scalar_subquery()
+            )
+            result = await session.execute(
+                select(Group, User.email, member_count.label("member_count"), item_count.label("item_count"))
+                .join(GroupMember, GroupMember.group_id == Group.id)
+                .join(User, Group.owner_id == User.id)
+                .where(GroupMember.user_id == user.id)
+                .order_by(Group.name, Group.id)
+            )
+            return [{
+                "id": group.id,
+                "name": group.name,
+                "owner_email": owner_email,
+                "is_owner": group.owner_id == user.id,
+                "member_count": members,
+                "item_count": items
+            } for group, owner_email, members, items in result.all()]
+
+    @staticmethod
+    async def get_members(group_id: int, user: User):
+        """Member emails of a group the user belongs to, None when it is not visible"""
+        async with async_session() as session:
+            group, membership = await GroupService._membership(session, group_id, user)
+            if membership is None:
+                return None
+            result = await session.execute(
+                select(User.email).join(GroupMember, GroupMember.user_id == User.id)
+                .where(GroupMember.group_id == group_id)
+                .order_by(User.email)
+            )
+            return result.scalars().all()
+
+    @staticmethod
+    async def add_members(group_id: int, emails: Union[str, list[str]], user: User):
+        """
+        Add members: the group key is unwrapped once and wrapped once per new member,
+        no item secret is touched.
+        Returns: (number of members added, message)
+        """
+        if isinstance(emails, str):
+            emails = [emails]
+        emails = unique_emails(emails)
+        if not emails:
+            return 0, "No members given."
+
+        async with async_session() as session:
+            group, membership = await GroupService._membership(session, group_id, user)
+            if group is None or membership is None or group.owner_id != user.id:
+                return 0, "Group not found."
+
+            result = await session.execute(select(User).where(User.email.in_(emails)))
+            users = {member.email.lower(): member for member in result.scalars().all()}
+            missing = [email for email in emails if email.lower() not in users]
+            if missing:
+                return 0, f"Users with these emails do not exist: {', '.join(missing)}."
+
+            existing = set(await GroupService._member_ids(session, group_id))
+            new_members = [member for member in users.values() if member.id not in existing]
+            if not new_members:
+                return 0, "Already members of the group."
+
+            group_key = get_user_fernet(user).decrypt(membership.encrypted_group_key.encode())
+            try:
+                await session.execute(insert(GroupMember), [{
+                    "group_id": group_id,
+                    "user_id": member.id,
+                    "encrypted_group_key": get_user_fernet(member).encrypt(group_key).decode()
+                } for member in new_members])
+                await TotpService._record_changes(
+                    session, "shared", await GroupService._item_ids(session, group_id), [m.id for m in new_members]
+                )
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                return 0, "Group membership changed in the meantime, please try again."
+            return len(new_members), f"Added {len(new_members)} member(s)."
+
+    @staticmethod
+    async def remove_member(group_id: int, email: str, user: User):
+        """
+        Remove a member; the owner removes anyone but themselves, members can leave.
+        The member's own items leave the group with them.
+        Returns: (success, message)
+        """
+        async with async_session() as session:
+            group, membership = await GroupService._membership(session, group_id, user)
+            if group is None or membership is None:
+                return False, "Group not found."
+            result = await session.execute(select(User).where(User.email == email))
+            member = result.scalars().first()
+            if member is None or (member.id != user.id and group.owner_id != user.id):
+                return False, "Member not found."
+            if member.id == group.owner_id:
+                return False, "The owner cannot leave the group, delete it instead."
+
+            result = await session.execute(
+                delete(GroupMember).where(GroupMember.group_id == group_id, GroupMember.user_id == member.id)
+            )
+            if result.rowcount == 0:
+                return False, "Member not found."
+            item_ids = await GroupService._item_ids(session, group_id)
+            await TotpService._record_changes(session, "unshared", item_ids, [member.id])
+
+            # Without a membership the former member could not take their items back
+            result = await session.execute(
+                select(TOTPItem.id).where(TOTPItem.id.in_(item_ids), TOTPItem.user_id == member.id)
+            )
+            own_ids = result.scalars().all()
+            if own_ids:
+                await session.execute(
+                    delete(GroupTOTP).where(GroupTOTP.group_id == group_id, GroupTOTP.totp_item_id.in_(own_ids))
+                )
+                await TotpService._record_changes(
+                    session, "unshared", own_ids, await GroupService._member_ids(session, group_id)
+                )
+            await session.commit()
+            return True, "Member removed."
+
+    @staticmethod
+    async def share_items(group_id: int, totp_ids: list[int], user: User):
+        """
+        Share owned items with a group the user belongs to, each item key wrapped once
+        with the group key.
+        Returns: (number of items shared, message)
+        """
+        async with async_session() as session:
+            group, membership = await GroupService._membership(session, group_id, user)
+            if group is None or membership is None:
+                return 0, "Group not found."
+
+            # Locked so a concurrent share cannot give a legacy item a different item key
+            result = await session.execute(
+                select(TOTPItem).where(TOTPItem.id.in_(totp_ids), TOTPItem.user_id == user.id).with_for_update()
+            )
+            totp_items = result.scalars().all()
+            if not totp_items:
+                return 0, "No valid TOTP items found."
+            existing = set(await GroupService._item_ids(session, group_id))
+            totp_items = [totp_item for totp_item in totp_items if totp_item.id not in existing]
+            if not totp_items:
+                return 0, "Already shared with the group."
+
+            user_fernet = get_user_fernet(user)
+            group_fernet = Fernet(user_fernet.decrypt(membership.encrypted_group_key.encode()))
+            try:
+                await session.execute(insert(GroupTOTP), [{
+                    "group_id": group_id,
+                    "totp_item_id": totp_item.id,
+                    "encrypted_item_key": group_fernet.encrypt(
+                        TotpService._ensure_item_key(totp_item, user_fernet)
+                    ).decode()
+                } for totp_item in totp_items])
+                await TotpService._record_changes(
+                    session, "shared", [totp_item.id for totp_item in totp_items],
+                    await GroupService._member_ids(session, group_id)
+                )
+                await session.commit()
+            except IntegrityError:
+                await session.rollback()
+                return 0, "Sharing changed in the meantime, please try again."
+            return len(totp_items), f"Shared {len(totp_items)} item(s) with {group.name}."
+
+    @staticmethod
+    async def unshare_items(group_id: int, totp_ids: list[int], user: User):
+        """
+        Remove items from a group: the item owner or the group owner may do so.
+        Returns: (number of items removed, message)
+        """
+        async with async_session() as session:
+            group, membership = await GroupService._membership(session, group_id, user)
+            if group is None or membership is None:
+                return 0, "Group not found."
+
+            query = (
+                select(GroupTOTP.totp_item_id)
+                .join(TOTPItem, TOTPItem.id == GroupTOTP.totp_item_id)
+                .where(GroupTOTP.group_id == group_id, GroupTOTP.totp_item_id.in_(totp_ids))
+            )
+            if group.owner_id != user.id:
+                query = query.where(TOTPItem.user_id == user.id)
+            item_ids = (await session.execute(query)).scalars().all()
+            if not item_ids:
+                return 0, "No shared items found."
+
+            result = await session.execute(select(TOTPItem.user_id).where(TOTPItem.id.in_(item_ids)))
+            owner_ids = set(result.scalars().all())
+            member_ids = await GroupService._member_ids(session, group_id)
+            await session.execute(
+                delete(GroupTOTP).where(GroupTOTP.group_id == group_id, GroupTOTP.totp_item_id.in_(item_ids))
+            )
+            await TotpService._record_changes(session, "unshared", item_ids, {*member_ids, *owner_ids})
+            await session.commit()
+            return len(item_ids), f"Removed {len(item_ids)} item(s) from {group.name}."
+
+    @staticmethod
+    async def delete_group(group_id: int, user: User):
+        """
+        Delete a group owned by the user, with its memberships and item shares.
+        Returns: (success, message)
+        """
+        async with async_session() as session:
+            group, _ = await GroupService._membership(session, group_id, user)
+            if group is None or group.owner_id != user.id:
+                return False, "Group not found."
+
+            item_ids = await GroupService._item_ids(session, group_id)
+            member_ids = await GroupService._member_ids(session, group_id)
+            if item_ids:
+                result = await session.execute(select(TOTPItem.user_id).where(TOTPItem.id.in_(item_ids)))
+                member_ids = {*member_ids, *result.scalars().all()}
+            await session.execute(delete(GroupTOTP).where(GroupTOTP.group_id == group_id))
+            await session.execute(delete(GroupMember).where(GroupMember.group_id == group_id))
+            await session.execute(delete(Group).where(Group.id == group_id))
+            await TotpService._record_changes(session, "unshared", item_ids, member_ids)
+            await session.commit()
+            return True, "Group deleted."
@@ -0,0 +1,183 @@
+import asyncio
+import hashlib
+import logging
+import secrets
+from datetime import timedelta
+from typing import Awaitable, Callable, Union
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from config import async_session
+from constants import AppConstants
+from models import IdempotencyKey, User
+from services.auth import now_utc
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+class IdempotencyService:
+    @staticmethod
+    async def run(request: Request, user: User, handler: Callable[[], Awaitable[Response]]) -> Response:
+        """
+        Run a mutating handler at most once per Idempotency-Key.
+        A retry with the same key and request replays the stored response without
+        calling the handler; only successful responses are stored, so failed
+        attempts can be retried. Requests without the header run as usual.
+        """
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return await handler()
+        key = key.strip()
+        if not key or len(key) > AppConstants.MAX_IDEMPOTENCY_KEY_LENGTH:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{IDEMPOTENCY_HEADER} must be 1-{AppConstants.MAX_IDEMPOTENCY_KEY_LENGTH} characters"
+            )
+
+        fingerprint = hashlib.sha256(
+            b"\n".join([request.method.encode(), request.url.path.encode(), await request.body()])
+        ).hexdigest()
+
+        claim = await IdempotencyService._claim(user, key, fingerprint)
+        if isinstance(claim, Response):
+            return claim
+
+        heartbeat = asyncio.create_task(IdempotencyService._heartbeat(user, key, claim))
+        try:
+            response = await handler()
+        except BaseException:
+            await IdempotencyService._release(user, key, claim)
+            raise
+        finally:
+            heartbeat.cancel()
+
+        if 200 <= response.status_code < 300 and isinstance(response, JSONResponse):
+            await IdempotencyService._store(user, key, claim, response)
+        else:
+            await IdempotencyService._release(user, key, claim)
+        return response
+
+    @staticmethod
+    async def _claim(user: User, key: str, fingerprint: str) -> Union[str, Response]:
+        """
+        Reserve the key and return the claim id, or return the stored response of an
+        earlier identical request
+        """
+        now = now_utc()
+        claim_id = secrets.token_hex(16)
+        async with async_session() as session:
+            # Expired keys of this user are dropped on the way, which keeps the table bounded
+            await session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.user_id == user.id, IdempotencyKey.expires_at <= now)
+            )
+            session.add(IdempotencyKey(
+                user_id=user.id,
+                key=key,
+                fingerprint=fingerprint,
+                claim_id=claim_id,
+                heartbeat_at=now,
+                expires_at=now + timedelta(seconds=AppConstants.IDEMPOTENCY_TTL_SECONDS)
+            ))
+            try:
+                await session.commit()
+                return claim_id
+            except IntegrityError:
+                await session.rollback()
+
+            result = await session.execute(
+                select(IdempotencyKey).where(IdempotencyKey.user_id == user.id, IdempotencyKey.key == key)
+            )
+            record = result.scalars().first()
+
+        if record is None:
+            # The first request failed and released the key in the meantime
+            return await IdempotencyService._claim(user, key, fingerprint)
+        if record.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail=f"{IDEMPOTENCY_HEADER} was already used for a different request"
+            )
+        if record.status_code is None:
+            if await IdempotencyService._take_over(record, claim_id):
+                return claim_id
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"A request with this {IDEMPOTENCY_HEADER} is still being processed"
+            )
+        return Response(
+            content=record.response_body,
+            status_code=record.status_code,
+            media_type="application/json",
+            headers={"Idempotent-Replayed": "true"}
+        )
+
+    @staticmethod
+    async def _take_over(record: IdempotencyKey, claim_id: str) -> bool:
+        """
+        Move an abandoned claim to claim_id in one guarded UPDATE, so of several
+        retries racing for it exactly one wins and a live claim is never taken
+        """
+        now = now_utc()
+        abandoned = now - timedelta(seconds=AppConstants.IDEMPOTENCY_ABANDONED_SECONDS)
+        async with async_session() as session:
+            result = await session.execute(
+                update(IdempotencyKey)
+                .where(
+                    IdempotencyKey.id == record.id,
+                    IdempotencyKey.status_code.is_(None),
+                    or_(IdempotencyKey.heartbeat_at < abandoned,
+                        IdempotencyKey.heartbeat_at.is_(None) & (IdempotencyKey.created_at < abandoned))
+                )
+                .values(claim_id=claim_id, heartbeat_at=now)
+            )
+            await session.commit()
+            return result.rowcount == 1
+
+    @staticmethod
+    async def _heartbeat(user: User, key: str, claim_id: str):
+        """Keep the claim alive while its request runs; stops once the claim is lost"""
+        while True:
+            await asyncio.sleep(AppConstants.IDEMPOTENCY_HEARTBEAT_SECONDS)
+            try:
+                async with async_session() as session:
+                    result = await session.execute(
+                        update(IdempotencyKey)
+                        .where(IdempotencyKey.user_id == user.id, IdempotencyKey.key == key,
+                               IdempotencyKey.claim_id == claim_id)
+                        .values(heartbeat_at=now_utc())
+                    )
+                    await session.commit()
+                if result.rowcount == 0:
+                    return
+            except Exception:
+                logging.exception("Failed to refresh idempotency claim")
+
+    @staticmethod
+    async def _store(user: User, key: str, claim_id: str, response: JSONResponse):
+        try:
+            async with async_session() as session:
+                await session.execute(
+                    update(IdempotencyKey)
+                    .where(IdempotencyKey.user_id == user.id, IdempotencyKey.key == key,
+                           IdempotencyKey.claim_id == claim_id)
+                    .values(status_code=response.status_code, response_body=response.body.decode("utf-8"))
+                )
+                await session.commit()
+        except Exception:
+            # The mutation already happened; a lost record only means a retry is not deduplicated
+            logging.exception("Failed to store idempotent response")
+
+    @staticmethod
+    async def _release(user: User, key: str, claim_id: str):
+        """Drop the claim so the request can be retried, unless another request took it over"""
+        async with async_session() as session:
+            await session.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.user_id == user.id,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.claim_id == claim_id,
+                    IdempotencyKey.status_code.is_(None)
+                )
+            )
+            await session.commit()
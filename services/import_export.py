@@ -7,8 +7,30 @@ from services.otp_migration_pb2 import MigrationPayload
 ALG_MAP_INV = {'SHA1': 1, 'SHA256': 2, 'SHA512': 3}
 DIG_MAP_INV = {6: 1, 8: 2}
 TYPE_MAP_INV = {'hotp': 1, 'totp': 2}
+ALG_MAP = {0: 'SHA1', 1: 'SHA1', 2: 'SHA256', 3: 'SHA512', 4: 'MD5'}
+DIG_MAP = {0: 6, 1: 6, 2: 8}
+
+
+def _otp_params_query(t: dict) -> str:
+    # Only non-default parameters are written so plain SHA1/6/30 URIs stay unchanged
+    query = ""
+    if t.get('algorithm', 'SHA1') != 'SHA1':
+        query += f"&algorithm={t['algorithm']}"
+    if t.get('digits', 6) != 6:
+        query += f"&digits={t['digits']}"
+    if t.get('period', 30) != 30:
+        query += f"&period={t['period']}"
+    return query
+
+def unsupported_in_migration(items: list[dict]) -> list[dict]:
+    """Items a migration payload cannot carry: it has no period field, so only 30s items survive"""
+    return [t for t in items if t.get('period', 30) != 30]
 
 def build_migration_uri(items: list[dict]) -> str:
+    """
+    Single items export as an otpauth:// URI, several as one otpauth-migration:// payload.
+    Raises ValueError when several items include ones the payload cannot carry.
+    """
     if len(items) == 1:
         t = items[0]
         return (
@@ -16,6 +38,14 @@ def build_migration_uri(items: list[dict]) -> str:
             f"{urllib.parse.quote(t['issuer'])}:"
             f"{urllib.parse.quote(t['account'])}"
             f"?secret={t['secret']}&issuer={urllib.parse.quote(t['issuer'])}"
+            f"{_otp_params_query(t)}"
+        )
+    unsupported = unsupported_in_migration(items)
+    if unsupported:
+        names = ", ".join(f"{t['issuer']}:{t['account']}" for t in unsupported)
+        raise ValueError(
+            "A multi-item export cannot carry a period other than 30 seconds; "
+            f"export these items one at a time: {names}"
         )
     payload = MigrationPayload()
     payload.version = 1
@@ -59,6 +89,7 @@ def decode_migration_uri(uri: str) -> list[str]:
             uri    = (
                 f"otpauth://totp/{issuer}:{name}"
                 f"?secret={secret}&issuer={issuer}"
+                f"{_otp_params_query({'algorithm': ALG_MAP.get(otp.algorithm, 'SHA1'), 'digits': DIG_MAP.get(otp.digits, 6)})}"
             )
             results.append(uri)
         return results
@@ -48,14 +48,17 @@ class ImportExportService:
                 return False, "Secret not found in URI."
             
             issuer_qs = qs.get("issuer", [issuer_field])[0]
+            algorithm = qs.get("algorithm", ["SHA1"])[0].upper()
+            digits = int(qs.get("digits", ["6"])[0])
+            period = int(qs.get("period", ["30"])[0])
             
             # Validate TOTP data
-            error_msg = validate_totp(account, issuer_qs, secret)
+            error_msg = validate_totp(account, issuer_qs, secret, algorithm, digits, period)
             if error_msg:
                 return False, error_msg
             
             # Create TOTP item
-            await TotpService.create(account, issuer_qs, secret, user)
+            await TotpService.create(account, issuer_qs, secret, user, algorithm, digits, period)
             return True, None
             
         except Exception as e:
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Tuple, Union
+from cryptography.fernet import Fernet, MultiFernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from constants import AppConstants
+
+# Binary secret envelope: format byte | 12-byte nonce | AES-256-GCM ciphertext and tag
+SECRET_FORMAT_AESGCM = 1
+SECRET_NONCE_SIZE = 12
+SECRET_HKDF_INFO = b"totp-manager item secret v1"
+
+
+def new_item_key() -> bytes:
+    return Fernet.generate_key()
+
+
+class ItemKey:
+    """
+    Unwrapped item key with its ready cipher objects: Fernet for secrets still stored
+    as text tokens, AES-GCM (on a key derived with HKDF) for the binary envelope
+    """
+    __slots__ = ("fernet", "aead")
+
+    def __init__(self, raw: bytes):
+        self.fernet = Fernet(raw)
+        self.aead = AESGCM(HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=SECRET_HKDF_INFO).derive(raw))
+
+    def decrypt(self, token: bytes) -> bytes:
+        return self.fernet.decrypt(token)
+
+    def seal(self, secret: bytes) -> bytes:
+        nonce = os.urandom(SECRET_NONCE_SIZE)
+        return bytes([SECRET_FORMAT_AESGCM]) + nonce + self.aead.encrypt(nonce, secret, None)
+
+    def open(self, blob: bytes) -> bytes:
+        if not blob or blob[0] != SECRET_FORMAT_AESGCM:
+            raise ValueError("Unknown secret format")
+        return self.aead.decrypt(blob[1:1 + SECRET_NONCE_SIZE], blob[1 + SECRET_NONCE_SIZE:], None)
+
+
+def open_secret(key: Union[ItemKey, Fernet, MultiFernet], stored: Union[str, bytes]) -> bytes:
+    """Plain secret from either storage format: a binary envelope or a Fernet text token"""
+    if isinstance(stored, (bytes, bytearray, memoryview)):
+        return key.open(bytes(stored))
+    return key.decrypt(stored.encode())
+
+
+class ItemKeyCache:
+    """
+    Process-wide LRU cache of unwrapped per-item keys as ready ItemKey instances.
+    The item key is the same for the owner and every recipient, so one entry
+    serves them all whatever DEK or group key it was unwrapped with. Keyed by
+    (item_id, fingerprint of the item's stored secret) so a re-keyed or
+    recreated item never hits a stale entry; entries also expire after ttl_seconds.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[int, str], Tuple[ItemKey, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_key(self, item_id: int, stored_secret: Union[str, bytes], wrapped_item_key: str,
+                wrapping_fernet: Union[Fernet, MultiFernet]) -> ItemKey:
+        """Item key of an item the caller already proved access to, unwrapped on a miss"""
+        raw = stored_secret.encode("utf-8") if isinstance(stored_secret, str) else bytes(stored_secret)
+        key = (item_id, hashlib.sha256(raw).hexdigest()[:16])
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            del self._entries[key]
+            self.evictions += 1
+
+        self.misses += 1
+        item_key = ItemKey(wrapping_fernet.decrypt(wrapped_item_key.encode()))
+        self._entries[key] = (item_key, now + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        self._evict(now)
+        return item_key
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _evict(self, now: float):
+        while self._entries:
+            key, (_, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+            self.evictions += 1
+
+
+item_key_cache = ItemKeyCache(AppConstants.ITEM_KEY_CACHE_MAX_ENTRIES, AppConstants.ITEM_KEY_CACHE_TTL_SECONDS)
@@ -0,0 +1,346 @@
+"""
+Online rotation of the master key and of user DEKs.
+
+Master key: deploy ENCRYPTION_KEY=<new> and ENCRYPTION_KEY_PREVIOUS=<old> to every
+worker, then run
+
+    python -m services.key_rotation master
+
+Every wrapped DEK is re-wrapped with the new key while both keys are accepted.
+Remove ENCRYPTION_KEY_PREVIOUS once the run reports done.
+
+User DEK:
+
+    python -m services.key_rotation dek <user_id> [<user_id> ...]
+    python -m services.key_rotation dek --all
+
+The user gets a new DEK right away and keeps the old one as previous_encrypted_dek,
+so requests decrypt with both while their rows are re-encrypted. The old DEK is
+dropped at the end. With several users every DEK is swapped before any rows are
+re-encrypted, so the settle window is waited out once rather than once per user.
+
+Rows are processed in keyset-paginated batches with a bounded number of batches
+in flight, and progress is checkpointed in key_rotations: an interrupted run
+resumes where it stopped when started again.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from sqlalchemy import bindparam, select, update
+from config import async_session, master_fernet, master_fernets
+from constants import AppConstants
+from models import GroupMember, KeyRotation, SharedTOTP, TOTPItem, User
+from services.dek_cache import dek_cache
+from utils import generate_fernet_key
+
+
+@dataclass(frozen=True)
+class RotationTarget:
+    """One encrypted column, restricted to the rows a rotation covers"""
+    name: str
+    model: type
+    column: str
+    where: tuple = ()
+
+
+def master_targets() -> list[RotationTarget]:
+    return [
+        RotationTarget("users.encrypted_dek", User, "encrypted_dek"),
+        RotationTarget("users.previous_encrypted_dek", User, "previous_encrypted_dek",
+                       (User.previous_encrypted_dek.isnot(None),)),
+    ]
+
+
+def dek_targets(user_id: int) -> list[RotationTarget]:
+    """Every value encrypted directly with the user's DEK"""
+    return [
+        RotationTarget("totp_items.encrypted_item_key", TOTPItem, "encrypted_item_key",
+                       (TOTPItem.user_id == user_id, TOTPItem.encrypted_item_key.isnot(None))),
+        RotationTarget("totp_items.encrypted_secret", TOTPItem, "encrypted_secret",
+                       (TOTPItem.user_id == user_id, TOTPItem.encrypted_item_key.is_(None))),
+        RotationTarget("shared_totp.encrypted_item_key", SharedTOTP, "encrypted_item_key",
+                       (SharedTOTP.shared_with_user_id == user_id, SharedTOTP.encrypted_item_key.isnot(None))),
+        RotationTarget("shared_totp.encrypted_secret", SharedTOTP, "encrypted_secret",
+                       (SharedTOTP.shared_with_user_id == user_id, SharedTOTP.encrypted_item_key.is_(None),
+                        SharedTOTP.encrypted_secret.isnot(None))),
+        RotationTarget("group_members.encrypted_group_key", GroupMember, "encrypted_group_key",
+                       (GroupMember.user_id == user_id,)),
+    ]
+
+
+def _rotate_values(rows, primary: Fernet, fernet: MultiFernet) -> tuple[list[dict], int]:
+    """New tokens for the values not yet under the primary key, and the number of undecryptable ones"""
+    updates = []
+    failed = 0
+    for row_id, token in rows:
+        try:
+            primary.decrypt(token.encode())
+            continue
+        except InvalidToken:
+            pass
+        try:
+            updates.append({"b_id": row_id, "b_old": token, "b_new": fernet.rotate(token.encode()).decode()})
+        except InvalidToken:
+            logging.warning(f"Key rotation: row {row_id} cannot be decrypted with any key, left as is")
+            failed += 1
+    return updates, failed
+
+
+async def _rotate_batch(target: RotationTarget, rows, primary: Fernet, fernet: MultiFernet) -> tuple[int, int]:
+    # Crypto runs off the event loop so the next batch is read meanwhile
+    updates, failed = await asyncio.to_thread(_rotate_values, rows, primary, fernet)
+    if updates:
+        table = target.model.__table__
+        # Only rows still holding the value that was read: anything written by the app
+        # in the meantime is already under the new key and is left alone
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"), table.c[target.column] == bindparam("b_old"))
+            .values({target.column: bindparam("b_new")})
+        )
+        async with async_session() as session:
+            await session.execute(statement, updates)
+            await session.commit()
+    return len(updates), failed
+
+
+def log_progress(rotation: KeyRotation, rate: float):
+    logging.info(
+        f"Key rotation {rotation.id} ({rotation.kind}) {rotation.status} {rotation.target}: "
+        f"{rotation.rows_scanned} scanned, {rotation.rows_rotated} rotated, {rate:.0f} rows/s"
+    )
+
+
+class KeyRotationService:
+    @staticmethod
+    async def _checkpoint(rotation: KeyRotation, **values):
+        for name, value in values.items():
+            setattr(rotation, name, value)
+        rotation.updated_at = datetime.utcnow()
+        async with async_session() as session:
+            await session.execute(
+                update(KeyRotation).where(KeyRotation.id == rotation.id).values(
+                    status=rotation.status, target=rotation.target, last_id=rotation.last_id,
+                    rows_scanned=rotation.rows_scanned, rows_rotated=rotation.rows_rotated,
+                    updated_at=rotation.updated_at, finished_at=rotation.finished_at
+                )
+            )
+            await session.commit()
+
+    @staticmethod
+    async def _unfinished(kind: str, user_id: Optional[int] = None) -> Optional[KeyRotation]:
+        async with async_session() as session:
+            result = await session.execute(
+                select(KeyRotation)
+                .where(KeyRotation.kind == kind, KeyRotation.user_id == user_id, KeyRotation.status != "done")
+                .order_by(KeyRotation.id.desc())
+            )
+            return result.scalars().first()
+
+    @staticmethod
+    async def _sweep(rotation: KeyRotation, targets: list[RotationTarget], primary: Fernet, fernet: MultiFernet,
+                     batch_size: int, concurrency: int, report: Callable):
+        """Rotate every target from the checkpoint on, with up to `concurrency` batches in flight"""
+        started = time.monotonic()
+        scanned = 0
+        names = [target.name for target in targets]
+        start = names.index(rotation.target) if rotation.target in names else 0
+        for target in targets[start:]:
+            last_id = rotation.last_id if target.name == rotation.target else 0
+            model = target.model
+            inflight = deque()
+
+            async def complete_oldest():
+                nonlocal scanned
+                batch_last_id, batch_rows, task = inflight.popleft()
+                rotated, _ = await task
+                scanned += batch_rows
+                await KeyRotationService._checkpoint(
+                    rotation, target=target.name, last_id=batch_last_id,
+                    rows_scanned=rotation.rows_scanned + batch_rows, rows_rotated=rotation.rows_rotated + rotated
+                )
+                report(rotation, scanned / max(time.monotonic() - started, 1e-9))
+
+            try:
+                while True:
+                    async with async_session() as session:
+                        result = await session.execute(
+                            select(model.id, getattr(model, target.column))
+                            .where(model.id > last_id, *target.where)
+                            .order_by(model.id)
+                            .limit(batch_size)
+                        )
+                        rows = result.all()
+                    if not rows:
+                        break
+                    last_id = rows[-1][0]
+                    task = asyncio.create_task(_rotate_batch(target, rows, primary, fernet))
+                    inflight.append((last_id, len(rows), task))
+                    if len(inflight) >= concurrency:
+                        await complete_oldest()
+                while inflight:
+                    await complete_oldest()
+            finally:
+                for _, _, task in inflight:
+                    task.cancel()
+            await KeyRotationService._checkpoint(rotation, target=target.name, last_id=last_id)
+
+    @staticmethod
+    async def _settle(started_at: datetime):
+        """Wait until requests that loaded keys before `started_at` have finished"""
+        settle = AppConstants.KEY_ROTATION_SETTLE_SECONDS - (datetime.utcnow() - started_at).total_seconds()
+        if settle > 0:
+            await asyncio.sleep(settle)
+
+    @staticmethod
+    async def _run(rotation: KeyRotation, targets: list[RotationTarget], primary: Fernet, fernet: MultiFernet,
+                   batch_size: int, concurrency: int, report: Callable, settled: bool = False):
+        """
+        Sweep, wait for requests that started before the rotation to finish, then sweep
+        again: the second pass only rewrites values written with the old key meanwhile.
+        A caller that already waited out the settle window (settled) needs one sweep.
+        """
+        if rotation.status == "running":
+            await KeyRotationService._sweep(rotation, targets, primary, fernet, batch_size, concurrency, report)
+            await KeyRotationService._checkpoint(rotation, status="verifying", target=None, last_id=0)
+            if settled:
+                return
+        if not settled:
+            await KeyRotationService._settle(rotation.started_at)
+        await KeyRotationService._sweep(rotation, targets, primary, fernet, batch_size, concurrency, report)
+
+    @staticmethod
+    async def rotate_master(batch_size: int = AppConstants.KEY_ROTATION_BATCH_SIZE,
+                            concurrency: int = AppConstants.KEY_ROTATION_CONCURRENCY,
+                            report: Callable = log_progress) -> KeyRotation:
+        """Re-wrap every user DEK with the current master key (ENCRYPTION_KEY)"""
+        rotation = await KeyRotationService._unfinished("master")
+        if rotation is None:
+            async with async_session() as session:
+                rotation = KeyRotation(kind="master")
+                session.add(rotation)
+                await session.commit()
+
+        await KeyRotationService._run(
+            rotation, master_targets(), master_fernets[0], master_fernet, batch_size, concurrency, report
+        )
+        await KeyRotationService._checkpoint(rotation, status="done", finished_at=datetime.utcnow())
+        dek_cache.clear()
+        return rotation
+
+    @staticmethod
+    async def _start_user_dek(user_id: int) -> tuple[KeyRotation, Optional[tuple[str, Fernet, Fernet]]]:
+        """
+        Give the user a new DEK, or pick up their unfinished rotation.
+        Returns: (rotation, (previous_encrypted_dek, new DEK, old DEK)); the keys are
+        None when an interrupted run had already dropped the old DEK, and the
+        rotation is then marked done
+        """
+        rotation = await KeyRotationService._unfinished("dek", user_id)
+        async with async_session() as session:
+            user = await session.get(User, user_id)
+            if user is None:
+                raise ValueError(f"User {user_id} not found")
+            if rotation is None:
+                if user.previous_encrypted_dek is None:
+                    user.previous_encrypted_dek = user.encrypted_dek
+                    user.encrypted_dek = master_fernet.encrypt(generate_fernet_key()).decode()
+                rotation = KeyRotation(kind="dek", user_id=user_id)
+                session.add(rotation)
+                await session.commit()
+                dek_cache.invalidate_user(user_id)
+            previous_encrypted_dek = user.previous_encrypted_dek
+            encrypted_dek = user.encrypted_dek
+
+        if previous_encrypted_dek is None:
+            # Stopped after the old DEK was dropped: nothing is left to re-encrypt
+            await KeyRotationService._checkpoint(rotation, status="done", finished_at=datetime.utcnow())
+            return rotation, None
+        new_fernet = Fernet(master_fernet.decrypt(encrypted_dek.encode()))
+        old_fernet = Fernet(master_fernet.decrypt(previous_encrypted_dek.encode()))
+        return rotation, (previous_encrypted_dek, new_fernet, old_fernet)
+
+    @staticmethod
+    async def _finish_user_dek(rotation: KeyRotation, keys: tuple[str, Fernet, Fernet], batch_size: int,
+                               concurrency: int, report: Callable, settled: bool = False):
+        """Re-encrypt the user's rows under the new DEK, then drop the old one"""
+        previous_encrypted_dek, new_fernet, old_fernet = keys
+        await KeyRotationService._run(
+            rotation, dek_targets(rotation.user_id), new_fernet, MultiFernet([new_fernet, old_fernet]),
+            batch_size, concurrency, report, settled
+        )
+        async with async_session() as session:
+            await session.execute(
+                update(User)
+                .where(User.id == rotation.user_id, User.previous_encrypted_dek == previous_encrypted_dek)
+                .values(previous_encrypted_dek=None)
+            )
+            await session.commit()
+        await KeyRotationService._checkpoint(rotation, status="done", finished_at=datetime.utcnow())
+        dek_cache.invalidate_user(rotation.user_id)
+
+    @staticmethod
+    async def rotate_user_dek(user_id: int, batch_size: int = AppConstants.KEY_ROTATION_BATCH_SIZE,
+                              concurrency: int = AppConstants.KEY_ROTATION_CONCURRENCY,
+                              report: Callable = log_progress) -> KeyRotation:
+        """Give the user a new DEK and re-encrypt everything encrypted with the old one"""
+        rotation, keys = await KeyRotationService._start_user_dek(user_id)
+        if keys is not None:
+            await KeyRotationService._finish_user_dek(rotation, keys, batch_size, concurrency, report)
+        return rotation
+
+    @staticmethod
+    async def rotate_user_deks(user_ids: list[int], batch_size: int = AppConstants.KEY_ROTATION_BATCH_SIZE,
+                               concurrency: int = AppConstants.KEY_ROTATION_CONCURRENCY,
+                               report: Callable = log_progress) -> list[KeyRotation]:
+        """
+        rotate_user_dek for many users: every DEK is swapped first, so the settle
+        window is waited out once for the whole set and each user is swept once
+        """
+        started = [await KeyRotationService._start_user_dek(user_id) for user_id in user_ids]
+        pending = [(rotation, keys) for rotation, keys in started if keys is not None]
+        if pending:
+            await KeyRotationService._settle(max(rotation.started_at for rotation, _ in pending))
+        for rotation, keys in pending:
+            await KeyRotationService._finish_user_dek(rotation, keys, batch_size, concurrency, report, settled=True)
+        return [rotation for rotation, _ in started]
+
+    @staticmethod
+    async def list_rotations(limit: int = 20) -> list[KeyRotation]:
+        async with async_session() as session:
+            result = await session.execute(select(KeyRotation).order_by(KeyRotation.id.desc()).limit(limit))
+            return result.scalars().all()
+
+
+async def _main(args):
+    if args.command == "master":
+        await KeyRotationService.rotate_master(args.batch_size, args.concurrency)
+    elif args.command == "dek":
+        user_ids = list(args.user_ids)
+        if args.all:
+            async with async_session() as session:
+                user_ids = (await session.execute(select(User.id).order_by(User.id))).scalars().all()
+        await KeyRotationService.rotate_user_deks(user_ids, args.batch_size, args.concurrency)
+    else:
+        for rotation in await KeyRotationService.list_rotations():
+            print(f"{rotation.id}\t{rotation.kind}\t{rotation.user_id or '-'}\t{rotation.status}\t"
+                  f"{rotation.target or '-'}\t{rotation.rows_scanned}\t{rotation.rows_rotated}\t{rotation.updated_at}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rotate the master key or user DEKs")
+    parser.add_argument("command", choices=("master", "dek", "status"))
+    parser.add_argument("user_ids", nargs="*", type=int)
+    parser.add_argument("--all", action="store_true", help="rotate the DEK of every user")
+    parser.add_argument("--batch-size", type=int, default=AppConstants.KEY_ROTATION_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=AppConstants.KEY_ROTATION_CONCURRENCY)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    asyncio.run(_main(args))
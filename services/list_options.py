@@ -0,0 +1,140 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from typing import Optional
+from fastapi import HTTPException, Request, status
+from constants import AppConstants
+
+OWNED_FIELDS = ("id", "account", "issuer", "code", "period", "is_shared")
+SHARED_FIELDS = ("id", "account", "owner_email", "issuer", "code", "period")
+MAX_LIST_IDS = 1000
+# Sort name -> item columns ordered on, the item id is always the final tie-breaker
+SORT_KEYS = {
+    "issuer": ("issuer", "account"),
+    "account": ("account", "issuer"),
+}
+
+
+@dataclass(frozen=True)
+class ListOptions:
+    """Projection and filter of a listing request"""
+    fields: Optional[tuple[str, ...]] = None
+    include_codes: bool = True
+    ids: Optional[tuple[int, ...]] = None
+
+    @property
+    def key(self) -> str:
+        """Stable description used for request coalescing"""
+        fields = ",".join(self.fields) if self.fields else "*"
+        ids = ",".join(map(str, self.ids)) if self.ids is not None else "*"
+        return f"fields={fields};codes={int(self.include_codes)};ids={ids}"
+
+    def project(self, rows: list[dict]) -> list[dict]:
+        if self.fields is None:
+            if self.include_codes:
+                return rows
+            return [{k: v for k, v in row.items() if k != "code"} for row in rows]
+        return [{k: row[k] for k in self.fields} for row in rows]
+
+
+@dataclass(frozen=True)
+class PageOptions:
+    """Keyset page of a listing: sort order, prefix search and the position after which it starts"""
+    sort: str = "issuer"
+    q: Optional[str] = None
+    limit: Optional[int] = None
+    after: Optional[tuple] = None
+
+    @property
+    def key(self) -> str:
+        return f"sort={self.sort};q={self.q or ''};limit={self.limit or '*'};after={json.dumps(self.after)}"
+
+    def cursor_after(self, item) -> str:
+        """Opaque cursor pointing just past the given TOTP item"""
+        values = [getattr(item, column) for column in SORT_KEYS[self.sort]] + [item.id]
+        raw = json.dumps([self.sort, *values], separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def parse_ids(ids: Optional[str]) -> Optional[tuple[int, ...]]:
+    """Parse a comma separated id list, None when no filter was given"""
+    if ids is None:
+        return None
+    try:
+        id_filter = tuple(sorted({int(x) for x in ids.split(",") if x.strip()}))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid item ids")
+    if len(id_filter) > MAX_LIST_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_LIST_IDS} ids per request")
+    return id_filter
+
+
+def parse_list_options(allowed: tuple[str, ...], fields: Optional[str] = None,
+                       include_codes: bool = True, ids: Optional[str] = None) -> ListOptions:
+    """
+    Parse the `fields`, `include_codes` and `ids` query parameters.
+    Codes are only computed when they are requested, either through
+    include_codes or by listing "code" in fields.
+    """
+    selected = None
+    if fields:
+        names = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in names if name not in allowed]
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+            )
+        # id is always returned so clients can address the items
+        selected = tuple(dict.fromkeys(["id", *names]))
+        if not include_codes:
+            selected = tuple(name for name in selected if name != "code")
+        include_codes = "code" in selected
+
+    return ListOptions(fields=selected, include_codes=include_codes, ids=parse_ids(ids))
+
+
+def parse_page_options(sort: Optional[str] = None, q: Optional[str] = None, limit: Optional[int] = None,
+                       cursor: Optional[str] = None, default_limit: Optional[int] = None) -> PageOptions:
+    """
+    Parse the `sort`, `q`, `limit` and `cursor` query parameters.
+    Without a limit (and no default) the whole listing is returned in one page.
+    """
+    sort = sort or "issuer"
+    if sort not in SORT_KEYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Sort must be one of: {', '.join(SORT_KEYS)}"
+        )
+
+    q = (q or "").strip() or None
+    if q is not None and len(q) > AppConstants.MAX_SEARCH_LENGTH:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Search query is too long")
+
+    limit = limit if limit is not None else default_limit
+    if limit is not None and not 1 <= limit <= AppConstants.LIST_MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Limit must be between 1 and {AppConstants.LIST_MAX_PAGE_SIZE}"
+        )
+
+    after = None
+    if cursor:
+        try:
+            decoded = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            cursor_sort, *after = decoded
+            if cursor_sort != sort or len(after) != len(SORT_KEYS[sort]) + 1 or not isinstance(after[-1], int):
+                raise ValueError
+        except (binascii.Error, ValueError, TypeError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        after = tuple(after)
+
+    return PageOptions(sort=sort, q=q, limit=limit, after=after)
+
+
+def next_page_headers(request: Request, next_cursor: Optional[str]) -> dict:
+    """Link / X-Next-Cursor headers, so list responses keep their plain array body"""
+    if next_cursor is None:
+        return {}
+    next_url = request.url.include_query_params(cursor=next_cursor)
+    return {"Link": f'<{next_url}>; rel="next"', "X-Next-Cursor": next_cursor}
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from typing import Iterable, Optional
+from sqlalchemy import select, func, or_
+from config import async_session, settings
+from constants import AppConstants
+from models import SharedTOTP, TOTPItem, User
+
+
+class RecentRecipients:
+    """
+    Process-wide LRU of each user's most recent share recipients, most recent first.
+    A user's list is loaded from the share table on first use; later shares are
+    pushed to the front of lists that are already loaded, and removing shares
+    drops the list.
+    """
+
+    def __init__(self, max_users: int, per_user: int):
+        self.max_users = max_users
+        self.per_user = per_user
+        self._entries: "OrderedDict[int, OrderedDict[str, None]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int) -> Optional[list[str]]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        return list(entry)
+
+    def load(self, user_id: int, emails: Iterable[str]):
+        self._entries[user_id] = OrderedDict((email, None) for email in list(emails)[:self.per_user])
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    def add(self, user_id: int, emails: Iterable[str]):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        for email in emails:
+            entry[email] = None
+            entry.move_to_end(email, last=False)
+        while len(entry) > self.per_user:
+            entry.popitem()
+
+    def discard(self, user_id: int):
+        """Drop a user's list after shares were removed; it is reloaded on next use"""
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {"users": len(self._entries), "max_users": self.max_users, "hits": self.hits, "misses": self.misses}
+
+
+recent_recipients = RecentRecipients(AppConstants.RECENT_RECIPIENTS_MAX_USERS, AppConstants.RECENT_RECIPIENTS_PER_USER)
+
+
+class RecipientService:
+    @staticmethod
+    async def _recent(user: User) -> list[str]:
+        emails = recent_recipients.get(user.id)
+        if emails is None:
+            async with async_session() as session:
+                result = await session.execute(
+                    select(User.email)
+                    .join(SharedTOTP, SharedTOTP.shared_with_user_id == User.id)
+                    .join(TOTPItem, TOTPItem.id == SharedTOTP.totp_item_id)
+                    .where(TOTPItem.user_id == user.id)
+                    .group_by(User.email)
+                    .order_by(func.max(SharedTOTP.id).desc())
+                    .limit(AppConstants.RECENT_RECIPIENTS_PER_USER)
+                )
+                emails = result.scalars().all()
+            recent_recipients.load(user.id, emails)
+        return emails
+
+    @staticmethod
+    async def suggest(user: User, prefix: str, limit: int = AppConstants.RECIPIENT_SUGGEST_LIMIT) -> list[str]:
+        """
+        Recipient emails starting with `prefix`: the user's recent recipients first,
+        then verified users of ALLOWED_EMAIL_DOMAINS. Without configured domains only
+        recent recipients are suggested, so the user directory is never enumerable.
+        The directory lookup is a prefix range scan on the unique users.email index.
+        """
+        prefix = prefix.strip()
+        if not prefix:
+            return []
+        lowered = prefix.lower()
+        suggestions = [email for email in await RecipientService._recent(user) if email.lower().startswith(lowered)]
+        suggestions = suggestions[:limit]
+
+        domains = settings.ALLOWED_EMAIL_DOMAINS
+        if len(suggestions) >= limit or not domains or len(prefix) < AppConstants.RECIPIENT_SUGGEST_MIN_PREFIX:
+            return suggestions
+
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = (
+            select(User.email)
+            .where(
+                User.email.like(pattern, escape="\\"),
+                or_(*[User.email.like(f"%@{domain}") for domain in domains]),
+                User.is_verified.is_(True),
+                User.is_active.is_(True),
+                User.id != user.id,
+            )
+            .order_by(User.email)
+            .limit(limit)
+        )
+        if suggestions:
+            query = query.where(User.email.notin_(suggestions))
+        async with async_session() as session:
+            result = await session.execute(query)
+            suggestions += result.scalars().all()
+        return suggestions[:limit]
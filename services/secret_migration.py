@@ -0,0 +1,172 @@
+"""
+Migration of item secrets from Fernet text tokens to the binary AES-GCM envelope
+(TOTPItem.secret_blob, see services/item_keys.py).
+
+Rows are rewritten lazily: listings offer the text rows they already hold the item
+key for, and a background task writes them in one batch. The rest, including items
+created before per-item keys, is converted by
+
+    python -m services.secret_migration
+
+which walks the remaining rows in keyset batches. Both paths only update rows that
+still hold the token that was read, so they are safe to run next to the app and
+to each other; the command can be stopped and restarted at any time.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Callable, Optional
+from sqlalchemy import bindparam, select, update
+from config import async_session
+from constants import AppConstants
+from models import TOTPItem, User
+from services.dek_cache import get_user_fernet
+from services.item_keys import ItemKey, item_key_cache, new_item_key
+
+_items = TOTPItem.__table__
+
+# Text token under an item key -> binary envelope
+_MIGRATE_KEYED = (
+    update(_items)
+    .where(_items.c.id == bindparam("b_id"), _items.c.encrypted_secret == bindparam("b_old"),
+           _items.c.secret_blob.is_(None), _items.c.encrypted_item_key.isnot(None))
+    .values(secret_blob=bindparam("b_blob"), encrypted_secret=None)
+)
+# Text token under the owner's DEK -> new item key and binary envelope
+_MIGRATE_LEGACY = (
+    update(_items)
+    .where(_items.c.id == bindparam("b_id"), _items.c.encrypted_secret == bindparam("b_old"),
+           _items.c.secret_blob.is_(None), _items.c.encrypted_item_key.is_(None))
+    .values(secret_blob=bindparam("b_blob"), encrypted_secret=None, encrypted_item_key=bindparam("b_key"))
+)
+
+
+class SecretMigrator:
+    def __init__(self, max_pending: int, flush_seconds: float):
+        self.max_pending = max_pending
+        self.flush_seconds = flush_seconds
+        self._pending: dict[int, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.offered = 0
+        self.migrated = 0
+        self.failures = 0
+
+    def offer(self, totp: TOTPItem, item_key: ItemKey):
+        """Queue the rewrite of a row read in the text format, with the item key the reader unwrapped"""
+        if totp.id in self._pending or len(self._pending) >= self.max_pending:
+            return
+        try:
+            blob = item_key.seal(item_key.decrypt(totp.encrypted_secret.encode()))
+        except Exception:
+            return
+        self._pending[totp.id] = {"b_id": totp.id, "b_old": totp.encrypted_secret, "b_blob": blob}
+        self.offered += 1
+
+    async def flush(self) -> int:
+        if not self._pending:
+            return 0
+        rows = list(self._pending.values())
+        self._pending.clear()
+        async with async_session() as session:
+            # Rows changed since they were offered do not match the guard and are not counted
+            result = await session.execute(_MIGRATE_KEYED, rows)
+            await session.commit()
+        self.migrated += result.rowcount
+        return result.rowcount
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "offered": self.offered,
+            "migrated": self.migrated,
+            "failures": self.failures,
+        }
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception:
+                self.failures += 1
+                logging.exception("Secret migration flush failed")
+
+    @staticmethod
+    def _convert(rows) -> tuple[list[dict], list[dict]]:
+        keyed, legacy = [], []
+        for totp, user in rows:
+            try:
+                user_fernet = get_user_fernet(user)
+                if totp.encrypted_item_key is not None:
+                    item_key = item_key_cache.get_key(totp.id, totp.encrypted_secret, totp.encrypted_item_key,
+                                                      user_fernet)
+                    keyed.append({"b_id": totp.id, "b_old": totp.encrypted_secret,
+                                  "b_blob": item_key.seal(item_key.decrypt(totp.encrypted_secret.encode()))})
+                else:
+                    raw = new_item_key()
+                    legacy.append({"b_id": totp.id, "b_old": totp.encrypted_secret,
+                                   "b_blob": ItemKey(raw).seal(user_fernet.decrypt(totp.encrypted_secret.encode())),
+                                   "b_key": user_fernet.encrypt(raw).decode()})
+            except Exception:
+                logging.warning(f"Secret migration: item {totp.id} cannot be decrypted, left as is")
+        return keyed, legacy
+
+    async def migrate_all(self, batch_size: int = AppConstants.SECRET_MIGRATION_BATCH_SIZE,
+                          report: Optional[Callable[[int, int, float], None]] = None) -> int:
+        """Convert every remaining text row; returns the number of rows rewritten"""
+        started = time.monotonic()
+        last_id = scanned = migrated = 0
+        while True:
+            async with async_session() as session:
+                result = await session.execute(
+                    select(TOTPItem, User)
+                    .join(User, User.id == TOTPItem.user_id)
+                    .where(TOTPItem.id > last_id, TOTPItem.secret_blob.is_(None))
+                    .order_by(TOTPItem.id)
+                    .limit(batch_size)
+                )
+                rows = result.all()
+            if not rows:
+                break
+            last_id = rows[-1][0].id
+            keyed, legacy = await asyncio.to_thread(self._convert, rows)
+            async with async_session() as session:
+                for statement, params in ((_MIGRATE_KEYED, keyed), (_MIGRATE_LEGACY, legacy)):
+                    if params:
+                        migrated += (await session.execute(statement, params)).rowcount
+                await session.commit()
+            scanned += len(rows)
+            if report:
+                report(scanned, migrated, scanned / max(time.monotonic() - started, 1e-9))
+        self.migrated += migrated
+        return migrated
+
+
+secret_migrator = SecretMigrator(AppConstants.SECRET_MIGRATION_MAX_PENDING, AppConstants.SECRET_MIGRATION_FLUSH_SECONDS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert item secrets to the binary AES-GCM format")
+    parser.add_argument("--batch-size", type=int, default=AppConstants.SECRET_MIGRATION_BATCH_SIZE)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    total = asyncio.run(secret_migrator.migrate_all(
+        args.batch_size,
+        lambda scanned, migrated, rate: logging.info(f"{scanned} scanned, {migrated} migrated, {rate:.0f} rows/s")
+    ))
+    logging.info(f"Done, {total} secrets migrated")
@@ -48,6 +48,33 @@ class SessionService:
             
             return access_token, refresh_token, session_id
 
+    @staticmethod
+    async def get_live_session(session_id: str) -> Optional[Tuple[str, User]]:
+        """
+        Current state of a browser session, used to re-check long-lived connections.
+        A session rotated by a token refresh is followed to the one that replaced it.
+        Returns: (live session id, user), or None once logged out, revoked or expired
+        """
+        async with async_session() as db:
+            # Bounded walk: callers keep the returned id, so the chain stays short
+            for _ in range(32):
+                result = await db.execute(
+                    select(SessionDB, User)
+                    .join(User, User.id == SessionDB.user_id)
+                    .where(SessionDB.session_id == session_id)
+                )
+                row = result.first()
+                if not row:
+                    return None
+                session, user = row
+                if session.replaced_by_session_id is not None:
+                    session_id = session.replaced_by_session_id
+                    continue
+                if session.revoked_at is not None or session.refresh_token_expires_at <= now_utc() or not user.is_active:
+                    return None
+                return session_id, user
+        return None
+
     @staticmethod
     async def revoke_session(session_id: str, user: User) -> Tuple[bool, Optional[str]]:
         """
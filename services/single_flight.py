@@ -0,0 +1,49 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from models import User
+from services.code_cache import current_step
+from services.code_scheduler import BOUNDARY_TICK
+
+
+class SingleFlight:
+    """
+    Per-process request coalescing: concurrent calls with the same key await
+    one in-flight execution and share its result. The work runs in its own
+    task so a disconnecting caller does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._inflight.pop(key) if self._inflight.get(key) is t else None)
+        self.executed += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+        }
+
+
+list_flights = SingleFlight()
+
+
+async def coalesce_for_user(user: User, endpoint: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run fn once per (user, vault version, endpoint, time step) among concurrent callers.
+    The vault version is part of the key because it is part of the ETag: a request
+    made after a change must not join a flight that started before it.
+    """
+    return await list_flights.do((user.id, user.vault_version, endpoint, current_step(BOUNDARY_TICK)), fn)
@@ -0,0 +1,97 @@
+import base64
+import hashlib
+import hmac
+import struct
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Sequence, Tuple
+from constants import AppConstants
+
+DIGESTS = {
+    "SHA1": hashlib.sha1,
+    "SHA256": hashlib.sha256,
+    "SHA512": hashlib.sha512,
+}
+
+
+def decode_secret(secret: str) -> bytes:
+    """Decode a Base32 TOTP secret into raw key bytes (same rules as pyotp)"""
+    missing_padding = len(secret) % 8
+    if missing_padding:
+        secret += "=" * (8 - missing_padding)
+    return base64.b32decode(secret, casefold=True)
+
+
+def _new_mac(key: bytes, algorithm: str) -> hmac.HMAC:
+    return hmac.new(key, digestmod=DIGESTS[algorithm])
+
+
+def _hotp(key_state: hmac.HMAC, counter: bytes, modulo: int, digits: int) -> str:
+    """RFC 4226 dynamic truncation on a copy of a prepared HMAC state"""
+    mac = key_state.copy()
+    mac.update(counter)
+    digest = mac.digest()
+    offset = digest[-1] & 0x0F
+    binary = struct.unpack_from(">I", digest, offset)[0] & 0x7FFFFFFF
+    return str(binary % modulo).zfill(digits)
+
+
+class TotpEngine:
+    """
+    Batch RFC 6238 code generator.
+    One counter is packed per call and shared by every key. When the caller
+    passes item ids, the HMAC key schedule of each (item_id, algorithm) is kept
+    in a bounded LRU and copied per code; owners of the items drop their entries
+    with invalidate() together with the code cache.
+    All keys of one call share the same algorithm, digits and period.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._macs: "OrderedDict[Tuple[int, str], hmac.HMAC]" = OrderedDict()
+
+    def compute(self, keys: Sequence[bytes], for_time: float, period: int = AppConstants.TOTP_PERIOD,
+                digits: int = 6, algorithm: str = "SHA1", item_ids: Optional[Sequence[int]] = None) -> List[str]:
+        """Return the codes of all keys at for_time, in input order"""
+        counter = struct.pack(">Q", int(for_time // period))
+        modulo = 10 ** digits
+        codes = []
+        for i, key in enumerate(keys):
+            mac = self._mac(item_ids[i], key, algorithm) if item_ids is not None else _new_mac(key, algorithm)
+            codes.append(_hotp(mac, counter, modulo, digits))
+        return codes
+
+    def compute_windows(self, keys: Sequence[bytes], first_counter: int, count: int,
+                        digits: int = 6, algorithm: str = "SHA1",
+                        item_ids: Optional[Sequence[int]] = None) -> List[List[str]]:
+        """Return, per key, the codes of `count` consecutive counters starting at first_counter"""
+        counters = [struct.pack(">Q", first_counter + i) for i in range(count)]
+        modulo = 10 ** digits
+        windows = []
+        for i, key in enumerate(keys):
+            base = self._mac(item_ids[i], key, algorithm) if item_ids is not None else _new_mac(key, algorithm)
+            windows.append([_hotp(base, counter, modulo, digits) for counter in counters])
+        return windows
+
+    def invalidate(self, item_ids: Iterable[int]):
+        """Drop the key schedules of the given items"""
+        for item_id in item_ids:
+            for algorithm in DIGESTS:
+                self._macs.pop((item_id, algorithm), None)
+
+    def clear(self):
+        self._macs.clear()
+
+    def _mac(self, item_id: int, key: bytes, algorithm: str) -> hmac.HMAC:
+        cache_key = (item_id, algorithm)
+        mac = self._macs.get(cache_key)
+        if mac is not None:
+            self._macs.move_to_end(cache_key)
+            return mac
+        mac = _new_mac(key, algorithm)
+        self._macs[cache_key] = mac
+        if len(self._macs) > self.max_keys:
+            self._macs.popitem(last=False)
+        return mac
+
+
+totp_engine = TotpEngine(AppConstants.TOTP_ENGINE_MAX_KEYS)
@@ -1,119 +1,691 @@
-from sqlalchemy import select, delete
-from models import TOTPItem, User, SharedTOTP
-from config import async_session, master_fernet
+from sqlalchemy import select, delete, func, update, insert, or_, tuple_
+from sqlalchemy.exc import IntegrityError
+from models import TOTPItem, User, SharedTOTP, VaultChange, GroupMember, GroupTOTP
+from config import async_session
+from services.dek_cache import get_user_fernet
+from services.item_keys import ItemKey, item_key_cache, new_item_key, open_secret
+from services.secret_migration import secret_migrator
+from services.recipient_service import recent_recipients
+from services.code_cache import code_cache, current_step
+from services.totp_engine import totp_engine, decode_secret
+from services.code_scheduler import boundary_precomputer
+from services.list_options import PageOptions, SORT_KEYS
 from cryptography.fernet import Fernet
-import pyotp
+from constants import AppConstants
+from utils import unique_emails
+from datetime import datetime, timedelta
+from typing import Optional, Union
+import asyncio
+import logging
+import time
+
+# (item, stored secret as a text token or binary envelope, key that opens it or None if unreadable)
+SecretRow = tuple[TOTPItem, Union[str, bytes], Optional[Union[Fernet, ItemKey]]]
 
 
 class TotpService:
     @staticmethod
-    async def create(account: str, issuer: str, secret: str, user: User):
+    async def _bump_vault_versions(session, user_ids):
+        """Mark the listings of these users as changed, in the caller's transaction"""
+        user_ids = set(user_ids)
+        if user_ids:
+            await session.execute(
+                update(User).where(User.id.in_(user_ids)).values(vault_version=User.vault_version + 1)
+            )
+
+    @staticmethod
+    async def _record_changes(session, action: str, item_ids, user_ids):
+        """
+        Log a change of the items for every affected user and bump their vault
+        versions, in the caller's transaction
+        """
+        user_ids = set(user_ids)
+        await TotpService._record_change_pairs(
+            session, action, [(user_id, item_id) for user_id in user_ids for item_id in item_ids]
+        )
+
+    @staticmethod
+    async def _record_change_pairs(session, action: str, pairs):
+        """Same as _record_changes for explicit (user_id, item_id) pairs"""
+        pairs = list(pairs)
+        user_ids = {user_id for user_id, _ in pairs}
+        if not user_ids:
+            return
+        # The bump locks the users' rows until commit, so each user's versions commit in order
+        await TotpService._bump_vault_versions(session, user_ids)
+        result = await session.execute(select(User.id, User.vault_version).where(User.id.in_(user_ids)))
+        versions = dict(result.all())
+        # Entries past the retention window are dropped on the way, which keeps the log bounded
+        cutoff = datetime.utcnow() - timedelta(days=AppConstants.VAULT_CHANGES_RETENTION_DAYS)
+        await session.execute(
+            delete(VaultChange).where(VaultChange.user_id.in_(user_ids), VaultChange.created_at <= cutoff)
+        )
+        await session.execute(insert(VaultChange), [
+            {"user_id": user_id, "totp_item_id": item_id, "action": action, "version": versions[user_id]}
+            for user_id, item_id in pairs
+        ])
+
+    @staticmethod
+    async def _recipient_ids(session, item_ids) -> list[int]:
+        """Users the items are shared with, directly or through a group"""
+        result = await session.execute(
+            select(SharedTOTP.shared_with_user_id).where(SharedTOTP.totp_item_id.in_(item_ids))
+            .union(
+                select(GroupMember.user_id)
+                .join(GroupTOTP, GroupTOTP.group_id == GroupMember.group_id)
+                .where(GroupTOTP.totp_item_id.in_(item_ids))
+            )
+        )
+        return result.scalars().all()
+
+    @staticmethod
+    def invalidate_items(item_ids):
+        """Drop cached codes and HMAC key schedules of changed items, after their commit"""
+        item_ids = list(item_ids)
+        code_cache.invalidate(item_ids)
+        totp_engine.invalidate(item_ids)
+
+    @staticmethod
+    async def create(account: str, issuer: str, secret: str, user: User,
+                     algorithm: str = "SHA1", digits: int = 6, period: int = 30):
         async with async_session() as session:
-            user_fernet = Fernet(master_fernet.decrypt(user.encrypted_dek.encode()))
-            encrypted_secret = user_fernet.encrypt(secret.encode()).decode()
-            totp_item = TOTPItem(account=account, issuer=issuer, encrypted_secret=encrypted_secret, user_id=user.id)
-            session.add(totp_item)
+            totp_item = await TotpService._create_tx(
+                session, user, get_user_fernet(user), account, issuer, secret, algorithm, digits, period
+            )
             await session.commit()
             return totp_item
 
     @staticmethod
-    async def list_all(user: User):
+    async def _create_tx(session, user: User, user_fernet: Fernet, account: str, issuer: str, secret: str,
+                         algorithm: str = "SHA1", digits: int = 6, period: int = 30) -> TOTPItem:
+        """Create an item in the caller's transaction; the caller commits"""
+        item_key = new_item_key()
+        totp_item = TOTPItem(account=account, issuer=issuer, secret_blob=ItemKey(item_key).seal(secret.encode()),
+                             encrypted_item_key=user_fernet.encrypt(item_key).decode(),
+                             algorithm=algorithm, digits=digits, period=period, user_id=user.id)
+        session.add(totp_item)
+        await session.flush()
+        await TotpService._record_changes(session, "created", [totp_item.id], [user.id])
+        return totp_item
+
+    @staticmethod
+    def _stored_secret(totp: TOTPItem):
+        """The item's own ciphertext: the binary envelope, or a not yet migrated text token"""
+        return totp.secret_blob if totp.secret_blob is not None else totp.encrypted_secret
+
+    @staticmethod
+    def _secret_key(user_fernet: Fernet, totp: TOTPItem, wrapped_group_key: Optional[str],
+                    wrapped_item_key: Optional[str], unwrapped: Optional[dict] = None) -> Union[Fernet, ItemKey]:
+        """
+        Key of an item secret as seen by one user: the user's DEK, or for group shares
+        the group key (unwrapped once per call through the `unwrapped` memo), then the
+        item key wrapped with it when the item has one
+        """
+        key = user_fernet
+        if wrapped_group_key is not None:
+            if wrapped_group_key not in unwrapped:
+                unwrapped[wrapped_group_key] = Fernet(user_fernet.decrypt(wrapped_group_key.encode()))
+            key = unwrapped[wrapped_group_key]
+        if wrapped_item_key is not None:
+            key = item_key_cache.get_key(totp.id, TotpService._stored_secret(totp), wrapped_item_key, key)
+            if totp.secret_blob is None:
+                secret_migrator.offer(totp, key)
+        return key
+
+    @staticmethod
+    def _readable_key(user_fernet: Fernet, totp: TOTPItem, wrapped_group_key: Optional[str],
+                      wrapped_item_key: Optional[str], unwrapped: Optional[dict] = None):
+        """_secret_key for listings: an unreadable wrapped key maps to None, so only that item fails"""
+        try:
+            return TotpService._secret_key(user_fernet, totp, wrapped_group_key, wrapped_item_key, unwrapped)
+        except Exception as e:
+            logging.error(f"Error unwrapping the key of TOTP {totp.id}: {e}")
+            return None
+
+    @staticmethod
+    def _owned_secrets(rows, user_fernet: Fernet) -> list[SecretRow]:
+        return [(totp, TotpService._stored_secret(totp),
+                 TotpService._readable_key(user_fernet, totp, None, totp.encrypted_item_key))
+                for totp, _ in rows]
+
+    @staticmethod
+    def _shared_secrets(rows, user_fernet: Fernet) -> list[SecretRow]:
+        unwrapped = {}
+        return [(totp, encrypted_secret,
+                 TotpService._readable_key(user_fernet, totp, wrapped_group_key, wrapped_item_key, unwrapped))
+                for totp, encrypted_secret, wrapped_group_key, wrapped_item_key, _ in rows]
+
+    @staticmethod
+    def _ensure_item_key(totp_item: TOTPItem, owner_fernet: Fernet) -> bytes:
+        """
+        Raw item key of an owned item. Items created before per-item keys get one on
+        first share: the secret is re-encrypted under it once, in the caller's
+        transaction; older full-copy shares of the item stay valid. Callers select the
+        item FOR UPDATE so concurrent first shares wait for each other.
+        """
+        if totp_item.encrypted_item_key is not None:
+            return owner_fernet.decrypt(totp_item.encrypted_item_key.encode())
+        secret = owner_fernet.decrypt(totp_item.encrypted_secret.encode())
+        item_key = new_item_key()
+        totp_item.secret_blob = ItemKey(item_key).seal(secret)
+        totp_item.encrypted_secret = None
+        totp_item.encrypted_item_key = owner_fernet.encrypt(item_key).decode()
+        return item_key
+
+    @staticmethod
+    def _resolve_codes(items: list[SecretRow], now: float,
+                       precompute: bool = False) -> dict[int, str]:
+        """
+        Resolve codes for (item, encrypted_secret, key) triples at `now`, each in its own period.
+        Cached codes are reused, the rest are decrypted and computed in one batch
+        per (algorithm, digits, period).
+        """
+        codes = {}
+        pending = {}
+        for item, encrypted_secret, key in items:
+            code = code_cache.get(item.id, current_step(item.period, now), now, item.period, record=not precompute)
+            if code is not None:
+                codes[item.id] = code
+                continue
+            if key is None:
+                codes[item.id] = "Error"
+                continue
+            try:
+                secret = open_secret(key, encrypted_secret).decode()
+                batch = pending.setdefault((item.algorithm, item.digits, item.period), ([], []))
+                batch[0].append(item.id)
+                batch[1].append(decode_secret(secret))
+            except Exception as e:
+                logging.error(f"Error decrypting TOTP {item.id}: {e}")
+                codes[item.id] = "Error"
+
+        for (algorithm, digits, period), (item_ids, keys) in pending.items():
+            step = current_step(period, now)
+            for item_id, code in zip(item_ids, totp_engine.compute(keys, now, period, digits, algorithm, item_ids)):
+                code_cache.set(item_id, step, code, period, precomputed=precompute)
+                codes[item_id] = code
+        return codes
+
+    @staticmethod
+    def _apply_page(query, page: PageOptions):
+        """Prefix search, stable ordering and keyset position; fetches one extra row to detect a next page"""
+        if page.q:
+            prefix = page.q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            query = query.where(or_(
+                TOTPItem.issuer.like(prefix, escape="\\"), TOTPItem.account.like(prefix, escape="\\")
+            ))
+        columns = [getattr(TOTPItem, column) for column in SORT_KEYS[page.sort]] + [TOTPItem.id]
+        if page.after is not None:
+            query = query.where(tuple_(*columns) > tuple_(*page.after))
+        query = query.order_by(*columns)
+        if page.limit is not None:
+            query = query.limit(page.limit + 1)
+        return query
+
+    @staticmethod
+    def _split_page(rows, page: PageOptions):
+        """Trim the look-ahead row and return (rows, next_cursor)"""
+        if page.limit is None or len(rows) <= page.limit:
+            return rows, None
+        rows = rows[:page.limit]
+        return rows, page.cursor_after(rows[-1][0])
+
+    @staticmethod
+    async def _fetch_owned(user: User, ids=None, page: PageOptions = PageOptions()):
         async with async_session() as session:
-            user_fernet = Fernet(master_fernet.decrypt(user.encrypted_dek.encode()))
-            result = await session.execute(select(TOTPItem).where(TOTPItem.user_id == user.id))
-            totps = result.scalars().all()
-            output = []
-            for totp in totps:
-                try:
-                    secret = user_fernet.decrypt(totp.encrypted_secret.encode()).decode()
-                    code = pyotp.TOTP(secret).now()
-                    shared_result = await session.execute(select(SharedTOTP).where(SharedTOTP.totp_item_id == totp.id))
-                    shared_with = shared_result.scalars().all()
-                    output.append({
-                        "id": totp.id,
-                        "account": totp.account,
-                        "issuer": totp.issuer,
-                        "code": code,
-                        "is_shared": len(shared_with) > 0
-                    })
-                except Exception:
-                    output.append({
-                        "id": totp.id,
-                        "account": totp.account,
-                        "issuer": totp.issuer,
-                        "code": "Error",
-                        "is_shared": False
-                    })
-            return output
-
-    @staticmethod
-    async def list_shared_with_me(user: User):
+            # Share counts come from correlated subqueries so the whole listing is a single round trip
+            share_count = (
+                select(func.count(SharedTOTP.id))
+                .where(SharedTOTP.totp_item_id == TOTPItem.id)
+                .correlate(TOTPItem)
+                .scalar_subquery()
+            )
+            group_count = (
+                select(func.count(GroupTOTP.id))
+                .where(GroupTOTP.totp_item_id == TOTPItem.id)
+                .correlate(TOTPItem)
+                .scalar_subquery()
+            )
+            query = select(TOTPItem, (share_count + group_count).label("share_count")).where(
+                TOTPItem.user_id == user.id
+            )
+            if ids is not None:
+                query = query.where(TOTPItem.id.in_(ids))
+            result = await session.execute(TotpService._apply_page(query, page))
+            return result.all()
+
+    @staticmethod
+    async def _fetch_shared(user: User, ids=None, page: PageOptions = PageOptions()):
+        """
+        Items shared with the user directly or through a group, as
+        (item, encrypted_secret, wrapped_group_key, wrapped_item_key, owner_email) rows.
+        The page is selected first, then the keys of its rows; a direct share wins over
+        a group share of the same item, and wrapped_group_key is None for it. Shares
+        holding a wrapped item key decrypt the item's own stored secret.
+        """
         async with async_session() as session:
-            user_fernet = Fernet(master_fernet.decrypt(user.encrypted_dek.encode()))
-            result = await session.execute(
-                select(TOTPItem, SharedTOTP, User.email)
-                .join(SharedTOTP, TOTPItem.id == SharedTOTP.totp_item_id)
+            direct_ids = select(SharedTOTP.totp_item_id).where(SharedTOTP.shared_with_user_id == user.id)
+            group_ids = (
+                select(GroupTOTP.totp_item_id)
+                .join(GroupMember, GroupMember.group_id == GroupTOTP.group_id)
+                .where(GroupMember.user_id == user.id)
+            )
+            query = (
+                select(TOTPItem, User.email)
                 .join(User, TOTPItem.user_id == User.id)
-                .where(SharedTOTP.shared_with_user_id == user.id)
+                .where(or_(TOTPItem.id.in_(direct_ids), TOTPItem.id.in_(group_ids)), TOTPItem.user_id != user.id)
+            )
+            if ids is not None:
+                query = query.where(TOTPItem.id.in_(ids))
+            result = await session.execute(TotpService._apply_page(query, page))
+            page_rows = result.all()
+            if not page_rows:
+                return []
+
+            item_ids = [totp.id for totp, _ in page_rows]
+            secrets = {}
+            result = await session.execute(
+                select(GroupTOTP.totp_item_id, GroupTOTP.encrypted_secret, GroupMember.encrypted_group_key,
+                       GroupTOTP.encrypted_item_key)
+                .join(GroupMember, GroupMember.group_id == GroupTOTP.group_id)
+                .where(GroupMember.user_id == user.id, GroupTOTP.totp_item_id.in_(item_ids))
+            )
+            for item_id, encrypted_secret, wrapped_group_key, wrapped_item_key in result.all():
+                secrets.setdefault(item_id, (encrypted_secret, wrapped_group_key, wrapped_item_key))
+            result = await session.execute(
+                select(SharedTOTP.totp_item_id, SharedTOTP.encrypted_secret, SharedTOTP.encrypted_item_key)
+                .where(SharedTOTP.shared_with_user_id == user.id, SharedTOTP.totp_item_id.in_(item_ids))
+            )
+            for item_id, encrypted_secret, wrapped_item_key in result.all():
+                secrets[item_id] = (encrypted_secret, None, wrapped_item_key)
+            rows = []
+            for totp, owner_email in page_rows:
+                encrypted_secret, wrapped_group_key, wrapped_item_key = secrets[totp.id]
+                if wrapped_item_key is not None:
+                    encrypted_secret = TotpService._stored_secret(totp)
+                rows.append((totp, encrypted_secret, wrapped_group_key, wrapped_item_key, owner_email))
+            return rows
+
+    @staticmethod
+    def _owned_output(rows, user_fernet: Fernet, now: float, include_codes: bool = True) -> list[dict]:
+        codes = TotpService._resolve_codes(
+            TotpService._owned_secrets(rows, user_fernet), now
+        ) if include_codes else None
+        output = []
+        for totp, shared_count in rows:
+            entry = {"id": totp.id, "account": totp.account, "issuer": totp.issuer}
+            if include_codes:
+                entry["code"] = codes[totp.id]
+            entry.update(period=totp.period, is_shared=shared_count > 0)
+            output.append(entry)
+        return output
+
+    @staticmethod
+    def _shared_output(rows, user_fernet: Fernet, now: float, include_codes: bool = True) -> list[dict]:
+        codes = TotpService._resolve_codes(
+            TotpService._shared_secrets(rows, user_fernet), now
+        ) if include_codes else None
+        output = []
+        for totp, *_, owner_email in rows:
+            entry = {"id": totp.id, "account": totp.account, "owner_email": owner_email, "issuer": totp.issuer}
+            if include_codes:
+                entry["code"] = codes[totp.id]
+            entry["period"] = totp.period
+            output.append(entry)
+        return output
+
+    @staticmethod
+    async def list_page(user: User, include_codes: bool = True, ids=None, page: PageOptions = PageOptions()):
+        """
+        One page of owned items as {"items", "next_cursor"}. Codes are only computed
+        for the rows of the page; without codes the listing is a single query with
+        no DEK unwrap, decryption or code computation.
+        """
+        rows, next_cursor = TotpService._split_page(await TotpService._fetch_owned(user, ids, page), page)
+        if not include_codes:
+            return {"items": TotpService._owned_output(rows, None, time.time(), include_codes=False),
+                    "next_cursor": next_cursor}
+        boundary_precomputer.touch(user)
+        return {"items": TotpService._owned_output(rows, get_user_fernet(user), time.time()),
+                "next_cursor": next_cursor}
+
+    @staticmethod
+    async def list_shared_page(user: User, include_codes: bool = True, ids=None, page: PageOptions = PageOptions()):
+        """One page of items shared with the user as {"items", "next_cursor"}"""
+        rows, next_cursor = TotpService._split_page(await TotpService._fetch_shared(user, ids, page), page)
+        if not include_codes:
+            return {"items": TotpService._shared_output(rows, None, time.time(), include_codes=False),
+                    "next_cursor": next_cursor}
+        boundary_precomputer.touch(user)
+        return {"items": TotpService._shared_output(rows, get_user_fernet(user), time.time()),
+                "next_cursor": next_cursor}
+
+    @staticmethod
+    async def list_all(user: User, include_codes: bool = True, ids=None):
+        return (await TotpService.list_page(user, include_codes, ids))["items"]
+
+    @staticmethod
+    async def list_shared_with_me(user: User, include_codes: bool = True, ids=None):
+        return (await TotpService.list_shared_page(user, include_codes, ids))["items"]
+
+    @staticmethod
+    async def list_codes(user: User, ids=None):
+        """
+        Owned and shared codes in one call: the DEK is unwrapped once and both
+        row sets are fetched concurrently on separate sessions. Every entry has the
+        seconds left in its own period; the top-level seconds_left is the time until
+        the first of them rolls over.
+        """
+        boundary_precomputer.touch(user)
+        user_fernet = get_user_fernet(user)
+        owned_rows, shared_rows = await asyncio.gather(
+            TotpService._fetch_owned(user, ids), TotpService._fetch_shared(user, ids)
+        )
+        now = time.time()
+        items = TotpService._owned_output(owned_rows, user_fernet, now)
+        shared = TotpService._shared_output(shared_rows, user_fernet, now)
+        for entry in items + shared:
+            entry["seconds_left"] = entry["period"] - now % entry["period"]
+        return {
+            "items": items,
+            "shared": shared,
+            "server_time": now,
+            "seconds_left": min((entry["seconds_left"] for entry in items + shared),
+                                default=AppConstants.TOTP_PERIOD - now % AppConstants.TOTP_PERIOD),
+        }
+
+    @staticmethod
+    async def _read_changes(user: User, since: Optional[int], limit: int):
+        """
+        Change log window after the `since` cursor, as (cursor, changed_ids, has_more).
+        The cursor is the user's vault_version; a page never splits one version. Without
+        a cursor changed_ids is None (the whole vault). Returns None when the entries
+        after `since` were pruned, or `since` was never issued: the client must resync.
+        """
+        async with async_session() as session:
+            result = await session.execute(select(User.vault_version).where(User.id == user.id))
+            current = result.scalar() or 0
+            if since is None:
+                return current, None, False
+            if since > current:
+                return None
+            result = await session.execute(
+                select(VaultChange.version, VaultChange.totp_item_id)
+                .where(VaultChange.user_id == user.id, VaultChange.version > since)
+                .order_by(VaultChange.version)
+                .limit(limit + 1)
             )
             rows = result.all()
-            output = []
-
-            for totp, shared_totp, owner_email in rows:
-                try:
-                    secret = user_fernet.decrypt(shared_totp.encrypted_secret.encode()).decode()
-                    code = pyotp.TOTP(secret).now()
-                    output.append({
-                        "id": totp.id,
-                        "account": totp.account,
-                        "owner_email": owner_email,
-                        "issuer": totp.issuer,
-                        "code": code
-                    })
-                except Exception as e:
-                    print(f"Error decrypting shared TOTP {totp.id}: {e}")
-                    output.append({
-                        "id": totp.id,
-                        "account": totp.account,
-                        "owner_email": owner_email,
-                        "issuer": totp.issuer,
-                        "code": "Error"
-                    })
-            return output
+            if since < current and (not rows or rows[0][0] != since + 1):
+                return None
+            has_more = len(rows) > limit
+            if has_more:
+                boundary = rows[limit][0]
+                rows = [row for row in rows if row[0] < boundary]
+                if not rows:
+                    # A single change touching more items than a page is returned whole
+                    result = await session.execute(
+                        select(VaultChange.version, VaultChange.totp_item_id)
+                        .where(VaultChange.user_id == user.id, VaultChange.version == boundary)
+                    )
+                    rows = result.all()
+                    result = await session.execute(
+                        select(VaultChange.id)
+                        .where(VaultChange.user_id == user.id, VaultChange.version > boundary)
+                        .limit(1)
+                    )
+                    has_more = result.first() is not None
+        cursor = rows[-1][0] if rows else since
+        return cursor, sorted({item_id for _, item_id in rows}), has_more
 
     @staticmethod
-    async def delete(item_id: int, user: User):
+    async def list_changes(user: User, since: Optional[int], limit: int = AppConstants.CHANGES_PAGE_SIZE):
+        """
+        Delta sync: current metadata (no codes) of the items changed after the `since`
+        cursor, plus the ids that are no longer visible to the user. Without a cursor
+        the whole vault is returned as the starting point; None means the cursor expired.
+        """
+        changes = await TotpService._read_changes(user, since, limit)
+        if changes is None:
+            return None
+        cursor, changed_ids, has_more = changes
+        if changed_ids == []:
+            return {"cursor": cursor, "full": False, "has_more": False, "items": [], "shared": [], "deleted": []}
+
+        owned_rows, shared_rows = await asyncio.gather(
+            TotpService._fetch_owned(user, changed_ids), TotpService._fetch_shared(user, changed_ids)
+        )
+        items = TotpService._owned_output(owned_rows, None, 0, include_codes=False)
+        shared = TotpService._shared_output(shared_rows, None, 0, include_codes=False)
+        # An item changed in the window but no longer listed was deleted or unshared
+        visible = {item["id"] for item in items} | {item["id"] for item in shared}
+        deleted = [item_id for item_id in changed_ids if item_id not in visible] if changed_ids else []
+        return {
+            "cursor": cursor,
+            "full": since is None,
+            "has_more": has_more,
+            "items": items,
+            "shared": shared,
+            "deleted": deleted,
+        }
+
+    @staticmethod
+    def _resolve_code_windows(items: list[SecretRow], now: float,
+                              steps: int) -> dict[int, list]:
+        """
+        Codes of the current step and the next `steps` steps for (item, encrypted_secret, key)
+        triples, each window with its valid_from / valid_until unix times. Errors map to None.
+        """
+        windows = {}
+        pending = {}
+        for item, encrypted_secret, key in items:
+            if key is None:
+                windows[item.id] = None
+                continue
+            try:
+                secret = open_secret(key, encrypted_secret).decode()
+                batch = pending.setdefault((item.algorithm, item.digits, item.period), ([], []))
+                batch[0].append(item.id)
+                batch[1].append(decode_secret(secret))
+            except Exception as e:
+                logging.error(f"Error decrypting TOTP {item.id}: {e}")
+                windows[item.id] = None
+
+        for (algorithm, digits, period), (item_ids, keys) in pending.items():
+            first = current_step(period, now)
+            computed = totp_engine.compute_windows(keys, first, steps + 1, digits, algorithm, item_ids)
+            for item_id, codes in zip(item_ids, computed):
+                windows[item_id] = [{
+                    "code": code,
+                    "valid_from": (first + i) * period,
+                    "valid_until": (first + i + 1) * period
+                } for i, code in enumerate(codes)]
+        return windows
+
+    @staticmethod
+    async def list_code_bundles(user: User, steps: int):
+        """Owned and shared items with codes for the current and the next `steps` steps"""
+        user_fernet = get_user_fernet(user)
+        owned_rows, shared_rows = await asyncio.gather(
+            TotpService._fetch_owned(user), TotpService._fetch_shared(user)
+        )
+        now = time.time()
+        owned = TotpService._resolve_code_windows(
+            TotpService._owned_secrets(owned_rows, user_fernet), now, steps
+        )
+        shared = TotpService._resolve_code_windows(
+            TotpService._shared_secrets(shared_rows, user_fernet), now, steps
+        )
+        return {
+            "items": [{
+                "id": totp.id,
+                "account": totp.account,
+                "issuer": totp.issuer,
+                "period": totp.period,
+                "codes": owned[totp.id]
+            } for totp, _ in owned_rows],
+            "shared": [{
+                "id": totp.id,
+                "account": totp.account,
+                "owner_email": owner_email,
+                "issuer": totp.issuer,
+                "period": totp.period,
+                "codes": shared[totp.id]
+            } for totp, *_, owner_email in shared_rows],
+            "server_time": now,
+        }
+
+    @staticmethod
+    async def precompute_codes(users: list[User], for_time: float) -> int:
+        """
+        Warm the code cache with the codes of the users' owned and shared items at for_time.
+        Only items whose period has a step boundary at for_time are computed, in chunks
+        of PRECOMPUTE_CHUNK_SIZE items that yield to the event loop in between.
+        Returns the number of items resolved.
+        """
+        users_by_id = {u.id: u for u in users}
+        if not users_by_id:
+            return 0
         async with async_session() as session:
+            result = await session.execute(select(TOTPItem).where(TOTPItem.user_id.in_(users_by_id)))
+            owned = result.scalars().all()
             result = await session.execute(
-                select(TOTPItem).where(TOTPItem.id == item_id, TOTPItem.user_id == user.id)
+                select(TOTPItem, SharedTOTP.shared_with_user_id, SharedTOTP.encrypted_secret,
+                       SharedTOTP.encrypted_item_key)
+                .join(SharedTOTP, TOTPItem.id == SharedTOTP.totp_item_id)
+                .where(SharedTOTP.shared_with_user_id.in_(users_by_id))
+            )
+            shared = [(item, recipient_id, encrypted_secret, None, wrapped_item_key)
+                      for item, recipient_id, encrypted_secret, wrapped_item_key in result.all()]
+            result = await session.execute(
+                select(TOTPItem, GroupMember.user_id, GroupTOTP.encrypted_secret, GroupMember.encrypted_group_key,
+                       GroupTOTP.encrypted_item_key)
+                .join(GroupTOTP, TOTPItem.id == GroupTOTP.totp_item_id)
+                .join(GroupMember, GroupMember.group_id == GroupTOTP.group_id)
+                .where(GroupMember.user_id.in_(users_by_id), TOTPItem.user_id != GroupMember.user_id)
             )
-            totp_item = result.scalars().first()
-            if totp_item:
-                await session.execute(
-                    delete(SharedTOTP).where(SharedTOTP.totp_item_id == item_id)
+            shared += result.all()
+
+        boundary = int(for_time)
+        per_user = {}
+        seen = set()
+        for item in owned:
+            if boundary % item.period == 0:
+                per_user.setdefault(item.user_id, []).append(
+                    (item, TotpService._stored_secret(item), None, item.encrypted_item_key)
                 )
-                await session.delete(totp_item)
-                await session.commit()
-                return True
-            return False
+                seen.add(item.id)
+        for item, recipient_id, encrypted_secret, wrapped_group_key, wrapped_item_key in shared:
+            # The owner's copy already warms the shared entry when the owner is hot too
+            if item.id not in seen and boundary % item.period == 0:
+                if wrapped_item_key is not None:
+                    encrypted_secret = TotpService._stored_secret(item)
+                per_user.setdefault(recipient_id, []).append(
+                    (item, encrypted_secret, wrapped_group_key, wrapped_item_key)
+                )
+                seen.add(item.id)
+
+        chunk_size = AppConstants.PRECOMPUTE_CHUNK_SIZE
+        for user_id, items in per_user.items():
+            try:
+                user_fernet = get_user_fernet(users_by_id[user_id])
+            except Exception as e:
+                # One unreadable DEK must not stop the warm-up of the other users
+                logging.error(f"Error unwrapping the DEK of user {user_id}: {e}")
+                continue
+            unwrapped = {}
+            for start in range(0, len(items), chunk_size):
+                TotpService._resolve_codes([
+                    (item, encrypted_secret,
+                     TotpService._readable_key(user_fernet, item, wrapped_group_key, wrapped_item_key, unwrapped))
+                    for item, encrypted_secret, wrapped_group_key, wrapped_item_key in items[start:start + chunk_size]
+                ], for_time, precompute=True)
+                # CPU-bound work right before the boundary peak: let requests in between chunks.
+                # It stays on the loop because the caches it fills are not thread-safe.
+                await asyncio.sleep(0)
+        return len(seen)
 
     @staticmethod
-    async def update(item_id: int, account: str, user: User):
+    async def delete(item_id: int, user: User):
+        return (await TotpService.delete_many([item_id], user))[item_id]
+
+    @staticmethod
+    async def _delete_tx(session, item_id: int, user: User) -> bool:
+        return (await TotpService._delete_many_tx(session, [item_id], user))[item_id]
+
+    @staticmethod
+    async def delete_many(item_ids: list[int], user: User) -> dict[int, bool]:
+        """
+        Delete the user's items and their shares in one transaction.
+        Returns: {item_id: deleted}; ids that are missing or not owned map to False
+        """
         async with async_session() as session:
+            outcomes = await TotpService._delete_many_tx(session, item_ids, user)
+            deleted_ids = [item_id for item_id, deleted in outcomes.items() if deleted]
+            if deleted_ids:
+                await session.commit()
+        TotpService.invalidate_items(deleted_ids)
+        if deleted_ids:
+            recent_recipients.discard(user.id)
+        return outcomes
+
+    @staticmethod
+    async def _delete_many_tx(session, item_ids: list[int], user: User) -> dict[int, bool]:
+        """Set-based delete: one statement each for ownership, recipients, shares and items"""
+        item_ids = list(dict.fromkeys(item_ids))
+        if not item_ids:
+            return {}
+        result = await session.execute(
+            select(TOTPItem.id).where(TOTPItem.id.in_(item_ids), TOTPItem.user_id == user.id)
+        )
+        owned_ids = set(result.scalars().all())
+        if owned_ids:
+            result = await session.execute(
+                select(SharedTOTP.shared_with_user_id, SharedTOTP.totp_item_id)
+                .where(SharedTOTP.totp_item_id.in_(owned_ids))
+            )
+            recipient_pairs = result.all()
             result = await session.execute(
-                select(TOTPItem).where(TOTPItem.id == item_id, TOTPItem.user_id == user.id)
+                select(GroupMember.user_id, GroupTOTP.totp_item_id)
+                .join(GroupMember, GroupMember.group_id == GroupTOTP.group_id)
+                .where(GroupTOTP.totp_item_id.in_(owned_ids), GroupMember.user_id != user.id)
             )
-            totp_item = result.scalars().first()
-            if not totp_item:
-                return False, "TOTP item not found."
-            totp_item.account = account
+            recipient_pairs = set(recipient_pairs) | set(result.all())
+            await session.execute(delete(SharedTOTP).where(SharedTOTP.totp_item_id.in_(owned_ids)))
+            await session.execute(delete(GroupTOTP).where(GroupTOTP.totp_item_id.in_(owned_ids)))
+            await session.execute(delete(TOTPItem).where(TOTPItem.id.in_(owned_ids)))
+            await TotpService._record_change_pairs(
+                session, "deleted", [(user.id, item_id) for item_id in owned_ids] + list(recipient_pairs)
+            )
+        return {item_id: item_id in owned_ids for item_id in item_ids}
+
+    @staticmethod
+    async def update(item_id: int, account: str, user: User):
+        async with async_session() as session:
+            success, message = await TotpService._update_tx(session, item_id, account, user)
+            if not success:
+                return success, message
             await session.commit()
-            return True, "Updated successfully."
+        TotpService.invalidate_items([item_id])
+        return success, message
+
+    @staticmethod
+    async def _update_tx(session, item_id: int, account: str, user: User):
+        result = await session.execute(
+            select(TOTPItem).where(TOTPItem.id == item_id, TOTPItem.user_id == user.id)
+        )
+        totp_item = result.scalars().first()
+        if not totp_item:
+            return False, "TOTP item not found."
+        totp_item.account = account
+        recipient_ids = await TotpService._recipient_ids(session, [item_id])
+        await TotpService._record_changes(session, "updated", [item_id], [user.id, *recipient_ids])
+        return True, "Updated successfully."
 
     @staticmethod
     async def export_raw(user: User, ids: list[int]):
         async with async_session() as session:
-            user_fernet = Fernet(master_fernet.decrypt(user.encrypted_dek.encode()))
+            user_fernet = get_user_fernet(user)
             result = await session.execute(
                 select(TOTPItem).where(TOTPItem.id.in_(ids), TOTPItem.user_id == user.id)
             )
@@ -121,57 +693,157 @@ class TotpService:
             return [{
                 "account": t.account,
                 "issuer": t.issuer,
-                "secret": user_fernet.decrypt(t.encrypted_secret.encode()).decode()
+                "secret": open_secret(
+                    TotpService._secret_key(user_fernet, t, None, t.encrypted_item_key), TotpService._stored_secret(t)
+                ).decode(),
+                "algorithm": t.algorithm,
+                "digits": t.digits,
+                "period": t.period
             } for t in totps]
 
     @staticmethod
-    async def share_totp(totp_ids: list[int], email: str, user: User):
+    async def export_vault(user: User, since: Optional[int], limit: int = AppConstants.CHANGES_PAGE_SIZE):
+        """
+        Device sync delta on the list_changes cursor: plain secrets and parameters of the
+        owned and shared items changed after `since`, and the ids no longer visible.
+        Shared secrets are unwrapped through the share or group key, as in the listings.
+        Returns None when the cursor expired, like list_changes.
+        """
+        changes = await TotpService._read_changes(user, since, limit)
+        if changes is None:
+            return None
+        cursor, changed_ids, has_more = changes
+        if changed_ids == []:
+            return {"cursor": cursor, "full": False, "has_more": False, "items": [], "shared": [], "deleted": []}
+
+        user_fernet = get_user_fernet(user)
+        owned_rows, shared_rows = await asyncio.gather(
+            TotpService._fetch_owned(user, changed_ids), TotpService._fetch_shared(user, changed_ids)
+        )
+        items = TotpService._export_entries(TotpService._owned_secrets(owned_rows, user_fernet))
+        shared = TotpService._export_entries(TotpService._shared_secrets(shared_rows, user_fernet))
+        for entry, row in zip(shared, shared_rows):
+            entry["owner_email"] = row[-1]
+        visible = {item["id"] for item in items} | {item["id"] for item in shared}
+        deleted = [item_id for item_id in changed_ids if item_id not in visible] if changed_ids else []
+        return {
+            "cursor": cursor,
+            "full": since is None,
+            "has_more": has_more,
+            "items": items,
+            "shared": shared,
+            "deleted": deleted,
+        }
+
+    @staticmethod
+    def _export_entries(secrets: list[SecretRow]) -> list[dict]:
+        return [
+            {
+                "id": totp.id,
+                "account": totp.account,
+                "issuer": totp.issuer,
+                # None when the item's key is unreadable
+                "secret": open_secret(key, encrypted_secret).decode() if key is not None else None,
+                "algorithm": totp.algorithm,
+                "digits": totp.digits,
+                "period": totp.period
+            }
+            for totp, encrypted_secret, key in secrets
+        ]
+
+    @staticmethod
+    async def share_totp(totp_ids: list[int], emails: Union[str, list[str]], user: User):
+        """
+        Share items with one or more recipients.
+        Returns: (number of new item/recipient pairs, message)
+        """
         async with async_session() as session:
-            result = await session.execute(select(User).where(User.email == email))
-            target_user = result.scalars().first()
-            if not target_user:
-                return 0, "User with this email does not exist."
-            if target_user.id == user.id:
-                return 0, "Cannot share with yourself."
+            try:
+                shared_count, message, recipient_emails = await TotpService._share_tx(
+                    session, totp_ids, emails, user, get_user_fernet(user)
+                )
+                if shared_count > 0:
+                    await session.commit()
+                    recent_recipients.add(user.id, recipient_emails)
+            except IntegrityError:
+                # A concurrent request created one of the pairs first
+                await session.rollback()
+                return 0, "Sharing changed in the meantime, please try again."
+            return shared_count, message
 
-            result = await session.execute(
-                select(TOTPItem).where(TOTPItem.id.in_(totp_ids), TOTPItem.user_id == user.id)
-            )
-            totp_items = result.scalars().all()
-            if not totp_items:
-                return 0, "No valid TOTP items found."
+    @staticmethod
+    async def _share_tx(session, totp_ids: list[int], emails: Union[str, list[str]], user: User,
+                        owner_fernet: Fernet):
+        """
+        Set-based share: recipients, owned items and existing pairs are each resolved
+        with one query and the new pairs are inserted with one bulk statement. A share
+        holds the item key wrapped with the recipient's DEK, so no secret is
+        re-encrypted; every item key and every recipient DEK is unwrapped once.
+        Returns: (number of new item/recipient pairs, message, recipient emails as stored)
+        """
+        if isinstance(emails, str):
+            emails = [emails]
+        emails = unique_emails(emails)
+        if not emails:
+            return 0, "No recipients given.", []
+
+        result = await session.execute(select(User).where(User.email.in_(emails)))
+        recipients = {recipient.email.lower(): recipient for recipient in result.scalars().all()}
+        missing = [email for email in emails if email.lower() not in recipients]
+        if missing:
+            if len(emails) == 1:
+                return 0, "User with this email does not exist.", []
+            return 0, f"Users with these emails do not exist: {', '.join(missing)}.", []
+        if any(recipient.id == user.id for recipient in recipients.values()):
+            return 0, "Cannot share with yourself.", []
 
-            owner_fernet = Fernet(master_fernet.decrypt(user.encrypted_dek.encode()))
-            recipient_fernet = Fernet(master_fernet.decrypt(target_user.encrypted_dek.encode()))
-            shared_count = 0
-            already_shared = []
+        # Locked so two shares of a legacy item cannot each give it a different item key
+        result = await session.execute(
+            select(TOTPItem).where(TOTPItem.id.in_(totp_ids), TOTPItem.user_id == user.id).with_for_update()
+        )
+        totp_items = result.scalars().all()
+        if not totp_items:
+            return 0, "No valid TOTP items found.", []
 
+        recipient_ids = [recipient.id for recipient in recipients.values()]
+        result = await session.execute(
+            select(SharedTOTP.totp_item_id, SharedTOTP.shared_with_user_id).where(
+                SharedTOTP.totp_item_id.in_([totp_item.id for totp_item in totp_items]),
+                SharedTOTP.shared_with_user_id.in_(recipient_ids)
+            )
+        )
+        existing = set(result.all())
+
+        rows = []
+        already_shared = []
+        item_keys = {}
+        for recipient in recipients.values():
+            recipient_fernet = get_user_fernet(recipient)
             for totp_item in totp_items:
-                result = await session.execute(
-                    select(SharedTOTP).where(
-                        SharedTOTP.totp_item_id == totp_item.id,
-                        SharedTOTP.shared_with_user_id == target_user.id
-                    )
-                )
-                if result.scalars().first():
-                    already_shared.append(f"{totp_item.account} ({totp_item.issuer})")
+                if (totp_item.id, recipient.id) in existing:
+                    label = f"{totp_item.account} ({totp_item.issuer})"
+                    already_shared.append(label if len(recipients) == 1 else f"{label} with {recipient.email}")
                     continue
-                secret = owner_fernet.decrypt(totp_item.encrypted_secret.encode()).decode()
-                encrypted_secret = recipient_fernet.encrypt(secret.encode()).decode()
-                shared_totp = SharedTOTP(
-                    totp_item_id=totp_item.id,
-                    shared_with_user_id=target_user.id,
-                    encrypted_secret=encrypted_secret
-                )
-                session.add(shared_totp)
-                shared_count += 1
+                if totp_item.id not in item_keys:
+                    item_keys[totp_item.id] = TotpService._ensure_item_key(totp_item, owner_fernet)
+                rows.append({
+                    "totp_item_id": totp_item.id,
+                    "shared_with_user_id": recipient.id,
+                    "encrypted_item_key": recipient_fernet.encrypt(item_keys[totp_item.id]).decode()
+                })
 
-            if shared_count > 0:
-                await session.commit()
+        shared_count = len(rows)
+        if shared_count > 0:
+            await session.execute(insert(SharedTOTP), rows)
+            pairs = {(row["shared_with_user_id"], row["totp_item_id"]) for row in rows}
+            pairs |= {(user.id, item_id) for _, item_id in pairs}
+            await TotpService._record_change_pairs(session, "shared", pairs)
 
-            if already_shared:
-                return shared_count, f"Shared {shared_count} item(s). Already shared: {', '.join(already_shared)}."
-            return shared_count, f"Shared {shared_count} item(s) successfully!"
+        recipient_emails = [recipient.email for recipient in recipients.values()]
+        if already_shared:
+            return (shared_count, f"Shared {shared_count} item(s). Already shared: {', '.join(already_shared)}.",
+                    recipient_emails)
+        return shared_count, f"Shared {shared_count} item(s) successfully!", recipient_emails
 
     @staticmethod
     async def get_shared_users(totp_id: int, user: User):
@@ -192,27 +864,109 @@ class TotpService:
             return emails, None
 
     @staticmethod
-    async def unshare_totp(totp_id: int, email: str, user: User):
+    async def sharing_overview(user: User) -> list[dict]:
+        """
+        The owner's direct sharing matrix from one joined query: every shared item
+        with the emails it is shared with. Group access is listed per group.
+        """
         async with async_session() as session:
-            # Verify the TOTP item belongs to the user
             result = await session.execute(
-                select(TOTPItem).where(TOTPItem.id == totp_id, TOTPItem.user_id == user.id)
+                select(TOTPItem.id, TOTPItem.account, TOTPItem.issuer, User.email)
+                .join(SharedTOTP, SharedTOTP.totp_item_id == TOTPItem.id)
+                .join(User, User.id == SharedTOTP.shared_with_user_id)
+                .where(TOTPItem.user_id == user.id)
+                .order_by(TOTPItem.issuer, TOTPItem.account, TOTPItem.id, User.email)
             )
-            if not result.scalars().first():
-                return False, "TOTP item not found."
+            items = {}
+            for item_id, account, issuer, email in result.all():
+                entry = items.setdefault(item_id, {"id": item_id, "account": account, "issuer": issuer, "emails": []})
+                entry["emails"].append(email)
+            return list(items.values())
 
-            # Find the target user
-            result = await session.execute(select(User).where(User.email == email))
-            target_user = result.scalars().first()
-            if not target_user:
-                return False, "User with this email does not exist."
+    @staticmethod
+    async def revoke_shares(user: User, emails: Optional[list[str]] = None,
+                            pairs: Optional[list[tuple[int, str]]] = None):
+        """
+        Bulk revoke of direct shares: `emails` lose access to all of the owner's
+        items, `pairs` remove single (item_id, email) shares. Recipients are resolved
+        with one query, the matching shares are selected with one and removed with
+        one set-based delete.
+        Returns: (number of shares removed, unknown emails)
+        """
+        emails = unique_emails(emails or [])
+        pairs = list(dict.fromkeys((item_id, email.strip()) for item_id, email in pairs or [] if email and email.strip()))
+        wanted = unique_emails(emails + [email for _, email in pairs])
+        if not wanted:
+            return 0, []
+
+        async with async_session() as session:
+            # Matched case-insensitively, as the users table collation does
+            result = await session.execute(select(User.email, User.id).where(User.email.in_(wanted)))
+            user_ids = {email.lower(): user_id for email, user_id in result.all()}
+            unknown = [email for email in wanted if email.lower() not in user_ids]
+            emails = [email.lower() for email in emails]
+            pairs = [(item_id, email.lower()) for item_id, email in pairs]
+
+            conditions = []
+            if any(email in user_ids for email in emails):
+                conditions.append(SharedTOTP.shared_with_user_id.in_(
+                    [user_ids[email] for email in emails if email in user_ids]
+                ))
+            pair_ids = [(item_id, user_ids[email]) for item_id, email in pairs if email in user_ids]
+            if pair_ids:
+                conditions.append(tuple_(SharedTOTP.totp_item_id, SharedTOTP.shared_with_user_id).in_(pair_ids))
+            if not conditions:
+                return 0, unknown
 
-            # Delete the shared record
             result = await session.execute(
-                delete(SharedTOTP).where(
-                    SharedTOTP.totp_item_id == totp_id,
-                    SharedTOTP.shared_with_user_id == target_user.id
-                )
+                select(SharedTOTP.id, SharedTOTP.shared_with_user_id, SharedTOTP.totp_item_id)
+                .join(TOTPItem, TOTPItem.id == SharedTOTP.totp_item_id)
+                .where(TOTPItem.user_id == user.id, or_(*conditions))
             )
+            shares = result.all()
+            if not shares:
+                return 0, unknown
+            await session.execute(delete(SharedTOTP).where(SharedTOTP.id.in_([share_id for share_id, _, _ in shares])))
+            changes = {(recipient_id, item_id) for _, recipient_id, item_id in shares}
+            changes |= {(user.id, item_id) for _, item_id in changes}
+            await TotpService._record_change_pairs(session, "unshared", changes)
             await session.commit()
-            return result.rowcount > 0, "TOTP sharing removed!" if result.rowcount > 0 else "TOTP not shared with this user."
\ No newline at end of file
+        TotpService.invalidate_items({item_id for _, _, item_id in shares})
+        recent_recipients.discard(user.id)
+        return len(shares), unknown
+
+    @staticmethod
+    async def unshare_totp(totp_id: int, email: str, user: User):
+        async with async_session() as session:
+            success, message = await TotpService._unshare_tx(session, totp_id, email, user)
+            await session.commit()
+        TotpService.invalidate_items([totp_id])
+        if success:
+            recent_recipients.discard(user.id)
+        return success, message
+
+    @staticmethod
+    async def _unshare_tx(session, totp_id: int, email: str, user: User):
+        # Verify the TOTP item belongs to the user
+        result = await session.execute(
+            select(TOTPItem).where(TOTPItem.id == totp_id, TOTPItem.user_id == user.id)
+        )
+        if not result.scalars().first():
+            return False, "TOTP item not found."
+
+        # Find the target user
+        result = await session.execute(select(User).where(User.email == email))
+        target_user = result.scalars().first()
+        if not target_user:
+            return False, "User with this email does not exist."
+
+        # Delete the shared record
+        result = await session.execute(
+            delete(SharedTOTP).where(
+                SharedTOTP.totp_item_id == totp_id,
+                SharedTOTP.shared_with_user_id == target_user.id
+            )
+        )
+        if result.rowcount > 0:
+            await TotpService._record_changes(session, "unshared", [totp_id], [user.id, target_user.id])
+        return result.rowcount > 0, "TOTP sharing removed!" if result.rowcount > 0 else "TOTP not shared with this user."
\ No newline at end of file
@@ -33,7 +33,8 @@ def validate_password(password: str) -> Optional[str]:
         return "Password must contain at least one special character"
     return None
 
-def validate_totp(account: str, issuer: str, secret: str) -> Optional[str]:
+def validate_totp(account: str, issuer: str, secret: str,
+                  algorithm: str = "SHA1", digits: int = 6, period: int = 30) -> Optional[str]:
     account = sanitize_input(account)
     issuer = sanitize_input(issuer)
     secret = sanitize_input(secret)
@@ -54,4 +55,11 @@ def validate_totp(account: str, issuer: str, secret: str) -> Optional[str]:
     if not is_valid_base32(secret):
         return "Secret must be a valid Base32 string."
 
+    if algorithm not in AppConstants.TOTP_ALGORITHMS:
+        return f"Algorithm must be one of: {', '.join(AppConstants.TOTP_ALGORITHMS)}."
+    if digits not in AppConstants.TOTP_DIGITS:
+        return f"Digits must be one of: {', '.join(map(str, AppConstants.TOTP_DIGITS))}."
+    if period not in AppConstants.TOTP_PERIODS:
+        return f"Period must be one of: {', '.join(map(str, AppConstants.TOTP_PERIODS))} seconds."
+
     return None
@@ -0,0 +1,93 @@
+import base64
+import binascii
+import json
+import os
+from typing import Optional, Tuple
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from sqlalchemy import update
+from config import async_session
+from models import ApiKey, User
+from services.auth import now_utc
+from services.totp_service import TotpService
+
+SYNC_SCHEME = "X25519-HKDF-SHA256-AES256GCM"
+SYNC_HKDF_INFO = b"totp-manager vault sync v1"
+
+
+def seal_for_device(device_public_key: str, plaintext: bytes, associated_data: bytes) -> dict:
+    """
+    Encrypt plaintext to a device's X25519 public key with an ephemeral key pair.
+    The device derives the same AES-256-GCM key from its private key and ephemeral_public_key.
+    """
+    ephemeral = X25519PrivateKey.generate()
+    peer = X25519PublicKey.from_public_bytes(base64.b64decode(device_public_key))
+    key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=SYNC_HKDF_INFO).derive(ephemeral.exchange(peer))
+    nonce = os.urandom(12)
+    ciphertext = AESGCM(key).encrypt(nonce, plaintext, associated_data)
+    ephemeral_public = ephemeral.public_key().public_bytes(
+        encoding=serialization.Encoding.Raw, format=serialization.PublicFormat.Raw
+    )
+    return {
+        "scheme": SYNC_SCHEME,
+        "ephemeral_public_key": base64.b64encode(ephemeral_public).decode(),
+        "nonce": base64.b64encode(nonce).decode(),
+        "ciphertext": base64.b64encode(ciphertext).decode(),
+    }
+
+
+class VaultSyncService:
+    @staticmethod
+    async def register_device(api_key: ApiKey, public_key: str) -> Tuple[bool, Optional[str]]:
+        """
+        Register the device public key (base64 raw X25519) on an API key
+        Returns: (success, error_message)
+        """
+        try:
+            raw = base64.b64decode(public_key, validate=True)
+            X25519PublicKey.from_public_bytes(raw)
+        except (binascii.Error, ValueError):
+            return False, "Public key must be a base64-encoded 32-byte X25519 key."
+
+        async with async_session() as session:
+            await session.execute(
+                update(ApiKey)
+                .where(ApiKey.id == api_key.id)
+                .values(device_public_key=base64.b64encode(raw).decode(), device_registered_at=now_utc())
+            )
+            await session.commit()
+        return True, None
+
+    @staticmethod
+    async def unregister_device(api_key: ApiKey) -> bool:
+        async with async_session() as session:
+            result = await session.execute(
+                update(ApiKey)
+                .where(ApiKey.id == api_key.id, ApiKey.device_public_key.is_not(None))
+                .values(device_public_key=None, device_registered_at=None)
+            )
+            await session.commit()
+            return result.rowcount > 0
+
+    @staticmethod
+    async def sync(api_key: ApiKey, user: User, since: Optional[int]) -> dict:
+        """
+        Encrypted delta of the user's vault for the device behind api_key, on the same
+        cursor as the change feed; without a cursor the whole vault is sent, shared items
+        included. A cursor with no later changes returns no payload; None
+        means the cursor expired and the device must sync again without one.
+        """
+        changes = await TotpService.export_vault(user, since)
+        if changes is None:
+            return None
+        if not changes["full"] and not changes["items"] and not changes["shared"] and not changes["deleted"]:
+            return {"cursor": changes["cursor"], "changed": False}
+
+        cursor = changes.pop("cursor")
+        has_more = changes.pop("has_more")
+        plaintext = json.dumps(changes).encode("utf-8")
+        # The cursor is bound to the ciphertext so a payload cannot be replayed under another cursor
+        sealed = seal_for_device(api_key.device_public_key, plaintext, str(cursor).encode("ascii"))
+        return {"cursor": cursor, "changed": True, "has_more": has_more, **sealed}
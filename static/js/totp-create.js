@@ -3,6 +3,9 @@ document.addEventListener("DOMContentLoaded", () => {
   const secretInput  = document.getElementById("secret");
   const accountInput = document.getElementById("account");
   const issuerInput  = document.getElementById("issuer");
+  const algorithmInput = document.getElementById("algorithm");
+  const digitsInput    = document.getElementById("digits");
+  const periodInput    = document.getElementById("period");
   const MAX_FILE_SIZE = 5 * 1024 * 1024;
   function showFlash(message, category = "success") {
     const containerId = "toast-container";
@@ -73,6 +76,9 @@ document.addEventListener("DOMContentLoaded", () => {
       secretInput.value  = secret;
       issuerInput.value  = qrIssuer;
       accountInput.value = qrAccount;
+      if (algorithmInput) algorithmInput.value = (params.get("algorithm") || "SHA1").toUpperCase();
+      if (digitsInput)    digitsInput.value    = params.get("digits") || "6";
+      if (periodInput)    periodInput.value    = params.get("period") || "30";
 
       showFlash("Account, Issuer and secret auto‑filled from QR code!", "success");
 
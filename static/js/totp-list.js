@@ -36,11 +36,6 @@ const getItemId=it=>String(it.id??it.totp_id??it.totpId??it.tid??"");
 const getItemCode=it=>String(it.code??it.current_code??it.value??it.otp??it.token??"");
 function findCodeEl(row){return row.querySelector(".totp-code")||row.querySelector(".code-cell code")||row.querySelector("td:nth-child(3) code")||row.querySelector("code");}
 
-async function fetchTotpData(endpoint){
-  try{return normalizeList(await fetchJSON(endpoint));}
-  catch(err){console.error("Failed to fetch TOTP:",err);const table=endpoint.includes("shared")?"#shared-totp-table":"#totp-table";return [...$$(table+" tbody tr")].map(row=>({id:row.dataset.id,code:"Error"}));}
-}
-
 function updateCodes(data,tableSelector){
   const map=new Map(normalizeList(data).map(i=>[getItemId(i),getItemCode(i)]));
   $$(tableSelector+" tbody tr").forEach(row=>{
@@ -57,17 +52,39 @@ function isMyTabActive(){return !$("#my-codes").classList.contains("hidden");}
 function mobileSelectWrap(){const m=$("#select-all-mobile");return m?m.closest(".md\\:hidden"):null;}
 function toggleMobileSelectVisible(v){const wrap=mobileSelectWrap();if(!wrap)return;wrap.classList.toggle("hidden",!v);}
 
-let lastCycle=0,progressEls=null;
+const rowPeriod=row=>(parseInt(row?.dataset.period,10)||PERIOD/1000)*1000;
+let lastCycles=new Map(),progressEls=null,periods=null,streamLive=false;
+// Only the rows of the rendered page are refreshed
+const displayedIds=()=>$$("#totp-table tbody tr, #shared-totp-table tbody tr").map(row=>row.dataset.id).join(",");
+function startCodeStream(){
+  if(!window.EventSource)return;
+  const stream=new EventSource(`/totp/stream?ids=${displayedIds()}`);
+  stream.addEventListener("codes",e=>{
+    streamLive=true;
+    const d=JSON.parse(e.data);
+    updateCodes(d.items,"#totp-table");
+    updateCodes(d.shared,"#shared-totp-table");
+  });
+  // Fall back to polling while the stream reconnects or after it is closed for good
+  stream.onerror=()=>{streamLive=false;if(stream.readyState===EventSource.CLOSED)refreshCodes();};
+  window.addEventListener("beforeunload",()=>stream.close());
+}
 function refreshCodes(){
-  fetchTotpData("/totp/list-all").then(d=>updateCodes(d,"#totp-table"));
-  fetchTotpData("/totp/list-shared-with-me").then(d=>updateCodes(d,"#shared-totp-table"));
+  fetchJSON(`/totp/codes?ids=${displayedIds()}`)
+    .then(d=>{updateCodes(d.items,"#totp-table");updateCodes(d.shared,"#shared-totp-table");})
+    .catch(err=>{
+      console.error("Failed to fetch TOTP:",err);
+      ["#totp-table","#shared-totp-table"].forEach(t=>updateCodes($$(t+" tbody tr").map(row=>({id:row.dataset.id,code:"Error"})),t));
+    });
 }
 function animateProgress(){
   const now=Date.now();
-  const offset=FULL_DASH_ARRAY*((now%PERIOD)/PERIOD);
-  (progressEls||(progressEls=$$(".countdown-ring__progress"))).forEach(c=>{c.style.strokeDashoffset=offset;});
-  const currentCycle=Math.floor(now/PERIOD);
-  if(currentCycle!==lastCycle){lastCycle=currentCycle;refreshCodes();}
+  (progressEls||(progressEls=$$(".countdown-ring__progress").map(c=>[c,rowPeriod(c.closest("tr"))]))).forEach(([c,p])=>{c.style.strokeDashoffset=FULL_DASH_ARRAY*((now%p)/p);});
+  // Refresh only when a step of one of the displayed periods rolls over
+  if(!periods){periods=new Set(progressEls.map(([,p])=>p));if(!periods.size)periods.add(PERIOD);}
+  let rolled=false;
+  for(const p of periods){const cycle=Math.floor(now/p);if(lastCycles.get(p)!==cycle){lastCycles.set(p,cycle);rolled=true;}}
+  if(rolled&&!streamLive)refreshCodes();
   requestAnimationFrame(animateProgress);
 }
 
@@ -175,6 +192,7 @@ document.addEventListener("DOMContentLoaded",()=>{
   }
 
   refreshCodes();
+  startCodeStream();
   animateProgress();
 
   if(selectAllMobile)selectAllMobile.addEventListener("change",()=>{if(!isMyTabActive())return;if(selectAll){selectAll.checked=selectAllMobile.checked;selectAll.indeterminate=false;}applyToRows(selectAllMobile.checked);});
@@ -190,21 +208,15 @@ document.addEventListener("DOMContentLoaded",()=>{
     updateExportState();
   });
 
-  function normalize(s){return (s||"").toLowerCase();}
-  function filterTableRows(input,table,rowSelector,fields){
-    const filter=normalize(input.value);
-    table.querySelectorAll(rowSelector).forEach(row=>{
-      let text="";
-      for(const sel of fields){const el=row.querySelector(sel);if(el)text+=" "+el.textContent;}
-      row.style.display=normalize(text).includes(filter)?"":"none";
-    });
-    syncSelectAllFromRows();
-    updateExportState();
-  }
   function debounce(fn,ms){let t;return (...a)=>{clearTimeout(t);t=setTimeout(()=>fn(...a),ms);};}
-
-  if(mySearch)mySearch.addEventListener("input",debounce(()=>{filterTableRows(mySearch,totpTable,"tbody > tr",['[data-field="account"]','[data-field="issuer"]',".totp-code"]);},150));
-  if(sharedSearch)sharedSearch.addEventListener("input",debounce(()=>{filterTableRows(sharedSearch,sharedTable,"tbody > tr",['[data-field="account"]','[data-field="issuer"]','[data-field="owner"]',".totp-code"]);},150));
+  // Search runs on the server (prefix match on issuer and account), the form reloads the first page
+  function bindSearch(input){
+    if(!input)return;
+    if(document.activeElement===input){const end=input.value.length;input.setSelectionRange(end,end);}
+    input.addEventListener("input",debounce(()=>input.form.requestSubmit(),400));
+  }
+  bindSearch(mySearch);
+  bindSearch(sharedSearch);
 
   const tabs={"my-codes-tab":"my-codes","shared-with-me-tab":"shared-with-me"};
   for(const [tabId,contentId] of Object.entries(tabs)){
@@ -222,6 +234,11 @@ document.addEventListener("DOMContentLoaded",()=>{
       updateExportState();
     });
   }
+  // Pagination and search links come back to the tab they were used on
+  if($("#totp-lists")?.dataset.activeTab==="shared"){
+    $("#shared-with-me-tab").click();
+    if(sharedSearch?.value){sharedSearch.focus();const end=sharedSearch.value.length;sharedSearch.setSelectionRange(end,end);}
+  }
   toggleMobileSelectVisible(isMyTabActive());
 
   if(exportBtn&&exportForm){
@@ -266,6 +283,26 @@ document.addEventListener("DOMContentLoaded",()=>{
   });
 
   $("#share-cancel")?.addEventListener("click",()=>hide($("#share-modal")));
+
+  // Recipient suggestions for the email being typed after the last comma
+  const shareEmail=$("#share-email");
+  const emailSuggestions=$("#share-email-suggestions");
+  if(shareEmail&&emailSuggestions)shareEmail.addEventListener("input",debounce(async()=>{
+    const value=shareEmail.value;
+    const cut=value.lastIndexOf(",")+1;
+    const head=value.slice(0,cut);
+    const fragment=value.slice(cut).trim();
+    emailSuggestions.innerHTML="";
+    if(!fragment)return;
+    try{
+      const data=await fetchJSON(`/totp/recipients?q=${encodeURIComponent(fragment)}`);
+      for(const email of data.emails){
+        const option=document.createElement("option");
+        option.value=head?`${head} ${email}`:email;
+        emailSuggestions.appendChild(option);
+      }
+    }catch{}
+  },150));
   $("#shared-users-cancel")?.addEventListener("click",()=>hide($("#shared-users-modal")));
 
   document.addEventListener("click",e=>{
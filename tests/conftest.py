@@ -0,0 +1,14 @@
+"""
+Test settings: a temporary SQLite database and throwaway keys, set before the app
+modules read them. The tests need pytest and aiosqlite:
+    python -m pytest tests
+"""
+import os
+import tempfile
+
+from cryptography.fernet import Fernet
+
+_db_dir = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_dir}/test.db")
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
@@ -0,0 +1,68 @@
+"""
+A member who leaves or is removed from a group takes their own items along:
+the remaining members stop seeing them and the group no longer lists them.
+
+Runs on the temporary SQLite database set up in conftest.py.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from config import Base, async_session, engine, master_fernet  # noqa: E402
+from models import User  # noqa: E402
+from services.group_service import GroupService  # noqa: E402
+from services.totp_service import TotpService  # noqa: E402
+from utils import generate_fernet_key  # noqa: E402
+
+SECRET = "JBSWY3DPEHPK3PXP"
+
+
+async def _make_user(email: str) -> User:
+    async with async_session() as session:
+        user = User(email=email, hashed_password="-", is_verified=True,
+                    encrypted_dek=master_fernet.encrypt(generate_fernet_key()).decode())
+        session.add(user)
+        await session.commit()
+        return user
+
+
+async def _shared_accounts(user: User) -> set[str]:
+    return {entry["account"] for entry in await TotpService.list_shared_with_me(user, include_codes=False)}
+
+
+@pytest.mark.parametrize("leaves", [True, False])
+def test_removed_member_takes_their_items_along(leaves):
+    async def run():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        try:
+            suffix = "leaves" if leaves else "removed"
+            owner = await _make_user(f"group-owner-{suffix}@example.com")
+            member = await _make_user(f"group-member-{suffix}@example.com")
+            other = await _make_user(f"group-other-{suffix}@example.com")
+            group = await GroupService.create_group("team", owner)
+            await GroupService.add_members(group.id, [member.email, other.email], owner)
+            owners_item = await TotpService.create("owners", "issuer", SECRET, owner)
+            members_item = await TotpService.create("members", "issuer", SECRET, member)
+            await GroupService.share_items(group.id, [owners_item.id], owner)
+            await GroupService.share_items(group.id, [members_item.id], member)
+            before = await _shared_accounts(other)
+
+            success, _ = await GroupService.remove_member(group.id, member.email, member if leaves else owner)
+            after = await _shared_accounts(other)
+            member_sees = await _shared_accounts(member)
+            # Sharing the item with the group again works once the member rejoins
+            await GroupService.add_members(group.id, [member.email], owner)
+            reshared, _ = await GroupService.share_items(group.id, [members_item.id], member)
+        finally:
+            await engine.dispose()
+        return success, before, after, member_sees, reshared
+
+    success, before, after, member_sees, reshared = asyncio.run(run())
+    assert success
+    assert before == {"owners", "members"}
+    assert after == {"owners"}
+    assert member_sees == set()
+    assert reshared == 1
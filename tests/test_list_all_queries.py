@@ -0,0 +1,77 @@
+"""
+Query-count regression test for TotpService.list_all: the listing and its share
+counts must take a constant number of statements, whatever the vault size.
+
+Runs on the temporary SQLite database set up in conftest.py.
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import event  # noqa: E402
+from config import Base, async_session, engine, master_fernet  # noqa: E402
+from models import User  # noqa: E402
+from services.totp_service import TotpService  # noqa: E402
+from utils import generate_fernet_key  # noqa: E402
+
+SECRET = "JBSWY3DPEHPK3PXP"
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(engine.sync_engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine.sync_engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+async def _make_user(email: str) -> User:
+    async with async_session() as session:
+        user = User(email=email, hashed_password="-", is_verified=True,
+                    encrypted_dek=master_fernet.encrypt(generate_fernet_key()).decode())
+        session.add(user)
+        await session.commit()
+        return user
+
+
+async def _list_all_queries(items: int) -> tuple[int, int]:
+    """Statements run by list_all for an owner with `items` items, half of them shared"""
+    owner = await _make_user(f"owner{items}@example.com")
+    recipient = await _make_user(f"recipient{items}@example.com")
+    for i in range(items):
+        item = await TotpService.create(f"account{i}", "issuer", SECRET, owner)
+        if i % 2 == 0:
+            await TotpService.share_totp([item.id], recipient.email, owner)
+
+    counts = []
+    for include_codes in (True, False):
+        with QueryCounter() as counter:
+            listing = await TotpService.list_all(owner, include_codes=include_codes)
+        assert len(listing) == items
+        assert sum(entry["is_shared"] for entry in listing) == (items + 1) // 2
+        counts.append(counter.count)
+    return counts[0], counts[1]
+
+
+def test_list_all_query_count_does_not_grow_with_items():
+    async def run():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        try:
+            small = await _list_all_queries(2)
+            large = await _list_all_queries(40)
+        finally:
+            await engine.dispose()
+        return small, large
+
+    small, large = asyncio.run(run())
+    assert small == large == (1, 1)
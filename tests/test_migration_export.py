@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("qrcode")
+
+from services.import_export import build_migration_uri  # noqa: E402
+
+
+def _item(account, period=30):
+    return {"account": account, "issuer": "iss", "secret": "JBSWY3DPEHPK3PXP",
+            "algorithm": "SHA1", "digits": 6, "period": period}
+
+
+def test_single_item_keeps_its_period():
+    assert "period=60" in build_migration_uri([_item("a", 60)])
+
+
+def test_multi_item_export_rejects_non_default_period():
+    assert build_migration_uri([_item("a"), _item("b")]).startswith("otpauth-migration://")
+    with pytest.raises(ValueError, match="iss:b"):
+        build_migration_uri([_item("a"), _item("b", 15)])
@@ -0,0 +1,69 @@
+"""
+An item whose wrapped key cannot be unwrapped shows "Error" on its own; the rest
+of the listing, the shared listing and the boundary warm-up are unaffected.
+
+Runs on the temporary SQLite database set up in conftest.py.
+"""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from cryptography.fernet import Fernet  # noqa: E402
+from sqlalchemy import update  # noqa: E402
+from config import Base, async_session, engine, master_fernet  # noqa: E402
+from models import TOTPItem, User  # noqa: E402
+from services.code_cache import code_cache  # noqa: E402
+from services.item_keys import item_key_cache  # noqa: E402
+from services.totp_service import TotpService  # noqa: E402
+from utils import generate_fernet_key  # noqa: E402
+
+SECRET = "JBSWY3DPEHPK3PXP"
+
+
+async def _make_user(email: str) -> User:
+    async with async_session() as session:
+        user = User(email=email, hashed_password="-", is_verified=True,
+                    encrypted_dek=master_fernet.encrypt(generate_fernet_key()).decode())
+        session.add(user)
+        await session.commit()
+        return user
+
+
+def test_corrupted_item_key_fails_only_that_item():
+    async def run():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        try:
+            owner = await _make_user("unreadable-owner@example.com")
+            recipient = await _make_user("unreadable-recipient@example.com")
+            good = await TotpService.create("good", "issuer", SECRET, owner)
+            bad = await TotpService.create("bad", "issuer", SECRET, owner)
+            await TotpService.share_totp([good.id, bad.id], recipient.email, owner)
+            # Wrapped with a key nobody holds
+            async with async_session() as session:
+                await session.execute(
+                    update(TOTPItem).where(TOTPItem.id == bad.id)
+                    .values(encrypted_item_key=Fernet(Fernet.generate_key()).encrypt(b"x" * 32).decode())
+                )
+                await session.commit()
+            code_cache.clear()
+            item_key_cache.clear()
+
+            owned = {entry["account"]: entry["code"] for entry in await TotpService.list_all(owner)}
+            codes = {entry["id"]: entry["code"] for entry in (await TotpService.list_codes(owner))["items"]}
+            # The recipient's share still holds the original item key and stays readable
+            shared = {entry["account"]: entry["code"] for entry in await TotpService.list_shared_with_me(recipient)}
+            code_cache.clear()
+            warmed = await TotpService.precompute_codes([owner, recipient], 30 * (int(time.time()) // 30 + 1))
+        finally:
+            await engine.dispose()
+        return owned, codes, shared, warmed, good.id, bad.id
+
+    owned, codes, shared, warmed, good_id, bad_id = asyncio.run(run())
+    assert owned["bad"] == "Error" and owned["good"].isdigit()
+    assert codes[bad_id] == "Error" and codes[good_id].isdigit()
+    assert shared["good"].isdigit() and shared["bad"].isdigit()
+    assert warmed == 2
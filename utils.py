@@ -30,3 +30,12 @@ def sanitize_input(text: str, max_length: Optional[int] = None) -> str:
         text = text[:max_length]
     
     return text
+
+
+def unique_emails(emails: list[str]) -> list[str]:
+    """Strip blanks and drop addresses repeated in another letter case, keeping the first spelling"""
+    unique = {}
+    for email in emails:
+        if email and email.strip():
+            unique.setdefault(email.strip().lower(), email.strip())
+    return list(unique.values())